@@ -0,0 +1,36 @@
+import os
+
+# Caches of provider results and renders shared by all jobs of this
+# instance (and by render workers mounting the same volume). See
+# helpers/disk_cache.py; a quota of 0 disables a cache.
+CACHE_ROOT = os.getenv("CACHE_ROOT", "video_creation/assets/cache")
+
+# Decoded audio of single narration paragraphs (modules/gen_audio.py)
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+# Accepted story and script completions (modules/gen_story.py,
+# modules/gen_script.py); callers wanting a new variation pass fresh=True
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024**2)))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Leonardo images by prompt, model and size (modules/gen_image.py); pinned
+# images (POST /image-cache/pins) are never evicted
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(5 * 1024**3)))
+
+# Ken Burns clips by image content and motion parameters
+# (video_creation/image_processing.py)
+CLIP_CACHE_MAX_BYTES = int(os.getenv("CLIP_CACHE_MAX_BYTES", str(5 * 1024**3)))
+
+# Rasterized subtitle words (video_creation/word_sprites.py), on disk and
+# decoded in the memory of every rendering process
+SPRITE_CACHE_MAX_BYTES = int(os.getenv("SPRITE_CACHE_MAX_BYTES", str(512 * 1024**2)))
+SPRITE_MEMORY_MAX_BYTES = int(os.getenv("SPRITE_MEMORY_MAX_BYTES", str(32 * 1024**2)))
+
+# Background music tracks prepared for mixing, per track and length
+# (video_creation/video_processing.py)
+BGM_CACHE_MAX_BYTES = int(os.getenv("BGM_CACHE_MAX_BYTES", str(1024**3)))
+
+# Stage outputs of earlier jobs, reused by jobs with the same inputs
+# (services/artifact_cache.py); least recently used entries are evicted
+ARTIFACT_CACHE_DIR = os.path.join(CACHE_ROOT, "artifacts")
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(10 * 1024**3)))
@@ -11,6 +11,7 @@ def setup_logging():
     - Logs to a file in the logs directory
     - Uses RotatingFileHandler to manage log file size
     - Sets up logging format with timestamp, log level, and message
+    - Uses the level from LOG_LEVEL (default INFO, so stage timings show)
     """
     # Ensure logs directory exists
     logs_dir = "logs"
@@ -20,8 +21,10 @@ def setup_logging():
     log_file = os.path.join(logs_dir, "application.log")
 
     # Configure the root logger
+    # force: modules that configured logging on import don't win
     logging.basicConfig(
-        level=logging.WARN,
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        force=True,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         handlers=[
             # File handler with log rotation
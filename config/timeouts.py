@@ -0,0 +1,10 @@
+import os
+
+# Timeouts (in seconds) of single calls to external services. Calls made
+# for a job are also cut to the time left in their stage's budget (see
+# services/budget.py and CancelToken.timeout).
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "90"))
+ELEVENLABS_TIMEOUT_SECONDS = float(os.getenv("ELEVENLABS_TIMEOUT_SECONDS", "60"))
+LEONARDO_TIMEOUT_SECONDS = float(os.getenv("LEONARDO_TIMEOUT_SECONDS", "30"))
+S3_CONNECT_TIMEOUT_SECONDS = float(os.getenv("S3_CONNECT_TIMEOUT_SECONDS", "10"))
+S3_READ_TIMEOUT_SECONDS = float(os.getenv("S3_READ_TIMEOUT_SECONDS", "60"))
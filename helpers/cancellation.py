@@ -0,0 +1,291 @@
+import contextlib
+import os
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+from config.logger import get_logger
+from helpers.progress import SpeedReporter
+
+logger = get_logger(__name__)
+
+# Seconds ffmpeg gets to exit after SIGTERM before the group is killed
+KILL_GRACE_SECONDS = 5
+
+
+class JobCancelled(Exception):
+    """Raised inside a stage when its job was cancelled."""
+
+
+class BudgetExceeded(TimeoutError):
+    """Raised when a stage (or the whole job) runs out of its time budget."""
+
+
+class CancelToken:
+    """
+    Cancellation flag for one job that is visible everywhere the job's work
+    runs: in this process, in clip-rendering pool processes and on render
+    workers sharing the job volume.
+
+    The flag is a marker file in the job workspace; a workspace that has
+    already been removed also counts as cancelled, since nothing may write
+    into it anymore. Child processes started through `run_process` in this
+    process are killed right away on `cancel`; others notice the marker
+    within a poll interval.
+
+    A token scoped to one stage (`with_deadline`) also expires at the
+    stage's deadline: work checking it then stops with BudgetExceeded, and
+    `timeout` caps HTTP timeouts to the time that is left.
+    """
+
+    MARKER = "CANCELLED"
+
+    # Live process groups per workspace, for this process only
+    _processes: Dict[str, Set[subprocess.Popen]] = {}
+    # Workspaces of jobs handed off to another instance by this process
+    _interrupted: Set[str] = set()
+    _lock = threading.Lock()
+
+    def __init__(
+        self, work_dir: str, deadline: Optional[float] = None, scope: str = "Job"
+    ):
+        self.work_dir = work_dir
+        self.deadline = deadline  # absolute timestamp
+        self.scope = scope  # what the deadline belongs to, for errors
+
+    def with_deadline(self, deadline: float, scope: str) -> "CancelToken":
+        """Token for the same job that also expires at `deadline`."""
+        if self.deadline is not None and self.deadline < deadline:
+            deadline, scope = self.deadline, self.scope
+        return CancelToken(self.work_dir, deadline, scope)
+
+    @property
+    def cancelled(self) -> bool:
+        return (
+            self.work_dir in self._interrupted
+            or not os.path.isdir(self.work_dir)
+            or os.path.exists(os.path.join(self.work_dir, self.MARKER))
+        )
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0.0)
+
+    def timeout(self, default: float) -> float:
+        """Timeout for one blocking call: `default`, capped by the deadline."""
+        self.raise_if_cancelled()
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(f"Job in {self.work_dir} was cancelled")
+        if self.expired:
+            raise BudgetExceeded(f"{self.scope} exceeded its time budget")
+
+    def cancel(self):
+        if os.path.isdir(self.work_dir):
+            open(os.path.join(self.work_dir, self.MARKER), "w").close()
+        self._terminate_processes()
+
+    def interrupt(self):
+        """
+        Stop the job's work in this process only, leaving the workspace
+        (and the job) intact for another instance to resume.
+        """
+        with self._lock:
+            self._interrupted.add(self.work_dir)
+        self._terminate_processes()
+
+    def _terminate_processes(self):
+        with self._lock:
+            processes = list(self._processes.get(self.work_dir, ()))
+        # Only signal here (this may run on the event loop); the thread
+        # running each process escalates to SIGKILL if needed
+        for process in processes:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def register(self, process: subprocess.Popen):
+        with self._lock:
+            self._processes.setdefault(self.work_dir, set()).add(process)
+
+    def unregister(self, process: subprocess.Popen):
+        with self._lock:
+            processes = self._processes.get(self.work_dir, set())
+            processes.discard(process)
+            if not processes:
+                self._processes.pop(self.work_dir, None)
+
+
+def call_timeout(cancel: Optional[CancelToken], default: float) -> float:
+    """Timeout for one blocking call of a job's work (`default` without a token)."""
+    return cancel.timeout(default) if cancel else default
+
+
+def kill_process_group(process: subprocess.Popen):
+    """Terminate a process started with start_new_session, with its children."""
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+    except ProcessLookupError:
+        pass
+    logger.info(f"Killed process group {process.pid}")
+
+
+def run_process(
+    command,
+    cancel: CancelToken = None,
+    shell: bool = False,
+    check: bool = False,
+    capture_output: bool = False,
+    text: bool = False,
+    poll_interval: float = 0.5,
+    on_speed=None,
+) -> subprocess.CompletedProcess:
+    """
+    `subprocess.run` that can be cancelled: the command runs in its own
+    process group (so `sh -c ffmpeg ...` and everything it spawns can be
+    killed together), and is killed as soon as `cancel` is set or its
+    deadline passes.
+    `on_speed(speed)` receives ffmpeg's encode speed while it runs.
+    """
+    process = subprocess.Popen(
+        command,
+        shell=shell,
+        stdout=subprocess.PIPE if capture_output else None,
+        stderr=subprocess.PIPE if capture_output or on_speed else None,
+        start_new_session=True,
+    )
+    # Pipes are drained by threads so ffmpeg's stats can be parsed live
+    output = {"stdout": [], "stderr": []}
+    speed = SpeedReporter(on_speed) if on_speed else None
+    readers = [
+        threading.Thread(
+            target=_read_stream,
+            args=(stream, output[name], speed if name == "stderr" else None),
+            daemon=True,
+        )
+        for name, stream in (("stdout", process.stdout), ("stderr", process.stderr))
+        if stream
+    ]
+    for reader in readers:
+        reader.start()
+    if cancel:
+        cancel.register(process)
+    try:
+        while True:
+            try:
+                process.wait(timeout=poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel and (cancel.cancelled or cancel.expired):
+                    kill_process_group(process)
+                    cancel.raise_if_cancelled()
+    except BaseException:
+        kill_process_group(process)
+        raise
+    finally:
+        if cancel:
+            cancel.unregister(process)
+        for reader in readers:
+            reader.join()
+
+    # Killed by CancelToken.cancel before the poll noticed
+    if cancel and cancel.cancelled:
+        raise JobCancelled(f"Cancelled: {command}")
+
+    stdout, stderr = (
+        _decode(b"".join(output[name]), text) if capture_output else None
+        for name in ("stdout", "stderr")
+    )
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, command, stdout, stderr
+        )
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def _read_stream(stream, chunks: list, speed: SpeedReporter = None):
+    with stream:
+        for chunk in iter(lambda: stream.read1(65536), b""):
+            chunks.append(chunk)
+            if speed:
+                speed.feed(chunk)
+
+
+def _decode(data: bytes, text: bool):
+    return data.decode(errors="replace") if text else data
+
+
+@contextlib.contextmanager
+def atomic_output(path: str):
+    """
+    Temporary path to write `path` through, next to it and with the same
+    extension (so ffmpeg picks the same muxer). It replaces `path` only
+    once the block finished; a write that is killed (cancel, budget or
+    hand-off) or fails leaves no file at `path` for a re-run stage to take
+    as done. An existing `path` is removed first, for the same reason.
+    """
+    if os.path.lexists(path):
+        os.remove(path)
+    root, extension = os.path.splitext(path)
+    partial = f"{root}.{uuid.uuid4().hex}.part{extension}"
+    try:
+        yield partial
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def cancellable_logger(
+    cancel: CancelToken = None,
+    on_speed=None,
+    fps: float = 24,
+    check_interval: float = 1.0,
+):
+    """
+    proglog logger for moviepy's write_videofile that aborts the write
+    (by raising JobCancelled from the progress callback) once cancelled,
+    and passes the encode speed (`fps` is the output frame rate) to
+    `on_speed`.
+    """
+    from proglog import ProgressBarLogger
+
+    class CancellableLogger(ProgressBarLogger):
+        def __init__(self):
+            super().__init__()
+            self._last_check = 0.0
+            self._start_time = time.time()
+            self._speed = SpeedReporter(on_speed) if on_speed else None
+
+        def bars_callback(self, bar, attr, value, old_value=None):
+            now = time.time()
+            if now - self._last_check >= check_interval:
+                self._last_check = now
+                if cancel:
+                    cancel.raise_if_cancelled()
+            # Frame index of the video bar
+            elapsed = now - self._start_time
+            if self._speed and bar == "t" and attr == "index" and elapsed > 0:
+                self._speed.report(value / fps / elapsed)
+
+    return CancellableLogger()
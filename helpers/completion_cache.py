@@ -0,0 +1,31 @@
+import re
+from typing import List, Optional
+
+from config.caches import LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SECONDS
+from helpers.disk_cache import DiskCache
+
+completion_cache = DiskCache(
+    "completions", LLM_CACHE_MAX_BYTES, suffix=".txt", ttl=LLM_CACHE_TTL_SECONDS
+)
+
+
+def completion_key(model: str, messages: List[dict], duration: int) -> str:
+    """Key of a chat completion; whitespace in the prompts doesn't matter."""
+    normalized = [
+        {**message, "content": re.sub(r"\s+", " ", message["content"]).strip()}
+        for message in messages
+    ]
+    return DiskCache.key(model, normalized, duration)
+
+
+def cached_completion(key: str) -> Optional[str]:
+    path = completion_cache.get(key)
+    if not path:
+        return None
+    with open(path, "r") as f:
+        return f.read()
+
+
+def store_completion(key: str, content: str):
+    """Only store completions that passed the caller's checks: hits are used as is."""
+    completion_cache.put_bytes(key, content.encode())
@@ -0,0 +1,220 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from config.caches import CACHE_ROOT
+from config.logger import get_logger
+
+logger = get_logger(__name__)
+
+PIN_SUFFIX = ".pin"
+
+
+@functools.lru_cache(maxsize=4096)
+def _digest(path: str, size: int, mtime_ns: int) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content, remembered until the file changes."""
+    stat = os.stat(path)
+    return _digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def link_or_copy(source: str, target: str, link: bool = True):
+    """
+    Put `source` at `target`, replacing whatever is there: hard linked
+    (unless `link` is False) where the filesystem allows, else copied. A
+    linked target shares its content with the source, so it must only ever
+    be replaced (see helpers.cancellation.atomic_output), never rewritten.
+    """
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    if os.path.lexists(target):
+        os.remove(target)
+    if link:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass  # another filesystem (e.g. the jobs volume), or no hard links
+    shutil.copyfile(source, target)
+
+
+class DiskCache:
+    """
+    Files keyed by a hash of what produced them, in CACHE_ROOT/<name>.
+
+    An entry's mtime is when it was stored (for `ttl`) and its atime when it
+    was last used, set explicitly on every hit so it also works on noatime
+    mounts. Beyond `max_bytes` the least recently used entries are evicted,
+    except pinned ones. Entries are written to a temporary file and renamed,
+    so processes sharing the directory never see partial files.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        suffix: str = "",
+        ttl: Optional[float] = None,
+        root: str = CACHE_ROOT,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.ttl = ttl
+        self.root = os.path.join(root, name)
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None  # bytes on disk, counted on first store
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        encoded = json.dumps(parts, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the entry stored under `key`, or None on a miss."""
+        return self.get_any([key])
+
+    def get_any(self, keys) -> Optional[str]:
+        """Path of the first entry stored under one of `keys` (one lookup)."""
+        if not self.enabled:
+            return None
+        for key in keys:
+            path = self.path(key)
+            try:
+                stored_at = os.stat(path).st_mtime
+                if self.ttl is not None and time.time() - stored_at >= self.ttl:
+                    self._remove(path)
+                    continue
+                os.utime(path, (time.time(), stored_at))
+            except FileNotFoundError:
+                continue
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def put_bytes(self, key: str, data: bytes) -> Optional[str]:
+        def write(target):
+            with open(target, "wb") as f:
+                f.write(data)
+
+        return self._store(key, write)
+
+    def put_file(self, key: str, source: str) -> Optional[str]:
+        """Store a copy of `source` (hard linked where possible)."""
+        return self._store(key, lambda target: link_or_copy(source, target))
+
+    def _store(self, key: str, write) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write(partial)
+            now = time.time()
+            os.utime(partial, (now, now))  # a hard link keeps the source's times
+            size = os.path.getsize(partial)
+            os.replace(partial, path)
+        except OSError as e:
+            logger.warning(f"Could not store {self.name} cache entry: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+            return None
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def pin(self, key: str):
+        """Keep the entry under `key` through eviction (until unpinned)."""
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        open(self.path(key) + PIN_SUFFIX, "a").close()
+
+    def unpin(self, key: str):
+        try:
+            os.remove(self.path(key) + PIN_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(PIN_SUFFIX) or name.endswith(".part"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    pass
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def evict(self):
+        """Remove least recently used (and expired) entries beyond the quota."""
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_atime)
+        total = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            expired = self.ttl is not None and now - stat.st_mtime >= self.ttl
+            if total <= self.max_bytes and not expired:
+                continue
+            if os.path.exists(path + PIN_SUFFIX):
+                continue
+            self._remove(path)
+            total -= stat.st_size
+        with self._lock:
+            self._size = total
+        logger.info(f"Evicted {self.name} cache down to {total} bytes")
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# name -> cache, for the report on GET /metrics
+caches: Dict[str, DiskCache] = {}
+
+
+def cache_stats() -> Dict[str, dict]:
+    return {name: cache.stats() for name, cache in caches.items()}
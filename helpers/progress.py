@@ -0,0 +1,125 @@
+import functools
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+from config.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Minimum seconds between two encode-speed events of the same render
+SPEED_REPORT_INTERVAL = 1.0
+
+# "... time=00:00:04.00 bitrate= 524.3kbits/s speed=1.33x" on ffmpeg's stderr
+FFMPEG_SPEED = re.compile(rb"speed=\s*([\d.]+)x")
+
+
+class ProgressLog:
+    """
+    Progress events of one job, appended as JSON lines to a file in the job
+    workspace. Like the cancel marker (helpers/cancellation.py) it is
+    visible everywhere the job's work runs, so threads, clip-rendering pool
+    processes and render workers all report into the same log, which
+    GET /jobs/{id}/events streams to clients.
+
+    Every event has the stage it belongs to (a pipeline stage, or "job",
+    "transcription" and "upload") and what happened:
+
+    - "start" / "end" (with `duration`, in seconds) / "error"
+    - "progress": `step` `done` of `total`, e.g. TTS paragraph 3/9
+    - "encode": current ffmpeg or moviepy encode `speed` (x realtime)
+    """
+
+    FILE = "progress.jsonl"
+
+    def __init__(self, work_dir: str):
+        self.work_dir = work_dir
+        self.path = os.path.join(work_dir, self.FILE)
+
+    def emit(self, stage: str, event: str, **data):
+        record = {"time": round(time.time(), 3), "stage": stage, "event": event}
+        record.update(data)
+        try:
+            # Lines are small enough for appends from several processes
+            # not to interleave
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except FileNotFoundError:
+            pass  # the workspace was already removed
+
+    @contextmanager
+    def timed(self, stage: str, **data):
+        """Emit "start", then "end" with the duration (or "error")."""
+        start_time = time.time()
+        self.emit(stage, "start", **data)
+        try:
+            yield
+        except BaseException as e:
+            self.emit(stage, "error", error=str(e) or type(e).__name__, **data)
+            raise
+        self.emit(stage, "end", duration=round(time.time() - start_time, 3), **data)
+
+    def step(self, stage: str, step: str, done: int, total: Optional[int], **data):
+        self.emit(stage, "progress", step=step, done=done, total=total, **data)
+
+    def speed_callback(self, stage: str, **data):
+        """Picklable `on_speed(speed)` callback for run_process and moviepy."""
+        return functools.partial(self._speed, stage, data)
+
+    def _speed(self, stage: str, data: dict, speed: float):
+        self.emit(stage, "encode", speed=round(speed, 2), **data)
+
+    def step_callback(self, stage: str, step: str):
+        """Picklable `on_step(done, total)` callback."""
+        return functools.partial(self.step, stage, step)
+
+
+def read_events(stream) -> List[dict]:
+    """
+    Complete events written since the last read to a progress log opened
+    with open(path, "rb"). The open file stays readable after the job's
+    workspace is removed, so a reader never misses the final events.
+    """
+    events = []
+    while True:
+        position = stream.tell()
+        line = stream.readline()
+        if not line.endswith(b"\n"):
+            # Nothing new, or a line still being written: read it next time
+            stream.seek(position)
+            return events
+        events.append(json.loads(line))
+
+
+class SpeedReporter:
+    """
+    Parses ffmpeg's stderr as it is written and passes the encode speed to
+    `on_speed` at most once per SPEED_REPORT_INTERVAL.
+    """
+
+    def __init__(self, on_speed):
+        self.on_speed = on_speed
+        self._last_report = 0.0
+        self._pending = b""
+
+    def feed(self, chunk: bytes):
+        # Stats lines end in \r, so split on both line endings
+        lines = re.split(rb"[\r\n]", self._pending + chunk)
+        self._pending = lines.pop()
+        for line in lines:
+            match = FFMPEG_SPEED.search(line)
+            if match:
+                self.report(float(match.group(1)))
+
+    def report(self, speed: float):
+        now = time.time()
+        if now - self._last_report >= SPEED_REPORT_INTERVAL:
+            self._last_report = now
+            try:
+                self.on_speed(speed)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+
@@ -0,0 +1,65 @@
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+# Seconds of recent calls the error rates are computed over
+PROVIDER_STATS_WINDOW = float(os.getenv("PROVIDER_STATS_WINDOW", "300"))
+
+
+class ProviderStats:
+    """
+    Outcomes of recent calls to external providers (OpenAI, ElevenLabs,
+    Leonardo, S3) made by this process, for the error rates reported by
+    GET /metrics. Calls are recorded from threads and the event loop alike.
+    """
+
+    def __init__(self, window: float = PROVIDER_STATS_WINDOW):
+        self.window = window
+        self._calls: Dict[str, deque] = {}  # provider -> (time, ok)
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, ok: bool):
+        with self._lock:
+            self._calls.setdefault(provider, deque()).append((time.time(), ok))
+
+    @contextmanager
+    def track(self, provider: str):
+        """Record the call made in the block; an exception counts as an error."""
+        try:
+            yield
+        except Exception:
+            self.record(provider, False)
+            raise
+        self.record(provider, True)
+
+    def tracked(self, provider: str, func):
+        """`func` with every call recorded, e.g. for asyncio.to_thread."""
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            with self.track(provider):
+                return func(*args, **kwargs)
+
+        return call
+
+    def stats(self) -> Dict[str, dict]:
+        since = time.time() - self.window
+        result = {}
+        with self._lock:
+            for provider, calls in self._calls.items():
+                while calls and calls[0][0] < since:
+                    calls.popleft()
+                errors = sum(1 for _, ok in calls if not ok)
+                result[provider] = {
+                    "calls": len(calls),
+                    "errors": errors,
+                    "error_rate": round(errors / len(calls), 3) if calls else 0.0,
+                }
+        return result
+
+
+provider_stats = ProviderStats()
@@ -1,4 +1,7 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+import asyncio
+import signal
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from config.logger import get_logger, setup_logging
@@ -7,7 +10,55 @@ from config.logger import log_time_taken
 setup_logging()
 logger = get_logger(__name__)
 
-app = FastAPI()
+from services.fair_share import QuotaExceeded
+from services.capacity import saturation
+from services.job_manager import ServerBusy, job_manager
+
+# New jobs are refused with ServerBusy while the instance is saturated
+job_manager.saturation = saturation
+
+
+def drain_on_sigterm():
+    """
+    Drain the job manager before the server stops: on SIGTERM, /ready
+    reports "draining" and new jobs are refused while running jobs get
+    their grace period; only then is the server's own handler called. A
+    second SIGTERM stops the server right away.
+    """
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def shut_down(signum, frame):
+        signal.signal(signal.SIGTERM, previous)
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            signal.raise_signal(signum)
+
+    def handle(signum, frame):
+        logger.warning("SIGTERM received, draining jobs before shutdown")
+        signal.signal(signal.SIGTERM, shut_down)
+
+        def start_drain():
+            task = loop.create_task(job_manager.drain())
+            task.add_done_callback(lambda _: shut_down(signum, frame))
+
+        loop.call_soon_threadsafe(start_drain)
+
+    signal.signal(signal.SIGTERM, handle)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the video generation worker pool
+    await job_manager.start()
+    drain_on_sigterm()
+    yield
+    # Already drained if the shutdown came from SIGTERM
+    await job_manager.drain()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:*",
@@ -23,13 +74,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(QuotaExceeded)
+async def handle_quota_exceeded(request: Request, exc: QuotaExceeded):
+    headers = {}
+    if exc.retry_after is not None:
+        headers["Retry-After"] = str(max(int(exc.retry_after) + 1, 1))
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers=headers)
+
+
+# New jobs while draining or saturated; status, progress, cancellation and
+# requests coalesced into existing jobs still work
+@app.exception_handler(ServerBusy)
+async def handle_server_busy(request: Request, exc: ServerBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
 from routes import (
     health_check,
     generate_video,
     gen_script,
     upload_vid_gen,
     audio_to_vid,
-   generate_reddit_video 
+   generate_reddit_video,
+    jobs,
+    campaigns,
+    videos,
+    images,
 )
 
 app.include_router(health_check.router, prefix="")
@@ -37,4 +111,8 @@ app.include_router(generate_video.router,prefix="")
 app.include_router(gen_script.router,prefix="")
 app.include_router(upload_vid_gen.router,prefix="")
 app.include_router(audio_to_vid.router,prefix="")
-app.include_router(generate_reddit_video.router,prefix="")
\ No newline at end of file
+app.include_router(generate_reddit_video.router,prefix="")
+app.include_router(jobs.router,prefix="")
+app.include_router(campaigns.router,prefix="")
+app.include_router(videos.router,prefix="")
+app.include_router(images.router,prefix="")
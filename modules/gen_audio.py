@@ -6,6 +6,12 @@ import io
 import logging
 from typing import Optional, Dict, List, Tuple
 
+from config.caches import TTS_CACHE_MAX_BYTES
+from config.timeouts import ELEVENLABS_TIMEOUT_SECONDS
+from helpers.cancellation import call_timeout
+from helpers.disk_cache import DiskCache
+from helpers.provider_stats import provider_stats
+
 logger = logging.getLogger()
 
 # Load environment variables
@@ -36,6 +42,11 @@ DEFAULT_VOICES = {
     "will": "bIHbv24MWmeRgasZH58o",
 }
 
+TTS_MODEL_ID = "eleven_multilingual_v2"
+
+# Paragraph audio, decoded to PCM (WAV) so hits skip the MP3 decode too
+tts_cache = DiskCache("tts", TTS_CACHE_MAX_BYTES, suffix=".wav")
+
 
 def create_voice_clone(voice_samples: List[str], voice_name: str) -> Optional[str]:
     """Create a voice clone from provided samples."""
@@ -45,18 +56,20 @@ def create_voice_clone(voice_samples: List[str], voice_name: str) -> Optional[st
             for f in voice_samples
         ]
 
-        response = requests.post(
-            "https://api.elevenlabs.io/v1/voices/add",
-            headers={"xi-api-key": XI_API_KEY},
-            data={
-                "name": voice_name,
-                "description": "Temporary cloned voice"
-            },
-            files=files,
-        )
-
-        if response.status_code != 200:
-            raise Exception(f"Voice cloning failed: {response.text}")
+        with provider_stats.track("elevenlabs"):
+            response = requests.post(
+                "https://api.elevenlabs.io/v1/voices/add",
+                headers={"xi-api-key": XI_API_KEY},
+                data={
+                    "name": voice_name,
+                    "description": "Temporary cloned voice"
+                },
+                files=files,
+                timeout=ELEVENLABS_TIMEOUT_SECONDS,
+            )
+
+            if response.status_code != 200:
+                raise Exception(f"Voice cloning failed: {response.text}")
 
         voice_id = response.json()["voice_id"]
         logger.info(f"Successfully created voice clone with ID: {voice_id}")
@@ -71,7 +84,8 @@ def delete_cloned_voice(voice_id: str) -> bool:
     try:
         response = requests.delete(
             f"https://api.elevenlabs.io/v1/voices/{voice_id}",
-            headers={"xi-api-key": XI_API_KEY}
+            headers={"xi-api-key": XI_API_KEY},
+            timeout=ELEVENLABS_TIMEOUT_SECONDS,
         )
 
         if response.status_code != 200:
@@ -88,18 +102,27 @@ def generate_audio(
     character: str,
     voice_samples: Optional[List[str]] = None,
     output_path: str = "assets/audio/combined_story_audio.wav",
+    prompts_path: str = "prompts/subtitle_gen_prompts.txt",
+    voice_id: Optional[str] = None,
+    cancel=None,
+    on_paragraph=None,
 ) -> Tuple[bool, str]:
 
     try:
         # Read all prompts
-        with open("prompts/subtitle_gen_prompts.txt", "r") as f:
+        with open(prompts_path, "r") as f:
             paragraphs = f.read().splitlines()
 
         # Determine voice ID
-        voice_id = None
         is_clone = False
-
-        if character.lower() == "clone":
+        # Only default voices: cloned ones are deleted after the job, so
+        # audio in them is never reused
+        cacheable = False
+
+        if voice_id:
+            # Voice cloned by the caller, who also deletes it
+            pass
+        elif character.lower() == "clone":
             if not voice_samples:
                 return False, "Voice samples required for cloning"
             
@@ -113,30 +136,57 @@ def generate_audio(
             if character not in DEFAULT_VOICES:
                 return False, f"Voice '{character}' not found in default voices"
             voice_id = DEFAULT_VOICES[character]
+            cacheable = True
 
         try:
             # Generate audio segments
             segments = []
             for i, paragraph in enumerate(paragraphs):
+                # Stop spending TTS quota once the job has been cancelled
+                if cancel:
+                    cancel.raise_if_cancelled()
+
                 is_last_paragraph = i == len(paragraphs) - 1
                 is_first_paragraph = i == 0
-                
-                response = requests.post(
-                    f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream",
-                    json={
-                        "text": paragraph,
-                        "model_id": "eleven_multilingual_v2",
-                        "previous_text": None if is_first_paragraph else " ".join(paragraphs[:i]),
-                        "next_text": None if is_last_paragraph else " ".join(paragraphs[i + 1:]),
-                    },
-                    headers={"xi-api-key": XI_API_KEY}
-                )
-
-                if response.status_code != 200:
-                    raise Exception(f"API Error: {response.status_code} - {response.text}")
+                request = {
+                    "text": paragraph,
+                    "model_id": TTS_MODEL_ID,
+                    "previous_text": None if is_first_paragraph else " ".join(paragraphs[:i]),
+                    "next_text": None if is_last_paragraph else " ".join(paragraphs[i + 1:]),
+                }
+
+                cache_key = None
+                if cacheable:
+                    cache_key = DiskCache.key(voice_id, request)
+                    cached = tts_cache.get(cache_key)
+                    if cached:
+                        logger.info(f"Using cached audio for paragraph {i + 1}/{len(paragraphs)}")
+                        if on_paragraph:
+                            on_paragraph(i + 1, len(paragraphs))
+                        segments.append(AudioSegment.from_wav(cached))
+                        continue
+
+                with provider_stats.track("elevenlabs"):
+                    response = requests.post(
+                        f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream",
+                        json=request,
+                        headers={"xi-api-key": XI_API_KEY},
+                        # Cut to the time left in the audio stage's budget
+                        timeout=call_timeout(cancel, ELEVENLABS_TIMEOUT_SECONDS),
+                    )
+
+                    if response.status_code != 200:
+                        raise Exception(f"API Error: {response.status_code} - {response.text}")
 
                 logger.info(f"Generated audio for paragraph {i + 1}/{len(paragraphs)}")
-                segments.append(AudioSegment.from_mp3(io.BytesIO(response.content)))
+                if on_paragraph:
+                    on_paragraph(i + 1, len(paragraphs))
+                segment = AudioSegment.from_mp3(io.BytesIO(response.content))
+                if cache_key:
+                    wav = io.BytesIO()
+                    segment.export(wav, format="wav")
+                    tts_cache.put_bytes(cache_key, wav.getvalue())
+                segments.append(segment)
 
             # Combine all segments
             final_audio = segments[0]
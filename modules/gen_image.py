@@ -1,9 +1,16 @@
 import os
+import re
 import asyncio
 import aiohttp
 import logging
+from typing import Optional
 from dotenv import load_dotenv
 
+from config.caches import IMAGE_CACHE_MAX_BYTES
+from config.timeouts import LEONARDO_TIMEOUT_SECONDS
+from helpers.disk_cache import DiskCache, link_or_copy
+from helpers.provider_stats import provider_stats
+
 # Load environment variables
 load_dotenv()
 
@@ -46,6 +53,8 @@ MODEL_IDS = {
     # Add more model IDs as needed
 }
 
+image_cache = DiskCache("images", IMAGE_CACHE_MAX_BYTES, suffix=".png")
+
 # cummultive
 # async def read_prompts(file_path: str):
 #     """
@@ -102,15 +111,9 @@ async def read_prompts(file_path: str):
 #         return []
 
 
-async def generate_image_request(session, prompt, style, i, aspect_ratio):
-    """Sends a single image generation request for the given prompt with retry logic."""
-    headers = {
-        "accept": "application/json",
-        "authorization": f"Bearer {LEONARDO_API_KEY}",
-        "content-type": "application/json",
-    }
-
-    payload = {
+def image_payload(prompt, style, aspect_ratio):
+    """Leonardo generation request for one image."""
+    return {
         "alchemy": True,
         "height": VALID_IMAGE_ASPECT_RATIOS[aspect_ratio]["height"],
         "width": VALID_IMAGE_ASPECT_RATIOS[aspect_ratio]["width"],
@@ -125,6 +128,50 @@ async def generate_image_request(session, prompt, style, i, aspect_ratio):
         "sd_version": "SDXL_LIGHTNING",
     }
 
+
+def image_cache_key(prompt, style, aspect_ratio):
+    """
+    Cache key of an image: the whole request (model, size and settings),
+    with the prompt normalized the way Leonardo's text encoder sees it
+    (case and whitespace don't matter).
+    """
+    payload = image_payload(prompt, style, aspect_ratio)
+    payload["prompt"] = re.sub(r"\s+", " ", prompt).strip().lower()
+    return DiskCache.key(payload)
+
+
+def cached_image(prompt, style, aspect_ratio, file_name) -> Optional[str]:
+    """Link a cached image to `file_name`; None when it isn't cached."""
+    cached = image_cache.get(image_cache_key(prompt, style, aspect_ratio))
+    if not cached:
+        return None
+    link_or_copy(cached, file_name)
+    return file_name
+
+
+def pin_image(prompt, style, aspect_ratio) -> bool:
+    """Keep a cached image through eviction; False if it isn't cached."""
+    key = image_cache_key(prompt, style, aspect_ratio)
+    if not os.path.exists(image_cache.path(key)):
+        return False
+    image_cache.pin(key)
+    return True
+
+
+def unpin_image(prompt, style, aspect_ratio):
+    image_cache.unpin(image_cache_key(prompt, style, aspect_ratio))
+
+
+async def generate_image_request(session, prompt, style, i, aspect_ratio):
+    """Sends a single image generation request for the given prompt with retry logic."""
+    headers = {
+        "accept": "application/json",
+        "authorization": f"Bearer {LEONARDO_API_KEY}",
+        "content-type": "application/json",
+    }
+
+    payload = image_payload(prompt, style, aspect_ratio)
+
     for attempt in range(MAX_RETRIES):
         try:
             async with session.post(
@@ -132,10 +179,12 @@ async def generate_image_request(session, prompt, style, i, aspect_ratio):
             ) as response:
                 response_data = await response.json()
 
-                if (
+                submitted = (
                     "sdGenerationJob" in response_data
                     and "generationId" in response_data["sdGenerationJob"]
-                ):
+                )
+                provider_stats.record("leonardo", submitted)
+                if submitted:
                     generation_id = response_data["sdGenerationJob"]["generationId"]
                     logger.info(
                         f"Image generation initiated for prompt {i}. ID: {generation_id}"
@@ -149,6 +198,7 @@ async def generate_image_request(session, prompt, style, i, aspect_ratio):
                         logger.warning(f"Retrying prompt {i}, attempt {attempt + 2}")
                     await asyncio.sleep(1)  # Short delay before retry
         except Exception as e:
+            provider_stats.record("leonardo", False)
             logger.error(
                 f"Exception occurred while generating image for prompt {i}: {e}"
             )
@@ -162,8 +212,20 @@ async def generate_image_request(session, prompt, style, i, aspect_ratio):
     return None
 
 
-async def fetch_and_save_image(session, generation_id, i):
-    """Fetches the generated image and downloads it with the correct filename."""
+async def fetch_and_save_image(
+    session,
+    generation_id,
+    i,
+    images_dir="video_creation/assets/images",
+    on_image=None,
+    on_poll=None,
+):
+    """
+    Fetches the generated image and downloads it with the correct filename.
+    `on_image(file_name, i)` is called as soon as the image is on disk, so the
+    caller can start working on it while other images are still downloading.
+    `on_poll(i, attempt)` is called whenever the image isn't ready yet.
+    """
     headers = {
         "accept": "application/json",
         "authorization": f"Bearer {LEONARDO_API_KEY}",
@@ -175,6 +237,7 @@ async def fetch_and_save_image(session, generation_id, i):
                 f"{LEONARDO_FETCH_API_URL}/{generation_id}", headers=headers
             ) as response:
                 response_data = await response.json()
+                provider_stats.record("leonardo", response.status == 200)
 
                 if response_data.get("generations_by_pk", {}).get(
                     "status"
@@ -185,15 +248,24 @@ async def fetch_and_save_image(session, generation_id, i):
                     image_url = response_data["generations_by_pk"]["generated_images"][
                         0
                     ]["url"]
-                    file_name = f"video_creation/assets/images/story_img_{i}.png"
+                    file_name = os.path.join(images_dir, f"story_img_{i}.png")
                     os.makedirs(os.path.dirname(file_name), exist_ok=True)
 
                     async with session.get(image_url) as image_response:
+                        provider_stats.record(
+                            "leonardo", image_response.status == 200
+                        )
                         if image_response.status == 200:
-                            with open(file_name, "wb") as f:
+                            # Replaced rather than rewritten: it may be a
+                            # link to a cached image
+                            partial = f"{file_name}.part"
+                            with open(partial, "wb") as f:
                                 f.write(await image_response.read())
+                            os.replace(partial, file_name)
                             logger.info(f"Image {i} saved as '{file_name}'")
-                            return
+                            if on_image:
+                                on_image(file_name, i)
+                            return file_name
                         else:
                             logger.error(
                                 f"Failed to download Image {i}: Status code {image_response.status}"
@@ -202,37 +274,106 @@ async def fetch_and_save_image(session, generation_id, i):
                     logger.warning(
                         f"Image {i} not ready yet. Attempt {attempt + 1}/{FETCH_MAX_ATTEMPTS}"
                     )
+                    if on_poll:
+                        on_poll(i, attempt + 1)
                     await asyncio.sleep(FETCH_DELAY)
 
         except Exception as e:
+            provider_stats.record("leonardo", False)
             logger.error(f"Error fetching image {i}: {e}")
 
     logger.error(f"Failed to fetch image {i} after {FETCH_MAX_ATTEMPTS} attempts")
 
 
-async def generate_images_from_prompts(prompts, style, aspect_ratio):
-    """Generates images based on the provided prompts using the Leonardo AI API."""
-    async with aiohttp.ClientSession() as session:
-        # Create tasks for all prompts at once
-        generate_tasks = [
-            generate_image_request(session, prompt, style, idx + 1, aspect_ratio)
-            for idx, prompt in enumerate(prompts)
-        ]
-
-        # Wait for all generation tasks to complete
-        generation_ids = [
-            result for result in await asyncio.gather(*generate_tasks) if result
-        ]
-        
-        await asyncio.sleep(10)
-        # Create tasks to fetch all generated images
-        fetch_tasks = [
-            fetch_and_save_image(session, generation_id, idx)
-            for generation_id, idx in generation_ids
-        ]
-
-        # Wait for all fetch tasks to complete
-        await asyncio.gather(*fetch_tasks)
+async def generate_images_from_prompts(
+    prompts,
+    style,
+    aspect_ratio,
+    images_dir="video_creation/assets/images",
+    on_image=None,
+    on_progress=None,
+):
+    """
+    Generates images based on the provided prompts using the Leonardo AI API.
+    Images generated before for the same prompt, style and aspect ratio are
+    taken from the image cache instead, without any request.
+    `on_image` is passed on to fetch_and_save_image for every image.
+    `on_progress(step, done, total, image=i)` reports every "submit", "poll"
+    and "download" of an image; `done` is the number of images submitted
+    (for "submit") or downloaded (for "poll" and "download") so far.
+    """
+    total = len(prompts)
+    counts = {"submit": 0, "download": 0}
+
+    def report(step, i, **data):
+        if step in counts:
+            counts[step] += 1
+        if on_progress:
+            done = counts["download" if step == "poll" else step]
+            on_progress(step, done, total, image=i, **data)
+
+    async def submit(session, prompt, i):
+        result = await generate_image_request(session, prompt, style, i, aspect_ratio)
+        if result:
+            report("submit", i)
+        return result
+
+    def saved(file_name, i):
+        image_cache.put_file(
+            image_cache_key(prompts[i - 1], style, aspect_ratio), file_name
+        )
+        report("download", i)
+        if on_image:
+            on_image(file_name, i)
+
+    def polled(i, attempt):
+        report("poll", i, attempt=attempt)
+
+    # Bounds every single request; the stage budget bounds the whole loop
+    timeout = aiohttp.ClientTimeout(total=LEONARDO_TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        tasks = []
+        try:
+            # Create tasks for all prompts at once, except cached ones
+            generate_tasks = []
+            for idx, prompt in enumerate(prompts):
+                file_name = os.path.join(images_dir, f"story_img_{idx + 1}.png")
+                if cached_image(prompt, style, aspect_ratio, file_name):
+                    logger.info(f"Image {idx + 1} taken from the image cache")
+                    report("download", idx + 1, cached=True)
+                    if on_image:
+                        on_image(file_name, idx + 1)
+                    continue
+                generate_tasks.append(
+                    asyncio.create_task(submit(session, prompt, idx + 1))
+                )
+            tasks.extend(generate_tasks)
+
+            # Wait for all generation tasks to complete
+            generation_ids = [
+                result for result in await asyncio.gather(*generate_tasks) if result
+            ]
+
+            if generation_ids:
+                await asyncio.sleep(10)
+            # Create tasks to fetch all generated images
+            fetch_tasks = [
+                asyncio.create_task(
+                    fetch_and_save_image(
+                        session, generation_id, idx, images_dir, saved, polled
+                    )
+                )
+                for generation_id, idx in generation_ids
+            ]
+            tasks.extend(fetch_tasks)
+
+            # Wait for all fetch tasks to complete
+            await asyncio.gather(*fetch_tasks)
+        finally:
+            # On cancellation (or an error) stop polling Leonardo before the
+            # session closes
+            for task in tasks:
+                task.cancel()
 
 
 if __name__ == "__main__":
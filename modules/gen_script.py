@@ -6,9 +6,14 @@ from dotenv import load_dotenv
 import logging
 # from config.logger import get_logger
 
+from config.timeouts import OPENAI_TIMEOUT_SECONDS
+from helpers.cancellation import call_timeout
+from helpers.completion_cache import cached_completion, completion_key, store_completion
+from helpers.provider_stats import provider_stats
+
 load_dotenv()
 
-client = OpenAI()
+client = OpenAI(timeout=OPENAI_TIMEOUT_SECONDS)
 client.api_key = os.getenv("OPENAI_API_KEY")
 
 # logger = get_logger(__name__)
@@ -54,7 +59,9 @@ styles = {
 }
 
 
-async def generate_script(style: str, duration: int, topic: str):
+async def generate_script(
+    style: str, duration: int, topic: str, fresh: bool = False, cancel=None
+):
     try:
         if style not in styles:
             print("Invalid style selected")
@@ -69,39 +76,51 @@ async def generate_script(style: str, duration: int, topic: str):
 
         style_prompt = styles[style]["prompt"]
 
+        model = "gpt-4o-mini"
+        messages = [
+            {"role": "system", "content": "You are a short storyteller."},
+            {
+                "role": "user",
+                "content": (
+                    f"{style_prompt} Topic: '{topic}'. The story must have exactly {num_of_sentences} sentences. "
+                    f"Each sentence should be approximately 13 words long. "
+                    f"A sentence ends when there is a period (.). Use simple, expressive language, "
+                    f"punctuation (e.g., !, ?), and capitalization to add emotion. "
+                    f"Ensure no extra sentences and no incomplete ones—strictly {num_of_sentences}. "
+                    f"The story should flow naturally from beginning to end."
+                ),
+            },
+        ]
+
         async def request_story():
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a short storyteller."},
-                    {
-                        "role": "user",
-                        "content": (
-                            f"{style_prompt} Topic: '{topic}'. The story must have exactly {num_of_sentences} sentences. "
-                            f"Each sentence should be approximately 13 words long. "
-                            f"A sentence ends when there is a period (.). Use simple, expressive language, "
-                            f"punctuation (e.g., !, ?), and capitalization to add emotion. "
-                            f"Ensure no extra sentences and no incomplete ones—strictly {num_of_sentences}. "
-                            f"The story should flow naturally from beginning to end."
-                        ),
-                    },
-                ],
+            response = await asyncio.to_thread(
+                provider_stats.tracked("openai", client.chat.completions.create),
+                timeout=call_timeout(cancel, OPENAI_TIMEOUT_SECONDS),
+                model=model,
+                messages=messages,
             )
             return response.choices[0].message.content
 
+        # A cached script passed the sentence count check when it was stored
+        cache_key = completion_key(model, messages, duration)
+        cached = None if fresh else cached_completion(cache_key)
+
         max_retries = 5
         retries = 0
 
         while retries < max_retries:
-            story = await request_story()
+            story = cached or await request_story()
             sentences = re.findall(r"[^.!?]+[.!?]", story.strip())
             sentences = [s.strip() for s in sentences]
 
             if len(sentences) >= num_of_sentences:
+                if not cached:
+                    store_completion(cache_key, story)
                 sentences = sentences[:num_of_sentences]
                 print(len(sentences))
                 return sentences
 
+            cached = None
             retries += 1
             print(
                 f"Retry {retries}/{max_retries}: Expected {num_of_sentences} sentences, "
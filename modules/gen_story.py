@@ -8,14 +8,21 @@ import asyncio
 import re
 import logging
 from config.logger import get_logger
+from config.timeouts import OPENAI_TIMEOUT_SECONDS
+from helpers.cancellation import call_timeout
+from helpers.completion_cache import cached_completion, completion_key, store_completion
+from helpers.provider_stats import provider_stats
 
 load_dotenv()
 
-client = OpenAI()
+client = OpenAI(timeout=OPENAI_TIMEOUT_SECONDS)
 client.api_key = os.getenv("OPENAI_API_KEY")
 
 logger = get_logger(__name__)
 
+# Story sentences (= images, clips and subtitle segments) per video duration
+SENTENCES_PER_DURATION = {45: 7, 60: 11, 75: 14}
+
 # # Generate Script : For generating scripts repeatedly
 # async def generate_script(prompt: str, duration: int):
 #     try:
@@ -88,47 +95,57 @@ logger = get_logger(__name__)
 #         logger.error(f"Error: {e}")
 
 
-async def subtitle_generator_story(prompt: str, duration: int):
+async def subtitle_generator_story(
+    prompt: str,
+    duration: int,
+    output_path: str = "prompts/subtitle_gen_prompts.txt",
+    cancel=None,
+    fresh: bool = False,
+):
     try:
         # Define number of sentences based on duration
-        if duration == 45:
-            num_of_sentences = 7
-        elif duration == 60:
-            num_of_sentences = 11
-        elif duration == 75:
-            num_of_sentences = 14
-        else:
+        num_of_sentences = SENTENCES_PER_DURATION.get(duration)
+        if not num_of_sentences:
             logger.info("Invalid duration")
             return
 
+        model = "gpt-4o-mini"
+        messages = [
+            {"role": "system", "content": "You are a short storyteller."},
+            {
+                "role": "user",
+                "content": (
+                    f"Write a cohesive and compelling story about '{prompt}'. "
+                    f"The story must have exactly {num_of_sentences} sentences. "
+                    f"Each sentence must be exactly 12 words long, no more, no less. "
+                    f"A sentence ends when there is a period (.). Use simple, expressive language, "
+                    f"punctuation (e.g., !, ?), and capitalization to add emotion. "
+                    f"Ensure no extra sentences and no incomplete ones—strictly {num_of_sentences}. "
+                    f"The story should flow naturally from beginning to end."
+                ),
+            },
+        ]
+
         # Function to request story generation
         def request_story():
-            completion = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a short storyteller."},
-                    {
-                        "role": "user",
-                        "content": (
-                            f"Write a cohesive and compelling story about '{prompt}'. "
-                            f"The story must have exactly {num_of_sentences} sentences. "
-                            f"Each sentence must be exactly 12 words long, no more, no less. "
-                            f"A sentence ends when there is a period (.). Use simple, expressive language, "
-                            f"punctuation (e.g., !, ?), and capitalization to add emotion. "
-                            f"Ensure no extra sentences and no incomplete ones—strictly {num_of_sentences}. "
-                            f"The story should flow naturally from beginning to end."
-                        ),
-                    },
-                ],
-            )
+            with provider_stats.track("openai"):
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=call_timeout(cancel, OPENAI_TIMEOUT_SECONDS),
+                )
             return completion.choices[0].message.content
 
+        # A cached story passed the sentence count check when it was stored
+        cache_key = completion_key(model, messages, duration)
+        cached = None if fresh else cached_completion(cache_key)
+
         # Generate the story with a retry mechanism
         max_retries = 4
         retries = 0
 
         while retries < max_retries:
-            story = request_story()
+            story = cached or await asyncio.to_thread(request_story)
 
             # Split the story into sentences
             sentences = story.split(". ")
@@ -137,8 +154,11 @@ async def subtitle_generator_story(prompt: str, duration: int):
             ]  # Clean and ensure full stops
 
             if len(sentences) == num_of_sentences:
+                if not cached:
+                    store_completion(cache_key, story)
                 break  # Exit loop if sentence count is correct
 
+            cached = None
             retries += 1
             logger.info(
                 f"Retry {retries}/{max_retries}: Expected {num_of_sentences} sentences, "
@@ -152,38 +172,37 @@ async def subtitle_generator_story(prompt: str, duration: int):
             return
 
         # Write each sentence on a new line in the file
-        with open("prompts/subtitle_gen_prompts.txt", "w") as f:
+        with open(output_path, "w") as f:
             for sentence in sentences:
                 f.write(sentence + "\n")
 
-        logger.info("Story successfully written to subtitle_gen_prompts.txt")
+        logger.info(f"Story successfully written to {output_path}")
 
     except Exception as e:
         logger.error(f"Error: {e}")
 
 
 # Generate story-prompts to which are going to be used to gen images
-async def image_generator_story(prompt: str, duration: int):
+async def image_generator_story(
+    prompt: str,
+    duration: int,
+    output_path: str = "prompts/img_gen_prompts.txt",
+    cancel=None,
+    fresh: bool = False,
+):
     try:
         # Define number of sentences based on duration
-        if duration == 45:
-            num_of_sentences = 7
-        elif duration == 60:
-            num_of_sentences = 11
-        elif duration == 75:
-            num_of_sentences = 14
-        else:
+        num_of_sentences = SENTENCES_PER_DURATION.get(duration)
+        if not num_of_sentences:
             logger.error("Invalid duration")
             return
 
-        # Request a full story with the required number of sentences
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a storyteller."},
-                {
-                    "role": "user",
-                    "content": f"""
+        model = "gpt-4o"
+        messages = [
+            {"role": "system", "content": "You are a storyteller."},
+            {
+                "role": "user",
+                "content": f"""
                 Create a visually rich and cinematic story of exactly {num_of_sentences} sentences based on the following prompt:
                 '{prompt}'
                 Each sentence should vividly depict:
@@ -195,11 +214,22 @@ async def image_generator_story(prompt: str, duration: int):
                 
                 Focus on crafting a cohesive narrative where each sentence paints a vivid image that inspires cinematic illustration or film composition. Avoid extreme close-ups or very distant views; aim for a medium cinematic perspective with a harmonious blend of subject and surroundings.
             """,
-                },
-            ],
-        )
-        # Extract the full story content
-        story = completion.choices[0].message.content.strip()
+            },
+        ]
+
+        cache_key = completion_key(model, messages, duration)
+        story = None if fresh else cached_completion(cache_key)
+        cached = story is not None
+        if not cached:
+            # Request a full story with the required number of sentences
+            completion = await asyncio.to_thread(
+                provider_stats.tracked("openai", client.chat.completions.create),
+                timeout=call_timeout(cancel, OPENAI_TIMEOUT_SECONDS),
+                model=model,
+                messages=messages,
+            )
+            # Extract the full story content
+            story = completion.choices[0].message.content.strip()
 
         # Split the story into sentences
         sentences = []
@@ -208,12 +238,16 @@ async def image_generator_story(prompt: str, duration: int):
             if sentence:
                 sentences.append(sentence)
 
+        # Only stories with enough sentences are worth replaying
+        if not cached and len(sentences) >= num_of_sentences:
+            store_completion(cache_key, story)
+
         # Write up to the specified number of sentences (e.g., 10)
-        with open("prompts/img_gen_prompts.txt", "w") as f:
+        with open(output_path, "w") as f:
             for i in range(min(num_of_sentences, len(sentences))):
                 f.write(sentences[i] + ".\n")
 
-        logger.info("Story successfully written to img_gen_prompts.txt")
+        logger.info(f"Story successfully written to {output_path}")
 
     except Exception as e:
         logger.error(f"Error: {e}")
@@ -2,15 +2,20 @@ from openai import OpenAI
 from dotenv import load_dotenv
 import os
 
+from config.timeouts import OPENAI_TIMEOUT_SECONDS
+from helpers.provider_stats import provider_stats
+
 load_dotenv()
 
-client = OpenAI()
+client = OpenAI(timeout=OPENAI_TIMEOUT_SECONDS)
 client.api_key = os.getenv("OPENAI_API_KEY")
 
 
-def speech2text(path):
-    audio_file = open(path, "rb")
-    transcription = client.audio.transcriptions.create(model="whisper-1", file=audio_file)
+def speech2text(path, timeout=OPENAI_TIMEOUT_SECONDS):
+    with open(path, "rb") as audio_file, provider_stats.track("openai"):
+        transcription = client.audio.transcriptions.create(
+            model="whisper-1", file=audio_file, timeout=timeout
+        )
     return transcription.text
 
 if __name__ == "__main__":
@@ -1,15 +1,15 @@
 # Fastapi imports
 from fastapi import APIRouter
-from fastapi import UploadFile, File, HTTPException, Form
+from fastapi import UploadFile, File, HTTPException, Form, Request
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 from pathlib import Path
 
 # Helpers
 from config.logger import get_logger 
-from services.aud2vid.aud_to_vid_service import generate_aud2vid 
+from services.fair_share import QuotaExceeded
+from services.job_manager import ServerBusy, job_manager
 from helpers.audio_duration import get_audio_duration
-from modules.speech2text import speech2text
 from helpers.aws_uploader import upload_to_s3
 
 from typing import Optional, List
@@ -35,6 +35,7 @@ VALID_ASPECT_RATIOS = {"9:16", "16:9", "1:1"}
 
 @router.post("/audio-to-video")
 async def handle_aud2vid_request(
+    request: Request,
     # duration: int = Form(...),
     userID: str = Form(...),
     aspect_ratio: str = Form(...),
@@ -70,78 +71,61 @@ async def handle_aud2vid_request(
             status_code=400, detail=f"Invalid style. Allowed styles are {VALID_STYLES}."
         )
 
-    uploaded_files = []
     try:
-        # Handle voice files if provided
-        if voice_files:
-            # Create uploads directory
-            uploads_dir = Path("uploads")
-            uploads_dir.mkdir(exist_ok=True)
-
-            # Save all uploaded files
-            for i, voice_file in enumerate(voice_files, start=1):
-                file_path = str(uploads_dir / f"sample_{i}.mp3")
-                with open(file_path, "wb") as f:
-                    f.write(await voice_file.read())
-                uploaded_files.append(file_path)
-
-                # Check audio duration
-                audio_duration = get_audio_duration(file_path)
-                if audio_duration > MAX_VOICE_FILE_DURATION:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Each voice file must be under {MAX_VOICE_FILE_DURATION} seconds.",
-                    )
-
-        # Extract text from audio
-        path = "uploads/sample_1.mp3"
-        audio_text = speech2text(path) 
-
-        # Generate video
-        await generate_aud2vid(
-            audio_text=audio_text,
-            duration=int(duration),
-            style=style,
-            aspect_ratio=aspect_ratio,
-            bgm_audio=bgm_audio,
-            # voice_character=voice_character,
-            voice_files=uploaded_files if uploaded_files else None,
+        job = job_manager.create_job(
+            "audio",
+            {
+                "duration": int(duration),
+                "style": style,
+                "aspect_ratio": aspect_ratio,
+                "bgm_audio": bgm_audio,
+                # "voice_character": voice_character,
+            },
+            userID,
         )
 
-        # Determine the correct video path based on bgm_audio
-        video_path = Path("video_creation/assets/videos")
-        if bgm_audio != "":
-            video_file = video_path / "final_output_video_bgm.mp4"
-        else:
-            video_file = (
-                video_path / "final_output_video.mp4"
-            )  
-
-        # Verify the video file exists before uploading
-        if not video_file.exists():
-            raise HTTPException(
-                status_code=500, detail="Generated video file not found"
-            )
-
-        # Upload to aws-S3 with duration
-        s3_url = upload_to_s3(str(video_file), int(duration))
+        # Handle voice files if provided; a job whose uploads fail is dropped
+        uploaded_files = []
+        try:
+            if voice_files:
+                # Save all uploaded files into the job's workspace
+                for i, voice_file in enumerate(voice_files, start=1):
+                    file_path = job.context.upload_path(i)
+                    with open(file_path, "wb") as f:
+                        f.write(await voice_file.read())
+                    uploaded_files.append(file_path)
+
+                    # Check audio duration
+                    audio_duration = get_audio_duration(file_path)
+                    if audio_duration > MAX_VOICE_FILE_DURATION:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Each voice file must be under {MAX_VOICE_FILE_DURATION} seconds.",
+                        )
+        except BaseException:
+            job_manager.discard(job)
+            raise
+        job.params["voice_files"] = uploaded_files if uploaded_files else None
+
+        # Extract text from audio and generate video on the shared worker pool
+        job_manager.enqueue(job)
+        # A client that disconnects cancels the job it was waiting for
+        await job_manager.wait(job, request.is_disconnected)
+
+        if job.state != "succeeded":
+            raise Exception(job.error)
 
         return JSONResponse(
             {"success": True, 
-             "video_path": s3_url, 
+             "video_path": job.result_url, 
              "duration": duration}
         )
 
+    except (HTTPException, QuotaExceeded, ServerBusy):
+        raise  # answered as they are (429 or 503, see main.py)
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
 
         return JSONResponse(
             status_code=500, content={"success": False, "error": str(e)}
         )
-    finally:
-        # Clean up uploaded files
-        for file_path in uploaded_files:
-            try:
-                Path(file_path).unlink()
-            except Exception as e:
-                logger.error(f"Error deleting uploaded file {file_path}: {str(e)}")
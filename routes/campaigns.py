@@ -0,0 +1,120 @@
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter
+from fastapi import Form, File, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from modules.gen_audio import DEFAULT_VOICES
+from config.logger import get_logger
+from routes.jobs import VALID_ASPECT_RATIOS, VALID_DURATIONS, VALID_STYLES
+from services.campaign import campaign_manager
+from services.priority import PRIORITY_CLASSES
+from services.webhooks import validate_callback_url
+
+logger = get_logger(__name__)
+
+router = APIRouter()
+
+MAX_CAMPAIGN_ITEMS = 100
+
+
+@router.post("/campaigns")
+async def handle_campaign_submission(
+    userID: str = Form(...),
+    prompts: List[str] = Form(...),  # one form field per video
+    duration: int = Form(...),
+    aspect_ratio: str = Form(...),
+    style: str = Form(...),
+    voice_character: Optional[str] = Form(""),
+    bgm_audio: Optional[str] = Form(""),
+    priority: str = Form("batch"),
+    voice_files: Optional[List[UploadFile]] = File(None),
+    callback_url: Optional[str] = Form(None),  # webhooks for every item's job
+):
+    """
+    Generate one video per prompt with shared settings. The response is a
+    stream of JSON lines: one per video as soon as it finishes, then a
+    summary with the aggregate throughput.
+    """
+    # Shared settings are validated once for the whole batch
+    prompts = [prompt.strip() for prompt in prompts if prompt.strip()]
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required.")
+
+    if len(prompts) > MAX_CAMPAIGN_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A campaign can have at most {MAX_CAMPAIGN_ITEMS} prompts.",
+        )
+
+    if callback_url:
+        try:
+            validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if int(duration) not in VALID_DURATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid duration. Allowed values are {VALID_DURATIONS}.",
+        )
+
+    if aspect_ratio not in VALID_ASPECT_RATIOS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid aspect ratio: {aspect_ratio}"
+        )
+
+    if style not in VALID_STYLES:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid style. Allowed styles are {VALID_STYLES}."
+        )
+
+    if not voice_files and voice_character not in DEFAULT_VOICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid voice. Allowed voices are {DEFAULT_VOICES.keys()}.",
+        )
+
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid priority. Allowed values are {set(PRIORITY_CLASSES)}.",
+        )
+
+    settings = {
+        "duration": int(duration),
+        "aspect_ratio": aspect_ratio,
+        "style": style,
+        "bgm_audio": bgm_audio,
+        "voice_character": voice_character,
+    }
+    voice_samples = [await voice_file.read() for voice_file in voice_files or []]
+
+    try:
+        campaign = await campaign_manager.start(
+            prompts, settings, userID, priority, voice_samples, callback_url
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream():
+        yield json.dumps({"plan": campaign.summary()}) + "\n"
+        async for result in campaign_manager.results(campaign):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.get("/campaigns/{campaign_id}")
+async def handle_campaign_status(campaign_id: str):
+    campaign = campaign_manager.get(campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail=f"Campaign not found: {campaign_id}")
+
+    return JSONResponse(
+        {
+            **campaign.summary(),
+            "results": [campaign.item(i) for i in range(len(campaign.jobs))],
+        }
+    )
@@ -1,5 +1,9 @@
+import time
+
 from config.logger import get_logger
 from modules.gen_script import generate_script
+from services.priority import priority_key
+from services.scheduler import scheduler
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 
@@ -13,6 +17,7 @@ async def handle_script_generation(
     style: str,
     duration: int,
     topic,
+    fresh: bool = False,  # a new script instead of a cached one
 ):
     # Parameter validation
     if duration not in VALID_DURATIONS:
@@ -22,7 +27,9 @@ async def handle_script_generation(
         )
 
     try:
-        script = await generate_script(style,int(duration),topic)
+        # Someone is waiting on the preview: ahead of queued renders
+        async with scheduler.slot("api", priority_key(time.time(), "interactive")):
+            script = await generate_script(style,int(duration),topic,fresh)
         return JSONResponse({"success": True, "script": script})  
 
     except Exception as e:
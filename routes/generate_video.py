@@ -1,9 +1,9 @@
 from fastapi import APIRouter
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
 from pydub import AudioSegment
 from pathlib import Path
 from pydantic import BaseModel
@@ -14,7 +14,8 @@ from helpers.aws_uploader import upload_to_s3
 
 from config.logger import get_logger, log_time_taken
 
-from services.video_service import generate_video
+from services.fair_share import QuotaExceeded
+from services.job_manager import ServerBusy, job_manager
 
 logger = get_logger(__name__)
 
@@ -36,6 +37,7 @@ VALID_ASPECT_RATIOS = {"9:16", "16:9", "1:1"}
 
 @router.post("/generate-video")
 async def handle_video_request(
+    request: Request,
     userID: str,
     prompt: str,
     duration: int,
@@ -43,6 +45,8 @@ async def handle_video_request(
     style: str,
     voice_character: str = "",
     bgm_audio: str = "",
+    # Retries with the same key (or same parameters) attach to the same job
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
     print(prompt)
     print(duration)
@@ -75,42 +79,34 @@ async def handle_video_request(
         )
 
     try:
-        # Generate video
-        await generate_video(
-            prompt=prompt,
-            duration=int(duration),
-            style=style,
-            aspect_ratio=aspect_ratio,
-            bgm_audio=bgm_audio,
-            voice_character=voice_character,
+        # Generate video on the shared worker pool and wait for the result
+        job = job_manager.submit(
+            "video",
+            {
+                "prompt": prompt,
+                "duration": int(duration),
+                "style": style,
+                "aspect_ratio": aspect_ratio,
+                "bgm_audio": bgm_audio,
+                "voice_character": voice_character,
+            },
+            userID,
+            idempotency_key=idempotency_key,
         )
+        # A client that disconnects cancels the job it was waiting for
+        await job_manager.wait(job, request.is_disconnected)
 
-        # Determine the correct video path based on bgm_audio
-        video_path = Path("video_creation/assets/videos")
-        if bgm_audio != "":
-            video_file = video_path / "final_output_video_bgm.mp4"
-        else:
-            video_file = (
-                video_path / "final_output_video.mp4"
-            )  
-
-        # Verify the video file exists before uploading
-        if not video_file.exists():
-            raise HTTPException(
-                status_code=500, detail="Generated video file not found"
-            )
-
-        # Upload to aws-S3 with duration
-        s3_url = upload_to_s3(str(video_file), int(duration))
+        if job.state != "succeeded":
+            raise Exception(job.error)
 
         return JSONResponse(
             {"success": True, 
-             "video_path": s3_url, 
+             "video_path": job.result_url, 
              "duration": duration}
         )
 
-        return JSONResponse({"success": True, "video_path": "s3_url"})  # aws s3 link
-
+    except (QuotaExceeded, ServerBusy):
+        raise  # answered with 429 or 503 (see main.py)
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
 
@@ -1,8 +1,28 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from services.capacity import capacity_report
 
 router = APIRouter()
 
 
+# Liveness only: the process is up and serving requests
 @router.get("/health-now")
 async def handle_health_check():
     return {"status": "healthy"}
+
+
+# Readiness for the load balancer: stops routing here once draining starts
+# or the instance is saturated
+@router.get("/ready")
+async def handle_readiness_check():
+    report = capacity_report()
+    if report["status"] != "ready":
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+
+# Backlog and capacity figures to drive autoscaling
+@router.get("/metrics")
+async def handle_metrics():
+    return capacity_report()
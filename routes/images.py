@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Form, HTTPException
+
+from modules.gen_image import MODEL_IDS, VALID_IMAGE_ASPECT_RATIOS, pin_image, unpin_image
+
+router = APIRouter()
+
+
+def validate_image(style: str, aspect_ratio: str):
+    if style not in MODEL_IDS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid style. Allowed styles are {set(MODEL_IDS)}."
+        )
+    if aspect_ratio not in VALID_IMAGE_ASPECT_RATIOS:
+        raise HTTPException(status_code=400, detail=f"Invalid aspect ratio: {aspect_ratio}")
+
+
+@router.post("/image-cache/pins")
+async def handle_image_pin(
+    prompt: str = Form(...),
+    style: str = Form(...),
+    aspect_ratio: str = Form(...),
+):
+    """Keep a generated image (e.g. a recurring intro scene) in the image cache for good."""
+    validate_image(style, aspect_ratio)
+    if not pin_image(prompt, style, aspect_ratio):
+        raise HTTPException(status_code=404, detail="Image not in the cache")
+    return {"pinned": True}
+
+
+@router.delete("/image-cache/pins")
+async def handle_image_unpin(
+    prompt: str = Form(...),
+    style: str = Form(...),
+    aspect_ratio: str = Form(...),
+):
+    validate_image(style, aspect_ratio)
+    unpin_image(prompt, style, aspect_ratio)
+    return {"pinned": False}
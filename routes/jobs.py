@@ -0,0 +1,221 @@
+import json
+import time
+
+from fastapi import APIRouter
+from fastapi import Form, File, UploadFile, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+
+from modules.gen_audio import DEFAULT_VOICES
+from config.logger import get_logger
+from services.job_manager import job_manager, make_idempotency_key
+from services.priority import DEFAULT_PRIORITY, PRIORITY_CLASSES
+from services.scheduler import scheduler
+from services.webhooks import validate_callback_url
+
+logger = get_logger(__name__)
+
+router = APIRouter()
+
+VALID_DURATIONS = {45, 60, 75}
+VALID_STYLES = {
+    "anime",
+    "realistic",
+    "fantasy",
+    "watercolor",
+    "cyberpunk",
+    "ink",
+    "cartoon",
+}
+VALID_ASPECT_RATIOS = {"9:16", "16:9", "1:1"}
+
+
+@router.post("/jobs", status_code=202)
+async def handle_job_submission(
+    userID: str = Form(...),
+    duration: int = Form(...),
+    aspect_ratio: str = Form(...),
+    style: str = Form(...),
+    kind: str = Form("video"),  # "video" (from prompt) or "audio" (from voice file)
+    prompt: Optional[str] = Form(""),
+    voice_character: Optional[str] = Form(""),
+    bgm_audio: Optional[str] = Form(""),
+    voice_files: Optional[List[UploadFile]] = File(None),
+    priority: str = Form(DEFAULT_PRIORITY),  # "interactive", "standard" or "batch"
+    deadline: Optional[int] = Form(None),  # seconds from now
+    # Receives a signed POST when the job starts, changes stage and finishes
+    callback_url: Optional[str] = Form(None),
+    # A new story even if the same prompt was written before
+    fresh: bool = Form(False),
+    # Retries with the same key (or same parameters) attach to the same job
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # Parameter validation
+    if kind not in {"video", "audio"}:
+        raise HTTPException(status_code=400, detail=f"Invalid job kind: {kind}")
+
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid priority. Allowed values are {set(PRIORITY_CLASSES)}.",
+        )
+
+    if deadline is not None and deadline <= 0:
+        raise HTTPException(status_code=400, detail="Deadline must be in the future.")
+
+    if callback_url:
+        try:
+            validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if int(duration) not in VALID_DURATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid duration. Allowed values are {VALID_DURATIONS}.",
+        )
+
+    if aspect_ratio not in VALID_ASPECT_RATIOS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid aspect ratio: {aspect_ratio}"
+        )
+
+    if style not in VALID_STYLES:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid style. Allowed styles are {VALID_STYLES}."
+        )
+
+    if kind == "video" and not prompt:
+        raise HTTPException(status_code=400, detail="A prompt is required.")
+
+    if kind == "video" and not voice_files and voice_character not in DEFAULT_VOICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid voice. Allowed voices are {DEFAULT_VOICES.keys()}.",
+        )
+
+    if kind == "audio" and not voice_files:
+        raise HTTPException(status_code=400, detail="An audio file is required.")
+
+    params = {
+        "duration": int(duration),
+        "aspect_ratio": aspect_ratio,
+        "style": style,
+        "bgm_audio": bgm_audio,
+    }
+    if kind == "video":
+        params["prompt"] = prompt
+        params["voice_character"] = voice_character
+        if fresh:
+            params["fresh"] = True
+
+    # Uploads can't be compared, so they only coalesce with an explicit key
+    key = make_idempotency_key(
+        kind, {**params, "voice_files": bool(voice_files)}, userID, idempotency_key
+    )
+    existing = job_manager.find_existing(key)
+    if existing:
+        # Polled through /jobs now, so a disconnected legacy client can't cancel it
+        existing.detached = True
+        if callback_url:
+            job_manager.add_callback(existing, callback_url)
+        return JSONResponse(status_code=200, content=existing.to_dict())
+
+    job = job_manager.create_job(
+        kind,
+        params,
+        userID,
+        priority=priority,
+        deadline=time.time() + deadline if deadline else None,
+        idempotency_key=key,
+        callback_url=callback_url,
+    )
+    # Clients poll /jobs/{id}; the job is only cancelled through DELETE
+    job.detached = True
+
+    # Save uploaded voice files into the job's workspace; a job whose
+    # uploads fail is dropped
+    uploaded_files = []
+    try:
+        for i, voice_file in enumerate(voice_files or [], start=1):
+            file_path = job.context.upload_path(i)
+            with open(file_path, "wb") as f:
+                f.write(await voice_file.read())
+            uploaded_files.append(file_path)
+    except BaseException:
+        job_manager.discard(job)
+        raise
+    params["voice_files"] = uploaded_files or None
+
+    job_manager.enqueue(job)
+
+    return JSONResponse(status_code=202, content=job.to_dict())
+
+
+@router.get("/jobs/{job_id}")
+async def handle_job_status(job_id: str):
+    status = job_manager.get_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    return JSONResponse(status)
+
+
+@router.get("/jobs/{job_id}/events")
+async def handle_job_events(job_id: str):
+    """
+    Server-sent events with the job's progress: stage start/end with
+    durations, step counts (TTS paragraphs, image submit/poll/download,
+    clip renders) and ffmpeg encode speeds, then the final status.
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        status = job_manager.get_status(job_id)
+        if not status:
+            raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    def message(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def stream():
+        if job:
+            async for event in job_manager.events(job):
+                yield message(event["event"], event)
+        yield message("status", job.to_dict() if job else status)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.delete("/jobs/{job_id}")
+async def handle_job_cancellation(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job:
+        return JSONResponse(job.to_dict())
+
+    status = job_manager.get_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    # Recorded by an earlier process and already finished
+    raise HTTPException(
+        status_code=409, detail=f"Job already {status['state']}: {job_id}"
+    )
+
+
+@router.get("/users/{user_id}/usage")
+async def handle_user_usage(user_id: str):
+    """
+    The user's queued jobs with their estimated queue positions, running
+    jobs, and submissions, quota and run time over the last hour.
+    """
+    return JSONResponse(job_manager.user_usage(user_id))
+
+
+@router.get("/scheduler")
+async def handle_scheduler_stats():
+    """Job queue depth, and per resource class: slots, queue depth, wait times."""
+    return JSONResponse({"jobs": job_manager.queue_stats(), **scheduler.stats()})
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, Response
+
+from services.delivery import DELIVERY_ACCEL_PREFIX, DELIVERY_TTL_SECONDS, delivered_video
+
+router = APIRouter()
+
+
+@router.api_route("/videos/{job_id}.mp4", methods=["GET", "HEAD"])
+async def handle_video_download(job_id: str):
+    """
+    A finished video delivered with DELIVERY_MODE=local. Range requests are
+    answered with 206 partial content, so players start playback and seek
+    without downloading the whole file.
+    """
+    path = delivered_video(job_id)
+    if not path:
+        raise HTTPException(status_code=404, detail=f"Video not found or expired: {job_id}")
+
+    headers = {"Cache-Control": f"private, max-age={DELIVERY_TTL_SECONDS}"}
+    if DELIVERY_ACCEL_PREFIX:
+        # nginx serves the file (and its ranges) straight from disk
+        headers["X-Accel-Redirect"] = f"{DELIVERY_ACCEL_PREFIX}/{job_id}.mp4"
+        return Response(media_type="video/mp4", headers=headers)
+
+    # Sent without copying through the app where the server supports the
+    # ASGI pathsend extension, in chunks otherwise
+    return FileResponse(path, media_type="video/mp4", headers=headers)
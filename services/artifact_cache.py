@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Optional
+
+from config.caches import ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_BYTES
+from config.logger import get_logger
+from helpers.disk_cache import file_digest, link_or_copy
+
+logger = get_logger(__name__)
+
+# Bump when stages change what they produce for the same inputs
+ARTIFACT_CACHE_VERSION = 1
+
+FILE_MARKER = "__file__"
+
+
+def _canonical(value):
+    """Key material for a stage input: files count by content, not path."""
+    if isinstance(value, str) and os.path.isfile(value):
+        return {FILE_MARKER: file_digest(value)}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    return value
+
+
+class ArtifactCache:
+    """
+    Content-addressed store of pipeline stage outputs. An entry is keyed by
+    a hash of the stage, its function and its inputs, with input files
+    hashed by content, so a stage fed the same prompt, story, narration,
+    images or clips as an earlier job reuses that job's outputs instead of
+    calling APIs or rendering again.
+
+    Output files inside the job workspace are copied into the entry and
+    copied back into the new job's workspace on a hit, never hard linked:
+    a stage running again may rewrite its files in place. The index
+    (SQLite) tracks sizes and last use for LRU eviction beyond
+    `max_bytes`; hits, misses and bytes and seconds saved are counted per
+    stage.
+    """
+
+    def __init__(
+        self, root: str = ARTIFACT_CACHE_DIR, max_bytes: int = ARTIFACT_CACHE_MAX_BYTES
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.counters = defaultdict(
+            lambda: {
+                "hits": 0,
+                "misses": 0,
+                "stores": 0,
+                "bytes_saved": 0,
+                "seconds_saved": 0.0,
+            }
+        )
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the module never touches disk
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._conn = sqlite3.connect(
+                os.path.join(self.root, "index.db"), check_same_thread=False
+            )
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            with self._conn:
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS entries (
+                        key TEXT PRIMARY KEY,
+                        stage TEXT NOT NULL,
+                        outputs TEXT NOT NULL,
+                        bytes INTEGER NOT NULL,
+                        compute_seconds REAL,
+                        created_at REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                    """
+                )
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+                )
+        return self._conn
+
+    def key(self, stage: str, func, inputs: dict) -> str:
+        material = {
+            "version": ARTIFACT_CACHE_VERSION,
+            "stage": stage,
+            "func": f"{func.__module__}.{func.__qualname__}",
+            "inputs": _canonical(inputs),
+        }
+        encoded = json.dumps(material, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, stage: str, key: str, work_dir: str) -> Optional[dict]:
+        """
+        The outputs cached under `key`, with their files restored into
+        `work_dir`; None on a miss. Never raises: a broken entry is a miss.
+        """
+        try:
+            with self._lock:
+                row = self._db().execute(
+                    "SELECT * FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+            if row:
+                outputs = self._restore(
+                    json.loads(row["outputs"]), self._entry_dir(key), work_dir
+                )
+                with self._lock, self._db():
+                    self._db().execute(
+                        "UPDATE entries SET last_used = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                counters = self.counters[stage]
+                counters["hits"] += 1
+                counters["bytes_saved"] += row["bytes"]
+                counters["seconds_saved"] += row["compute_seconds"] or 0.0
+                logger.info(f"Artifact cache hit for stage '{stage}'")
+                return outputs
+        except FileNotFoundError:
+            logger.warning(f"Artifact cache entry {key} is incomplete, dropping it")
+            self._remove(key)
+        except Exception as e:
+            logger.warning(f"Artifact cache lookup failed for stage '{stage}': {e}")
+        self.counters[stage]["misses"] += 1
+        return None
+
+    def _restore(self, value, entry_dir: str, work_dir: str):
+        if isinstance(value, dict) and FILE_MARKER in value:
+            target = os.path.join(work_dir, value[FILE_MARKER])
+            link_or_copy(
+                os.path.join(entry_dir, value[FILE_MARKER]), target, link=False
+            )
+            return target
+        if isinstance(value, list):
+            return [self._restore(item, entry_dir, work_dir) for item in value]
+        if isinstance(value, dict):
+            return {
+                key: self._restore(item, entry_dir, work_dir)
+                for key, item in value.items()
+            }
+        return value
+
+    def put(
+        self, stage: str, key: str, outputs: dict, work_dir: str, compute_seconds: float
+    ):
+        """Store a stage's outputs; files outside `work_dir` make them uncacheable."""
+        files = {}
+        try:
+            manifest = self._relative(outputs, os.path.abspath(work_dir), files)
+        except ValueError as e:
+            logger.info(f"Not caching stage '{stage}': {e}")
+            return
+
+        entry_dir = self._entry_dir(key)
+        staging = os.path.join(self.root, f"tmp-{uuid.uuid4().hex}")
+        try:
+            size = 0
+            for relative, source in files.items():
+                link_or_copy(source, os.path.join(staging, relative), link=False)
+                size += os.path.getsize(source)
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)  # replaced
+            if files:
+                os.replace(staging, entry_dir)
+
+            now = time.time()
+            with self._lock, self._db():
+                self._db().execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(key, stage, outputs, bytes, compute_seconds, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, stage, json.dumps(manifest), size, compute_seconds, now, now),
+                )
+            self.counters[stage]["stores"] += 1
+        except Exception as e:
+            logger.warning(f"Artifact cache store failed for stage '{stage}': {e}")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def _relative(self, value, work_dir: str, files: dict):
+        """Outputs with file paths replaced by markers relative to `work_dir`."""
+        if isinstance(value, str) and os.path.isfile(value):
+            path = os.path.abspath(value)
+            if os.path.commonpath([path, work_dir]) != work_dir:
+                raise ValueError(f"{value} is outside the job workspace")
+            relative = os.path.relpath(path, work_dir)
+            files[relative] = path
+            return {FILE_MARKER: relative}
+        if isinstance(value, list):
+            return [self._relative(item, work_dir, files) for item in value]
+        if isinstance(value, dict):
+            return {
+                key: self._relative(item, work_dir, files)
+                for key, item in value.items()
+            }
+        return value
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its quota."""
+        with self._lock:
+            total = self._db().execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM entries"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._db().execute(
+                "SELECT key, bytes FROM entries ORDER BY last_used"
+            ).fetchall()
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            self._remove(row["key"])
+            total -= row["bytes"]
+            logger.info(f"Evicted artifact cache entry {row['key']}")
+
+    def _remove(self, key: str):
+        with self._lock, self._db():
+            self._db().execute("DELETE FROM entries WHERE key = ?", (key,))
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def stats(self) -> dict:
+        stages = {}
+        for stage, counters in self.counters.items():
+            lookups = counters["hits"] + counters["misses"]
+            stages[stage] = {
+                **counters,
+                "seconds_saved": round(counters["seconds_saved"], 2),
+                "hit_rate": round(counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+        size = entries = 0
+        if self.enabled and self._conn is not None:
+            with self._lock:
+                entries, size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries"
+                ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "stages": stages,
+        }
+
+
+artifact_cache = ArtifactCache()
@@ -8,49 +8,56 @@ import asyncio
 import re
 import logging
 from config.logger import get_logger
+from config.timeouts import OPENAI_TIMEOUT_SECONDS
+from helpers.cancellation import call_timeout
+from helpers.provider_stats import provider_stats
+from video_creation.create_video import require_file
+from modules.gen_story import SENTENCES_PER_DURATION
 import time
 from pathlib import Path
 from typing import Optional, List, Tuple
 
 load_dotenv()
 
-client = OpenAI()
+client = OpenAI(timeout=OPENAI_TIMEOUT_SECONDS)
 client.api_key = os.getenv("OPENAI_API_KEY")
 
 logger = get_logger(__name__)
 
 
-async def subtitle_gen_aud_to_story(audio_text: str, duration: int = 45):
+async def subtitle_gen_aud_to_story(
+    audio_text: str,
+    duration: int = 45,
+    output_path: str = "prompts/subtitle_gen_prompts.txt",
+    cancel=None,
+):
     try:
         # Define number of sentences based on duration
-        if duration == 45:
-            num_of_sentences = 7
-        elif duration == 60:
-            num_of_sentences = 11
-        elif duration == 75:
-            num_of_sentences = 14
-        else:
+        num_of_sentences = SENTENCES_PER_DURATION.get(duration)
+        if not num_of_sentences:
             logger.info("Invalid duration")
             return
 
         # Function to request story generation
         def request_story():
-            completion = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a subtitle generator."},
-                    {
-                        "role": "user",
-                        "content": (
-                            f"Break the following text into exactly {num_of_sentences} sentences. "
-                            f"Ensure no changes are made to the content or language. "
-                            f"Maintain the natural flow and punctuation of the text. "
-                            f"Each sentence must be cohesive, grammatically correct, and exactly as it appears. "
-                            f"Text:\n\n'{audio_text}'"
-                        ),
-                    },
-                ],
-            )
+            with provider_stats.track("openai"):
+                completion = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": "You are a subtitle generator."},
+                        {
+                            "role": "user",
+                            "content": (
+                                f"Break the following text into exactly {num_of_sentences} sentences. "
+                                f"Ensure no changes are made to the content or language. "
+                                f"Maintain the natural flow and punctuation of the text. "
+                                f"Each sentence must be cohesive, grammatically correct, and exactly as it appears. "
+                                f"Text:\n\n'{audio_text}'"
+                            ),
+                        },
+                    ],
+                    timeout=call_timeout(cancel, OPENAI_TIMEOUT_SECONDS),
+                )
             return completion.choices[0].message.content
 
         # Generate the story with a retry mechanism
@@ -58,7 +65,7 @@ async def subtitle_gen_aud_to_story(audio_text: str, duration: int = 45):
         retries = 0
 
         while retries < max_retries:
-            story = request_story()
+            story = await asyncio.to_thread(request_story)
 
             # Split the story into sentences
             sentences = story.split(". ")
@@ -82,32 +89,34 @@ async def subtitle_gen_aud_to_story(audio_text: str, duration: int = 45):
             return
 
         # Write each sentence on a new line in the file
-        with open("prompts/subtitle_gen_prompts.txt", "w") as f:
+        with open(output_path, "w") as f:
             for sentence in sentences:
                 f.write(sentence + "\n")
 
-        logger.info("Story successfully written to subtitle_gen_prompts.txt")
+        logger.info(f"Story successfully written to {output_path}")
 
     except Exception as e:
         logger.error(f"Error: {e}")
 
 
 # Generate story-prompts to which are going to be used to gen images
-async def image_gen_aud_to_story(audio_text: str, duration: int = 45):
+async def image_gen_aud_to_story(
+    audio_text: str,
+    duration: int = 45,
+    output_path: str = "prompts/img_gen_prompts.txt",
+    cancel=None,
+):
     try:
         # Define number of sentences based on duration
-        if duration == 45:
-            num_of_sentences = 7
-        elif duration == 60:
-            num_of_sentences = 11
-        elif duration == 75:
-            num_of_sentences = 14
-        else:
+        num_of_sentences = SENTENCES_PER_DURATION.get(duration)
+        if not num_of_sentences:
             logger.error("Invalid duration")
             return
 
         # Request a full story with the required number of sentences
-        completion = client.chat.completions.create(
+        completion = await asyncio.to_thread(
+            provider_stats.tracked("openai", client.chat.completions.create),
+            timeout=call_timeout(cancel, OPENAI_TIMEOUT_SECONDS),
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a storyteller."},
@@ -139,23 +148,42 @@ async def image_gen_aud_to_story(audio_text: str, duration: int = 45):
                 sentences.append(sentence)
 
         # Write up to the specified number of sentences (e.g., 10)
-        with open("prompts/img_gen_prompts.txt", "w") as f:
+        with open(output_path, "w") as f:
             for i in range(min(num_of_sentences, len(sentences))):
                 f.write(sentences[i] + ".\n")
 
-        logger.info("Story successfully written to img_gen_prompts.txt")
+        logger.info(f"Story successfully written to {output_path}")
 
     except Exception as e:
         logger.error(f"Error: {e}")
 
 
-async def audio_to_story(audio_text: str, duration: int):
+async def audio_to_story(audio_text: str, duration: int, job):
     """Generate subtitles and image prompts concurrently"""
     start_time = time.time()
 
     # Run story generation tasks concurrently
-    subtitle_task = asyncio.create_task(subtitle_gen_aud_to_story(audio_text, duration))
+    subtitle_task = asyncio.create_task(
+        subtitle_from_audio_stage(job, audio_text, duration)
+    )
     image_prompt_task = asyncio.create_task(
-        image_gen_aud_to_story(audio_text, duration)
+        image_story_from_audio_stage(job, audio_text, duration)
     )
     await asyncio.gather(subtitle_task, image_prompt_task)
+
+
+# Pipeline stages
+async def subtitle_from_audio_stage(job, audio_text: str, duration: int):
+    await subtitle_gen_aud_to_story(
+        audio_text, duration, job.subtitle_prompts_path, job.cancel_token
+    )
+    require_file(job.subtitle_prompts_path, "Subtitle story generation failed")
+    return {"subtitle_prompts": job.subtitle_prompts_path}
+
+
+async def image_story_from_audio_stage(job, audio_text: str, duration: int):
+    await image_gen_aud_to_story(
+        audio_text, duration, job.img_prompts_path, job.cancel_token
+    )
+    require_file(job.img_prompts_path, "Image story generation failed")
+    return {"img_prompts": job.img_prompts_path}
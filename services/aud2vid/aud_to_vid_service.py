@@ -13,14 +13,70 @@ from modules.gen_image import read_prompts, generate_images_from_prompts
 from video_creation.create_video import create_video 
 from helpers.aws_uploader import upload_to_s3
 from helpers.clean_video_folder import clean_video_folder
+from services.job_context import JobContext
 
 from config.logger import get_logger 
 
 logger = get_logger(__name__)
 
-from services.image_service import generate_images
-from services.story_service import generate_story_content
-from services.aud2vid.aud_to_story import audio_to_story
+from services.image_service import generate_images, images_stage
+from services.aud2vid.aud_to_story import (
+    audio_to_story,
+    subtitle_from_audio_stage,
+    image_story_from_audio_stage,
+)
+from services.pipeline import Pipeline, Stage
+from services.video_service import audio_stage
+from video_creation.create_video import VIDEO_STAGES
+
+
+# Same graph as VIDEO_PIPELINE, with the story taken from transcribed audio
+AUD2VID_PIPELINE = Pipeline(
+    [
+        Stage(
+            "subtitle_story",
+            subtitle_from_audio_stage,
+            inputs=["audio_text", "duration"],
+            outputs=["subtitle_prompts"],
+            files=["subtitle_prompts"],
+            resource="api",
+            cache=True,
+        ),
+        Stage(
+            "image_story",
+            image_story_from_audio_stage,
+            inputs=["audio_text", "duration"],
+            outputs=["img_prompts"],
+            files=["img_prompts"],
+            resource="api",
+            cache=True,
+        ),
+        Stage(
+            "audio",
+            audio_stage,
+            inputs=[
+                "subtitle_prompts",
+                "voice_character",
+                "voice_files",
+                "voice_id",
+            ],
+            outputs=["audio"],
+            files=["audio"],
+            resource="api",
+            cache=True,
+        ),
+        # No resource: images_stage holds an "api" slot only for Leonardo
+        Stage(
+            "images",
+            images_stage,
+            inputs=["img_prompts", "style", "aspect_ratio"],
+            outputs=["images", "clips"],
+            files=["images", "clips"],
+            cache=True,
+        ),
+        *VIDEO_STAGES,
+    ]
+)
 
 
 async def generate_aud2vid(
@@ -31,96 +87,31 @@ async def generate_aud2vid(
     bgm_audio,
     voice_character: str = "callum",
     voice_files: Optional[List[str]] = None,
-):
-    """Main function to handle video generation process"""
-    total_start_time = time.time()
-    cloned_voice_id = None
-
-    try:
-        # 1. Generate story content from audio
-        await audio_to_story(audio_text, duration)
-
-        # 2. Generate audio and images concurrently
-        audio_task = process_voice(voice_character, voice_files)
-        images_task = generate_images(style, aspect_ratio)
-
-        # Wait for both tasks to complete
-        (audio_success, audio_path, cloned_voice_id), _ = await asyncio.gather(
-            audio_task, images_task
-        )
-
-        if not audio_success:
-            raise Exception(f"Audio generation failed: {audio_path}")
-
-        # 3. Create final video
-        start_time = time.time()
-        await create_video(
-            output_video_duration=duration,
-            bgm_audio=bgm_audio,
-            aspect_ratio=aspect_ratio,
-        )
-
-
-    except Exception as e:
-        logger.error(f"Error in video generation: {str(e)}", exc_info=True)
-        raise
-    finally:
-        # Always clean up cloned voice if it exists
-        if cloned_voice_id:
-            logger.info(f"Cleaning up cloned voice: {cloned_voice_id}")
-            if delete_cloned_voice(cloned_voice_id):
-                logger.info("Successfully deleted cloned voice")
-            else:
-                logger.error("Failed to delete cloned voice")
-
-
-async def process_voice(
-    voice_character: str, voice_samples: Optional[List[str]] = None
-) -> Tuple[bool, str, Optional[str]]:
+    voice_id: Optional[str] = None,
+    job: Optional[JobContext] = None,
+) -> str:
     """
-    Generate audio using either default voice or cloned voice
-    Returns: (success, result_path, cloned_voice_id)
+    Main function to handle video generation process.
+    Runs inside the job's own workspace and returns the final video path.
     """
-    start_time = time.time()
-    cloned_voice_id = None
+    job = job or JobContext()
 
     try:
-        if voice_samples:
-            cloned_voice_id = create_voice_clone(
-                voice_samples=voice_samples, voice_name="temp_voice_clone"
-            )
-
-            if not cloned_voice_id:
-                raise Exception("Voice cloning failed")
-
-            logger.info(f"Voice clone created with ID: {cloned_voice_id}")
-
-            # Use cloned voice for generation
-            success, result = generate_audio(
-                character="clone",
-                voice_samples=voice_samples,
-                output_path="video_creation/assets/audio/combined_story_audio.wav",
-            )
-        else:
-            # Validate default voice
-            if voice_character.lower() not in DEFAULT_VOICES:
-                raise Exception(f"Invalid voice character: {voice_character}")
-
-            # Use default voice
-            success, result = generate_audio(
-                character=voice_character,
-                output_path="video_creation/assets/audio/combined_story_audio.wav",
-            )
-
-
-        if not success:
-            raise Exception(f"Audio generation failed: {result}")
-
-        return success, result, cloned_voice_id
+        values = await AUD2VID_PIPELINE.run(
+            job,
+            {
+                "audio_text": audio_text,
+                "duration": duration,
+                "aspect_ratio": aspect_ratio,
+                "style": style,
+                "bgm_audio": bgm_audio,
+                "voice_character": voice_character,
+                "voice_files": voice_files,
+                "voice_id": voice_id,
+            },
+        )
+        return values["final_video"]
 
     except Exception as e:
-        logger.error(f"Error in audio generation: {str(e)}")
-        # Clean up cloned voice if there was an error
-        if cloned_voice_id:
-            delete_cloned_voice(cloned_voice_id)
+        logger.error(f"Error in video generation: {str(e)}", exc_info=True)
         raise
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from config.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Which broker render tasks go through (see get_broker)
+BROKER_BACKEND = os.getenv("BROKER_BACKEND", "sqlite")
+# SQLite broker database; must be on the volume shared with render workers
+BROKER_DB_PATH = os.getenv("BROKER_DB_PATH", "video_creation/assets/jobs/broker.db")
+# A claimed task whose worker stopped heart-beating for this long is re-queued
+BROKER_LEASE_SECONDS = int(os.getenv("BROKER_LEASE_SECONDS", "120"))
+BROKER_MAX_ATTEMPTS = int(os.getenv("BROKER_MAX_ATTEMPTS", "3"))
+BROKER_POLL_INTERVAL = float(os.getenv("BROKER_POLL_INTERVAL", "1"))
+
+
+class Broker(ABC):
+    """
+    Task queue between the API process and render workers.
+
+    Tasks are JSON payloads identified by `kind`; a worker claims one,
+    runs it and reports a JSON result or an error. Implementations must
+    be safe to use from several processes (and machines) at once.
+    """
+
+    @abstractmethod
+    def submit(self, kind: str, payload: dict, priority: Optional[float] = None) -> str:
+        """Queue a task; lower `priority` keys are claimed first (default: FIFO)."""
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """Take the most urgent queued task, or None if there is nothing to do."""
+
+    @abstractmethod
+    def heartbeat(self, task_id: str, worker_id: str):
+        """Extend the lease of a task the worker is still running."""
+
+    @abstractmethod
+    def complete(self, task_id: str, result: dict):
+        """Record the result of a task the worker finished."""
+
+    @abstractmethod
+    def fail(self, task_id: str, error: str):
+        """Record the error of a task the worker gave up on."""
+
+    @abstractmethod
+    def cancel(self, task_id: str):
+        """Drop a task nobody is waiting for any more."""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[dict]:
+        """The task with its state, result and error, or None if unknown."""
+
+    async def wait(self, task_id: str, poll_interval: float = BROKER_POLL_INTERVAL) -> dict:
+        """Wait until a task is done and return its result (raises if it failed)."""
+        try:
+            while True:
+                task = await asyncio.to_thread(self.get, task_id)
+                if task is None:
+                    raise Exception(f"Render task {task_id} disappeared")
+                if task["state"] == "done":
+                    return task["result"]
+                if task["state"] in ("failed", "cancelled"):
+                    raise Exception(
+                        f"Render task {task_id} {task['state']}: {task['error']}"
+                    )
+                await asyncio.sleep(poll_interval)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.cancel, task_id)
+            raise
+
+    async def run(
+        self, kind: str, payload: dict, priority: Optional[float] = None
+    ) -> dict:
+        """Submit a task and wait for its result."""
+        task_id = await asyncio.to_thread(self.submit, kind, payload, priority)
+        return await self.wait(task_id)
+
+
+class SQLiteBroker(Broker):
+    """
+    Broker backed by a single SQLite file. Needs no outside services: the
+    API and every render worker only have to share the volume it lives on.
+    """
+
+    def __init__(
+        self,
+        path: str = BROKER_DB_PATH,
+        lease_seconds: int = BROKER_LEASE_SECONDS,
+        max_attempts: int = BROKER_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                priority REAL NOT NULL,
+                worker_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                claimed_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, priority)"
+        )
+
+    def _execute(self, sql: str, params=()) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def submit(self, kind: str, payload: dict, priority: Optional[float] = None) -> str:
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        priority = now if priority is None else priority
+        self._execute(
+            "INSERT INTO tasks (task_id, kind, payload, state, priority, created_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?)",
+            (task_id, kind, json.dumps(payload), priority, now),
+        )
+        return task_id
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so two workers can never
+            # claim the same task
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire_leases(now)
+                row = self._conn.execute(
+                    "SELECT * FROM tasks WHERE state = 'queued' "
+                    "ORDER BY priority, created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE tasks SET state = 'claimed', worker_id = ?, "
+                        "claimed_at = ?, attempts = attempts + 1 WHERE task_id = ?",
+                        (worker_id, now, row["task_id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if not row:
+            return None
+        task = self._row_to_task(row)
+        task["state"] = "claimed"
+        task["worker_id"] = worker_id
+        return task
+
+    def _expire_leases(self, now: float):
+        """Give tasks of workers that died back to the queue (or fail them)."""
+        expired = now - self.lease_seconds
+        self._conn.execute(
+            "UPDATE tasks SET state = 'failed', finished_at = ?, "
+            "error = 'Render worker lost too many times' "
+            "WHERE state = 'claimed' AND claimed_at < ? AND attempts >= ?",
+            (now, expired, self.max_attempts),
+        )
+        requeued = self._conn.execute(
+            "UPDATE tasks SET state = 'queued', worker_id = NULL "
+            "WHERE state = 'claimed' AND claimed_at < ?",
+            (expired,),
+        ).rowcount
+        if requeued:
+            logger.warning(f"Re-queued {requeued} render task(s) with expired leases")
+
+    def heartbeat(self, task_id: str, worker_id: str):
+        self._execute(
+            "UPDATE tasks SET claimed_at = ? "
+            "WHERE task_id = ? AND worker_id = ? AND state = 'claimed'",
+            (time.time(), task_id, worker_id),
+        )
+
+    def complete(self, task_id: str, result: dict):
+        self._execute(
+            "UPDATE tasks SET state = 'done', result = ?, finished_at = ? "
+            "WHERE task_id = ? AND state = 'claimed'",
+            (json.dumps(result), time.time(), task_id),
+        )
+
+    def fail(self, task_id: str, error: str):
+        self._execute(
+            "UPDATE tasks SET state = 'failed', error = ?, finished_at = ? "
+            "WHERE task_id = ? AND state = 'claimed'",
+            (error, time.time(), task_id),
+        )
+
+    def cancel(self, task_id: str):
+        self._execute(
+            "UPDATE tasks SET state = 'cancelled', finished_at = ? "
+            "WHERE task_id = ? AND state IN ('queued', 'claimed')",
+            (time.time(), task_id),
+        )
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        return self._row_to_task(row) if row else None
+
+    @staticmethod
+    def _row_to_task(row) -> dict:
+        task = dict(row)
+        task["payload"] = json.loads(task["payload"])
+        task["result"] = json.loads(task["result"]) if task["result"] else None
+        return task
+
+
+BROKERS = {
+    "sqlite": SQLiteBroker,
+}
+
+_broker: Optional[Broker] = None
+
+
+def get_broker() -> Broker:
+    """The process-wide broker selected by BROKER_BACKEND (created lazily)."""
+    global _broker
+    if _broker is None:
+        if BROKER_BACKEND not in BROKERS:
+            raise ValueError(f"Unknown broker backend: {BROKER_BACKEND}")
+        _broker = BROKERS[BROKER_BACKEND]()
+    return _broker
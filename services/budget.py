@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from helpers.cancellation import BudgetExceeded
+
+# Time budget of a whole job, from the moment a worker starts it. A job
+# submitted with an earlier deadline gets only the time until then.
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "1200"))
+
+# Share of the job's budget each stage may use at most, counted from when
+# it starts (once it holds its scheduler slot, for stages with a resource
+# class). Shares add up to more than 1 since stages on parallel branches
+# overlap; every stage is also cut off at the job's deadline.
+STAGE_BUDGETS = {
+    "subtitle_story": 0.15,
+    "image_story": 0.15,
+    "transcription": 0.15,
+    "audio": 0.35,
+    "images": 0.5,
+    "clips": 0.35,
+    "transcript": 0.15,
+    "merge": 0.2,
+    "subtitles": 0.35,
+    "bgm": 0.15,
+    "upload": 0.15,
+}
+DEFAULT_STAGE_BUDGET = 0.25
+
+
+def job_deadline(started_at: float, deadline: Optional[float] = None) -> float:
+    """Absolute time by which a job started at `started_at` must finish."""
+    job_end = started_at + JOB_TIMEOUT_SECONDS
+    return min(job_end, deadline) if deadline else job_end
+
+
+def stage_deadline(job, name: str) -> Optional[float]:
+    """Deadline of stage `name` of `job` (a JobContext) starting now."""
+    if job.deadline is None:
+        return None
+    share = STAGE_BUDGETS.get(name, DEFAULT_STAGE_BUDGET)
+    return min(time.time() + share * job.budget, job.deadline)
+
+
+async def run_with_budget(job, name: str, func, /, *args, **kwargs):
+    """
+    Await `func(stage_job, *args, **kwargs)` within the budget of stage
+    `name`. `stage_job` is the job with a cancel token expiring at the
+    stage deadline, which ffmpeg runs, TTS loops and HTTP timeouts below
+    it obey. When the budget runs out the call is cancelled (releasing any
+    scheduler slot it holds) and BudgetExceeded is raised.
+    """
+    deadline = stage_deadline(job, name)
+    if deadline is None:
+        return await func(job, *args, **kwargs)
+
+    start_time = time.time()
+    scope = f"Stage '{name}'"
+    try:
+        return await asyncio.wait_for(
+            func(job.scoped(deadline, scope), *args, **kwargs),
+            timeout=max(deadline - time.time(), 0),
+        )
+    except Exception as e:
+        # Whatever broke once the deadline passed (an HTTP timeout cut to
+        # the time left, a killed ffmpeg), the budget is the real cause
+        if time.time() < deadline or isinstance(e, BudgetExceeded):
+            raise
+        raise BudgetExceeded(
+            f"{scope} exceeded its time budget ({deadline - start_time:.0f}s)"
+        ) from e
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+from config.logger import get_logger, log_time_taken
+from modules.gen_audio import create_voice_clone, delete_cloned_voice
+from services.job_context import JOB_WORKSPACE_ROOT
+from services.job_manager import Job, JobManager, job_manager
+from services.scheduler import scheduler
+from video_creation.create_video import bg_music_dir
+from video_creation.subtitle_processing import FONT
+
+logger = get_logger(__name__)
+
+# Campaign scratch space (uploaded voice samples until they're cloned)
+CAMPAIGN_ROOT = os.path.join(JOB_WORKSPACE_ROOT, "campaigns")
+# How long a finished campaign (and its jobs) can still be looked up; its
+# items' statuses stay available through /jobs afterwards
+CAMPAIGN_RETENTION_SECONDS = int(os.getenv("CAMPAIGN_RETENTION_SECONDS", "3600"))
+
+
+class Campaign:
+    """
+    A batch of videos generated from a list of prompts with shared settings
+    (style, voice, aspect ratio, duration, bgm). Shared assets are prepared
+    once for the whole batch: the voice is cloned once and reused by every
+    job, and the bgm track and subtitle font are checked once up front.
+    """
+
+    def __init__(self, prompts: List[str], settings: dict, user_id: str = ""):
+        self.campaign_id = uuid.uuid4().hex
+        self.prompts = prompts
+        self.settings = settings
+        self.user_id = user_id
+        self.jobs: List[Job] = []
+        self.voice_id: Optional[str] = None  # cloned for this campaign
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._finisher: Optional[asyncio.Task] = None
+
+    def item(self, index: int) -> dict:
+        job = self.jobs[index]
+        elapsed = (
+            job.finished_at - job.started_at
+            if job.finished_at and job.started_at
+            else None
+        )
+        return {
+            "index": index,
+            "prompt": self.prompts[index],
+            "job_id": job.job_id,
+            "state": job.state,
+            "result_url": job.result_url,
+            "error": job.error,
+            "elapsed": round(elapsed, 2) if elapsed is not None else None,
+        }
+
+    def summary(self) -> dict:
+        states = [job.state for job in self.jobs]
+        finished = (
+            states.count("succeeded") + states.count("failed") + states.count("cancelled")
+        )
+        elapsed = (self.finished_at or time.time()) - self.created_at
+        return {
+            "campaign_id": self.campaign_id,
+            "items": len(self.jobs),
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+            "succeeded": states.count("succeeded"),
+            "failed": states.count("failed"),
+            "cancelled": states.count("cancelled"),
+            "elapsed": round(elapsed, 2),
+            # Aggregate throughput of the batch so far
+            "videos_per_hour": (
+                round(finished / elapsed * 3600, 2) if elapsed else 0.0
+            ),
+            "estimated_cost": sum(job.cost for job in self.jobs),
+            "done": finished == len(self.jobs),
+        }
+
+
+class CampaignManager:
+    """Plans campaigns onto the job manager and tracks their progress."""
+
+    def __init__(self, manager: JobManager = job_manager):
+        self.manager = manager
+        self.campaigns: Dict[str, Campaign] = {}
+
+    @staticmethod
+    def check_shared_assets(bgm_audio: str):
+        """Validate assets every item uses once, instead of failing per job."""
+        if bgm_audio and not os.path.exists(
+            os.path.join(bg_music_dir, f"{bgm_audio}.mp3")
+        ):
+            raise ValueError(f"Background music not found: {bgm_audio}")
+        if not os.path.exists(FONT):
+            raise ValueError(f"Subtitle font not found: {FONT}")
+
+    async def start(
+        self,
+        prompts: List[str],
+        settings: dict,
+        user_id: str = "",
+        priority: str = "batch",
+        voice_samples: Optional[List[bytes]] = None,
+        callback_url: Optional[str] = None,
+    ) -> Campaign:
+        """Prepare shared assets and queue one job per prompt."""
+        self.check_shared_assets(settings.get("bgm_audio", ""))
+        # All or nothing: don't clone a voice for a batch that can't be queued
+        self.manager.admit()
+        self.manager.check_quota(user_id, len(prompts))
+        campaign = Campaign(prompts, settings, user_id)
+
+        if voice_samples:
+            campaign.voice_id = await self._clone_voice(campaign, voice_samples)
+
+        # Items coalesced into other requests' jobs aren't the campaign's to cancel
+        known = set(self.manager.jobs)
+        try:
+            for prompt in prompts:
+                params = {**settings, "prompt": prompt}
+                if campaign.voice_id:
+                    params["voice_id"] = campaign.voice_id
+                # Admitted as a whole: the batch's own jobs mustn't refuse the rest
+                job = self.manager.submit(
+                    "video",
+                    params,
+                    user_id,
+                    priority=priority,
+                    callback_url=callback_url,
+                    admitted=True,
+                )
+                # Results are streamed, but the batch keeps running without a reader
+                job.detached = True
+                campaign.jobs.append(job)
+        except BaseException:
+            # A batch that can't be queued whole isn't started at all
+            for job in campaign.jobs:
+                if job.job_id not in known:
+                    self.manager.cancel(job.job_id)
+            if campaign.voice_id:
+                logger.info(f"Cleaning up campaign voice: {campaign.voice_id}")
+                await asyncio.to_thread(delete_cloned_voice, campaign.voice_id)
+            raise
+
+        self.campaigns[campaign.campaign_id] = campaign
+        logger.info(
+            f"Campaign {campaign.campaign_id} queued {len(prompts)} videos "
+            f"(estimated {sum(job.cost for job in campaign.jobs):.0f}s of work)"
+        )
+        campaign._finisher = asyncio.create_task(self._finish(campaign))
+        return campaign
+
+    async def _clone_voice(self, campaign: Campaign, voice_samples: List[bytes]) -> str:
+        """Clone the uploaded voice once for every item of the campaign."""
+        samples_dir = os.path.join(CAMPAIGN_ROOT, campaign.campaign_id)
+        os.makedirs(samples_dir, exist_ok=True)
+        try:
+            paths = []
+            for i, sample in enumerate(voice_samples, start=1):
+                path = os.path.join(samples_dir, f"sample_{i}.mp3")
+                with open(path, "wb") as f:
+                    f.write(sample)
+                paths.append(path)
+
+            async with scheduler.slot("api"):
+                voice_id = await asyncio.to_thread(
+                    create_voice_clone,
+                    voice_samples=paths,
+                    voice_name=f"campaign_{campaign.campaign_id}",
+                )
+            if not voice_id:
+                raise Exception("Voice cloning failed")
+            return voice_id
+        finally:
+            shutil.rmtree(samples_dir, ignore_errors=True)
+
+    async def _finish(self, campaign: Campaign):
+        """
+        Release shared assets once every item has finished, and forget the
+        campaign CAMPAIGN_RETENTION_SECONDS later.
+        """
+        # Also done when items are handed off to another instance on shutdown
+        await asyncio.gather(*(job.done.wait() for job in campaign.jobs))
+        campaign.finished_at = time.time()
+        log_time_taken(
+            f"Campaign {campaign.campaign_id}", campaign.created_at, campaign.finished_at
+        )
+        if campaign.voice_id and any(job.handed_off for job in campaign.jobs):
+            # The instances resuming those items still narrate with it
+            logger.info(f"Keeping voice of handed-off campaign: {campaign.voice_id}")
+        elif campaign.voice_id:
+            logger.info(f"Cleaning up campaign voice: {campaign.voice_id}")
+            await asyncio.to_thread(delete_cloned_voice, campaign.voice_id)
+
+        await asyncio.sleep(CAMPAIGN_RETENTION_SECONDS)
+        self.campaigns.pop(campaign.campaign_id, None)
+
+    async def results(self, campaign: Campaign) -> AsyncIterator[dict]:
+        """Yield each item as soon as it finishes, then the campaign summary."""
+        waiters = {
+            asyncio.ensure_future(job.done.wait()): index
+            for index, job in enumerate(campaign.jobs)
+        }
+        try:
+            while waiters:
+                done, _ = await asyncio.wait(
+                    waiters, return_when=asyncio.FIRST_COMPLETED
+                )
+                for waiter in done:
+                    item = campaign.item(waiters.pop(waiter))
+                    item["progress"] = campaign.summary()
+                    yield item
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+        yield {"summary": campaign.summary()}
+
+    def get(self, campaign_id: str) -> Optional[Campaign]:
+        return self.campaigns.get(campaign_id)
+
+
+campaign_manager = CampaignManager()
@@ -0,0 +1,88 @@
+import os
+import time
+from collections import Counter
+from typing import List
+
+from helpers.disk_cache import cache_stats
+from helpers.provider_stats import provider_stats
+from services.artifact_cache import artifact_cache
+from services.job_manager import JOB_WORKERS, JobManager, job_manager
+from services.scheduler import scheduler
+
+# Past any of these the instance reports itself saturated: /ready fails so
+# the load balancer sends new work elsewhere, and new jobs are refused
+# (JobManager.admit) instead of queueing until latency collapses
+READY_MAX_BACKLOG = int(os.getenv("READY_MAX_BACKLOG", str(JOB_WORKERS * 10)))
+READY_MAX_QUEUE_WAIT = float(os.getenv("READY_MAX_QUEUE_WAIT", "900"))
+# 1-minute load average per CPU (0 to ignore the load)
+READY_MAX_LOAD = float(os.getenv("READY_MAX_LOAD", "4"))
+
+
+def load_per_cpu() -> float:
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+
+def saturation(manager: JobManager = job_manager) -> List[str]:
+    """Names of the limits the instance is past; empty unless saturated."""
+    jobs = manager.queue_stats()
+    queued = [job for job in manager.jobs.values() if job.state == "queued"]
+    oldest_wait = max((time.time() - job.created_at for job in queued), default=0.0)
+
+    saturated = []
+    if jobs["queued"] >= READY_MAX_BACKLOG:
+        saturated.append("backlog")
+    if oldest_wait >= READY_MAX_QUEUE_WAIT:
+        saturated.append("queue_wait")
+    if READY_MAX_LOAD and load_per_cpu() >= READY_MAX_LOAD:
+        saturated.append("load")
+    return saturated
+
+
+def capacity_report(manager: JobManager = job_manager) -> dict:
+    """
+    Load of this instance for autoscaling: job backlog, running jobs by
+    stage, resource slot utilisation, provider error rates, cache
+    hit rates, and `capacity_remaining`, the number of further jobs the
+    instance takes before it is saturated (0 when saturated).
+    """
+    now = time.time()
+    jobs = manager.queue_stats()
+    queued = [job for job in manager.jobs.values() if job.state == "queued"]
+    stages = Counter(
+        job.stage for job in manager.jobs.values() if job.state == "running"
+    )
+    oldest_wait = max((now - job.created_at for job in queued), default=0.0)
+    load = load_per_cpu()
+    saturated = saturation(manager)
+
+    slots = scheduler.stats()
+    for name, resource in scheduler.classes.items():
+        slots[name]["utilisation"] = round(resource.running / resource.limit, 3)
+
+    capacity_remaining = 0
+    if not saturated and not manager.draining:
+        capacity_remaining = max(
+            manager.workers + READY_MAX_BACKLOG - jobs["running"] - jobs["queued"], 0
+        )
+    return {
+        "status": (
+            "draining" if manager.draining else "saturated" if saturated else "ready"
+        ),
+        "saturated": saturated,
+        "capacity_remaining": capacity_remaining,
+        # (running + queued) / workers: above 1 the instance has a backlog
+        "utilisation": round((jobs["running"] + jobs["queued"]) / manager.workers, 3),
+        "jobs": {
+            **jobs,
+            "by_stage": dict(stages),
+            "oldest_queued_wait": round(oldest_wait, 2),
+        },
+        "slots": slots,
+        "load_per_cpu": round(load, 3),
+        "providers": provider_stats.stats(),
+        "artifact_cache": artifact_cache.stats(),
+        "caches": cache_stats(),
+    }
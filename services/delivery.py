@@ -0,0 +1,86 @@
+import os
+import re
+import shutil
+import time
+from typing import Optional
+
+from config.logger import get_logger
+from helpers.aws_uploader import upload_to_s3
+
+logger = get_logger(__name__)
+
+# "s3" uploads finished videos and hands out presigned URLs; "local" keeps
+# them on this server, served by GET /videos/{job_id}.mp4 (routes/videos.py)
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "s3")
+# Where locally delivered videos are kept; must be a volume shared by all
+# instances when several serve the same clients
+DELIVERY_ROOT = os.getenv("DELIVERY_ROOT", "video_creation/assets/deliveries")
+# How long a locally delivered video can be downloaded, like the 1 hour
+# expiry of the presigned S3 URLs
+DELIVERY_TTL_SECONDS = int(os.getenv("DELIVERY_TTL_SECONDS", "3600"))
+# Prefix for absolute video URLs, e.g. "https://videos.example.com";
+# URLs are relative to this server without one
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+# Internal nginx location aliasing DELIVERY_ROOT. When set, downloads are
+# answered with X-Accel-Redirect so nginx sends the file itself (sendfile,
+# Range requests) instead of the app
+DELIVERY_ACCEL_PREFIX = os.getenv("DELIVERY_ACCEL_PREFIX", "").rstrip("/")
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def deliver(video_file: str, duration: int, job_id: str) -> str:
+    """Make a job's final video available and return its URL."""
+    if DELIVERY_MODE == "local":
+        return deliver_local(video_file, job_id)
+    return upload_to_s3(video_file, duration, job_id)
+
+
+def deliver_local(video_file: str, job_id: str) -> str:
+    """Move the video out of the job workspace (which is removed) into DELIVERY_ROOT."""
+    os.makedirs(DELIVERY_ROOT, exist_ok=True)
+    path = os.path.join(DELIVERY_ROOT, f"{job_id}.mp4")
+    # The workspace may be on another volume: move next to the target
+    # first, so the video appears under its name only once complete
+    partial = f"{path}.part"
+    shutil.move(video_file, partial)
+    os.replace(partial, path)
+    os.utime(path)  # the TTL counts from delivery
+    logger.info(f"Delivered {video_file} to {path}")
+    return f"{PUBLIC_BASE_URL}/videos/{job_id}.mp4"
+
+
+def delivered_video(job_id: str) -> Optional[str]:
+    """Path of a job's locally delivered video, or None if missing or expired."""
+    if not JOB_ID.fullmatch(job_id):
+        return None
+    path = os.path.join(DELIVERY_ROOT, f"{job_id}.mp4")
+    try:
+        delivered_at = os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
+    if time.time() - delivered_at >= DELIVERY_TTL_SECONDS:
+        _remove(path)
+        return None
+    return path
+
+
+def expire_deliveries():
+    """Remove locally delivered videos older than DELIVERY_TTL_SECONDS."""
+    if not os.path.isdir(DELIVERY_ROOT):
+        return
+    expire_before = time.time() - DELIVERY_TTL_SECONDS
+    for entry in os.scandir(DELIVERY_ROOT):
+        try:
+            if entry.stat().st_mtime < expire_before:
+                _remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+        logger.info(f"Expired delivered video: {path}")
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import itertools
+import os
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional
+
+# Jobs of one user running at the same time on an instance
+USER_MAX_RUNNING = int(os.getenv("USER_MAX_RUNNING", "2"))
+# Jobs one user may submit per rolling hour (0 for no limit)
+USER_JOBS_PER_HOUR = int(os.getenv("USER_JOBS_PER_HOUR", "30"))
+# Estimated seconds of work (see services/priority.py) a user is credited
+# with per round when the queue is shared
+FAIR_QUANTUM_SECONDS = float(os.getenv("FAIR_QUANTUM_SECONDS", "60"))
+
+QUOTA_WINDOW_SECONDS = 3600
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user submits more jobs than their quota allows."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after  # seconds until the jobs would fit
+
+
+class _Rounds:
+    """Per-user heaps of queued jobs and their deficit round robin state."""
+
+    def __init__(self, quantum: float):
+        self.quantum = max(quantum, 1.0)
+        self.queues: Dict[str, list] = {}  # user -> heap of (key, seq, job)
+        self.deficits: Dict[str, float] = {}
+        self.order = deque()  # users with queued jobs, whose turn is first
+
+    def push(self, user: str, entry: tuple):
+        if user not in self.queues:
+            self.queues[user] = []
+            self.deficits[user] = 0.0
+            self.order.append(user)
+        heapq.heappush(self.queues[user], entry)
+
+    def prune(self):
+        """Drop jobs cancelled or handed off while they were queued."""
+        for user in list(self.order):
+            queue = self.queues[user]
+            while queue and (queue[0][2].state != "queued" or queue[0][2].handed_off):
+                heapq.heappop(queue)
+            if not queue:
+                self._remove(user)
+
+    def pop(self, eligible: Callable[[str], bool]):
+        """Next job of the users for which `eligible(user)` holds, or None."""
+        self.prune()
+        if not any(eligible(user) for user in self.order):
+            return None
+        while True:
+            user = self.order[0]
+            if not eligible(user):
+                # Skipped users don't build up credit
+                self.order.rotate(-1)
+                continue
+            queue = self.queues[user]
+            job = queue[0][2]
+            if self.deficits[user] < job.cost:
+                # Turn over: credit the user for the next round
+                self.deficits[user] += self.quantum
+                self.order.rotate(-1)
+                continue
+            heapq.heappop(queue)
+            self.deficits[user] -= job.cost
+            if not queue:
+                self._remove(user)
+            return job
+
+    def _remove(self, user: str):
+        # An idle user starts the next backlog without saved-up credit
+        del self.queues[user]
+        del self.deficits[user]
+        self.order.remove(user)
+
+    def copy(self) -> "_Rounds":
+        rounds = _Rounds(self.quantum)
+        rounds.queues = {user: list(queue) for user, queue in self.queues.items()}
+        rounds.deficits = dict(self.deficits)
+        rounds.order = deque(self.order)
+        return rounds
+
+
+class FairQueue:
+    """
+    Job queue shared fairly between users by deficit round robin: users
+    with queued jobs take turns, each turn adding FAIR_QUANTUM_SECONDS of
+    credit that the user's jobs spend by their estimated cost. A user
+    submitting 50 videos therefore gets the same share of the workers as
+    one submitting a single video, not 50 times as much. Within one user,
+    jobs are taken by priority key (see services/priority.py).
+
+    Users with `max_running` jobs running are skipped until one finishes;
+    `release` must be called for every job `get` returned.
+    """
+
+    def __init__(
+        self, quantum: float = FAIR_QUANTUM_SECONDS, max_running: int = USER_MAX_RUNNING
+    ):
+        self.max_running = max_running
+        self.running: Counter = Counter()  # user -> jobs taken, not released
+        self._rounds = _Rounds(quantum)
+        self._seq = itertools.count()  # tie-breaker for equal keys
+        self._wakeup = asyncio.Event()
+
+    def put(self, job):
+        self._rounds.push(job.user_id, (job.priority_key, next(self._seq), job))
+        self._wakeup.set()
+
+    async def get(self):
+        """Wait for the next job whose user is below the running cap."""
+        while True:
+            job = self._rounds.pop(self._below_cap)
+            if job:
+                self.running[job.user_id] += 1
+                return job
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def release(self, job):
+        """Mark a job taken by `get` as done, freeing its user's slot."""
+        self.running[job.user_id] -= 1
+        if self.running[job.user_id] <= 0:
+            del self.running[job.user_id]
+        self._wakeup.set()
+
+    def _below_cap(self, user: str) -> bool:
+        return self.running[user] < self.max_running
+
+    def qsize(self) -> int:
+        return sum(
+            1
+            for queue in self._rounds.queues.values()
+            for _, _, job in queue
+            if job.state == "queued" and not job.handed_off
+        )
+
+    def users(self) -> int:
+        """Users with queued jobs."""
+        self._rounds.prune()
+        return len(self._rounds.order)
+
+    def dispatch_order(self) -> List:
+        """
+        Queued jobs in the order they would be started if nothing else was
+        submitted, ignoring running caps (so positions are estimates).
+        """
+        rounds = self._rounds.copy()
+        jobs = []
+        while True:
+            job = rounds.pop(lambda user: True)
+            if not job:
+                return jobs
+            jobs.append(job)
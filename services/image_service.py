@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import logging
 import time
 from pathlib import Path
@@ -13,26 +14,68 @@ from modules.gen_audio import (
     DEFAULT_VOICES,
 )
 from modules.gen_image import read_prompts, generate_images_from_prompts
-from video_creation.create_video import create_video, log_time_taken
+from video_creation.create_video import (
+    create_video,
+    log_time_taken,
+    require_file,
+    ClipRenderer,
+)
 from helpers.aws_uploader import upload_to_s3
 from helpers.clean_video_folder import clean_video_folder
+from services.scheduler import scheduler
 
 from config.logger import get_logger,log_time_taken
 
 logger = get_logger(__name__)
 
-async def generate_images(style: str, aspect_ratio):
-    """Generate images from prompts"""
+async def generate_images(style: str, aspect_ratio, job, on_image=None):
+    """Generate images from prompts, returns the image paths"""
     start_time = time.time()
 
     try:
-        prompts = await read_prompts("prompts/img_gen_prompts.txt")
+        prompts = await read_prompts(job.img_prompts_path)
         if not prompts:
             raise ValueError("No image prompts found in file")
 
-        await generate_images_from_prompts(prompts, style, aspect_ratio)
+        await generate_images_from_prompts(
+            prompts,
+            style,
+            aspect_ratio,
+            images_dir=job.images_dir,
+            on_image=on_image,
+            on_progress=functools.partial(job.progress.step, "images"),
+        )
         log_time_taken("Image generation", start_time, time.time())
 
+        images = [job.image_path(i + 1) for i in range(len(prompts))]
+        for image in images:
+            require_file(image, "Image generation failed")
+        return images
+
     except Exception as e:
         logger.error(f"Error in image generation: {str(e)}")
         raise
+
+
+# Pipeline stage: each clip starts rendering as soon as its image is saved,
+# so zoompan encoding overlaps with the remaining Leonardo downloads. The
+# stage holds an "api" slot only while talking to Leonardo, not while it
+# waits for the last clips (which take "cpu" slots of their own).
+async def images_stage(job, img_prompts: str, style: str, aspect_ratio: str):
+    with open(img_prompts, "r") as f:
+        total = len(f.read().splitlines())
+    with ClipRenderer(
+        aspect_ratio,
+        job.videos_dir,
+        job.priority_key,
+        job.cancel_token,
+        job.progress,
+        stage="images",
+        total=total,
+    ) as renderer:
+        async with scheduler.slot("api", job.priority_key):
+            images = await generate_images(
+                style, aspect_ratio, job, on_image=renderer.render
+            )
+        clips = await renderer.clips(images)
+    return {"images": images, "clips": clips}
@@ -0,0 +1,173 @@
+import copy
+import os
+import shutil
+import time
+import uuid
+from typing import List, Optional
+
+from config.logger import get_logger
+from helpers.cancellation import CancelToken
+from helpers.progress import ProgressLog
+
+logger = get_logger(__name__)
+
+# Every job gets its own scratch directory below this root
+JOB_WORKSPACE_ROOT = os.getenv("JOB_WORKSPACE_ROOT", "video_creation/assets/jobs")
+
+
+class JobContext:
+    """
+    Scratch workspace for a single video generation run.
+
+    All intermediate files (story prompts, narration, images, clips and the
+    final video) are written below `work_dir`, so concurrent jobs never
+    touch each other's files.
+    """
+
+    def __init__(
+        self,
+        job_id: Optional[str] = None,
+        root: str = JOB_WORKSPACE_ROOT,
+        store=None,
+        create: bool = True,
+    ):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.work_dir = os.path.join(root, self.job_id)
+        self.stage = "queued"
+        # Optional JobStore used to persist stage and checkpoints
+        self.store = store
+        self._checkpoints = store.load_checkpoints(self.job_id) if store else {}
+        # Passed to every blocking call so cancelling the job stops them
+        self.cancel_token = CancelToken(self.work_dir)
+        # Stage timings, step counts and encode speeds for progress streams
+        self.progress = ProgressLog(self.work_dir)
+        # Order of this job's work in contended scheduler slots (lower first)
+        self.priority_key = None
+        # Absolute time the job must finish by and its total time budget,
+        # split into stage budgets (see services/budget.py)
+        self.deadline = None
+        self.budget = None
+        # Optional `on_stage(stage)` listener, e.g. for webhooks
+        self.on_stage = None
+        # Filled in by the pipeline executor once a run finishes
+        self.timings = {}
+        self.critical_path = []
+
+        self.prompts_dir = os.path.join(self.work_dir, "prompts")
+        self.images_dir = os.path.join(self.work_dir, "images")
+        self.audio_dir = os.path.join(self.work_dir, "audio")
+        self.videos_dir = os.path.join(self.work_dir, "videos")
+        self.uploads_dir = os.path.join(self.work_dir, "uploads")
+
+        # Finished jobs looked up from the store don't need a workspace
+        if create:
+            for directory in (
+                self.prompts_dir,
+                self.images_dir,
+                self.audio_dir,
+                self.videos_dir,
+                self.uploads_dir,
+            ):
+                os.makedirs(directory, exist_ok=True)
+            # Exists from the start, so a progress stream can open it at once
+            open(self.progress.path, "a").close()
+
+    def set_deadline(self, deadline: float):
+        """Give the job from now until `deadline` to finish."""
+        self.deadline = deadline
+        self.budget = max(deadline - time.time(), 0.0)
+
+    def scoped(self, deadline: float, scope: str) -> "JobContext":
+        """
+        View of this job for one stage: the same workspace, with a cancel
+        token that also expires at the stage's `deadline`.
+        """
+        view = copy.copy(self)
+        view.cancel_token = self.cancel_token.with_deadline(deadline, scope)
+        return view
+
+    def set_stage(self, stage: str):
+        """Record the pipeline stage this job is currently in."""
+        self.stage = stage
+        logger.info(f"Job {self.job_id}: {stage}")
+        if self.store:
+            self.store.update_job(self.job_id, stage=stage)
+        if self.on_stage:
+            self.on_stage(stage)
+
+    def checkpoint(self, stage: str, files: List[str], **manifest):
+        """
+        Record that `stage` finished, with the files it produced and any
+        extra data needed to resume after it.
+        """
+        manifest["files"] = list(files)
+        self._checkpoints[stage] = manifest
+        if self.store:
+            self.store.save_checkpoint(self.job_id, stage, manifest)
+
+    def completed(self, stage: str) -> Optional[dict]:
+        """
+        Return the manifest of a stage finished by an earlier attempt, or
+        None if it has to run (again) because a file it produced is gone.
+        """
+        manifest = self._checkpoints.get(stage)
+        if not manifest:
+            return None
+        if not all(os.path.exists(path) for path in manifest["files"]):
+            logger.warning(f"Job {self.job_id}: checkpoint '{stage}' is stale")
+            return None
+        logger.info(f"Job {self.job_id}: resuming after completed stage '{stage}'")
+        return manifest
+
+    # Story prompts
+    @property
+    def subtitle_prompts_path(self) -> str:
+        return os.path.join(self.prompts_dir, "subtitle_gen_prompts.txt")
+
+    @property
+    def img_prompts_path(self) -> str:
+        return os.path.join(self.prompts_dir, "img_gen_prompts.txt")
+
+    # Audio
+    @property
+    def audio_path(self) -> str:
+        return os.path.join(self.audio_dir, "combined_story_audio.wav")
+
+    # Images and videos
+    def image_path(self, index: int) -> str:
+        return os.path.join(self.images_dir, f"story_img_{index}.png")
+
+    def clip_path(self, index: int) -> str:
+        return os.path.join(self.videos_dir, f"story_video_{index}.mp4")
+
+    def upload_path(self, index: int) -> str:
+        return os.path.join(self.uploads_dir, f"sample_{index}.mp3")
+
+    @property
+    def merged_video_path(self) -> str:
+        return os.path.join(self.videos_dir, "merged_story_video.mp4")
+
+    @property
+    def subtitled_video_path(self) -> str:
+        return os.path.join(self.videos_dir, "final_output_video_subtitles.mp4")
+
+    def final_video_path(self, bgm_audio: str) -> str:
+        """Path of the deliverable video: with bgm if one was selected."""
+        if bgm_audio != "":
+            return os.path.join(self.videos_dir, "final_output_video_bgm.mp4")
+        return self.subtitled_video_path
+
+    def cancel(self):
+        """Stop ffmpeg, moviepy and TTS work of this job wherever it runs."""
+        logger.info(f"Cancelling job {self.job_id}")
+        self.cancel_token.cancel()
+
+    def cleanup(self):
+        """Remove the whole workspace once the job's output has been delivered."""
+        try:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            if self.store:
+                self.store.delete_checkpoints(self.job_id)
+            logger.info(f"Removed job workspace: {self.work_dir}")
+        except Exception as e:
+            logger.error(f"Error removing job workspace {self.work_dir}: {e}")
@@ -0,0 +1,818 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import time
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from config.logger import get_logger, log_time_taken
+from config.timeouts import OPENAI_TIMEOUT_SECONDS
+from helpers.progress import read_events
+from modules.speech2text import speech2text
+from services.aud2vid.aud_to_vid_service import generate_aud2vid
+from services.budget import job_deadline, run_with_budget
+from services.delivery import deliver, expire_deliveries
+from services.fair_share import (
+    QUOTA_WINDOW_SECONDS,
+    USER_JOBS_PER_HOUR,
+    FairQueue,
+    QuotaExceeded,
+)
+from services.job_context import JobContext
+from services.job_store import JobStore, job_store
+from services.priority import (
+    DEFAULT_PRIORITY,
+    PRIORITY_CLASSES,
+    estimate_cost,
+    priority_key,
+)
+from services.scheduler import scheduler
+from services.video_service import generate_video
+from services.webhooks import validate_callback_url, webhook_sender
+
+logger = get_logger(__name__)
+
+# Number of jobs rendered concurrently by this process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+JOB_KINDS = {"video", "audio"}
+
+# How long a finished job's URL is handed out again for an identical
+# request; kept below the 1 hour expiry of the presigned S3 URL
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3000"))
+# Seconds an instance owns a job without renewing its lease; an unfinished
+# job whose lease ran out (its instance died) is resumed by another one
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+# How long running jobs may keep going on shutdown before they are handed off
+DRAIN_GRACE_SECONDS = int(os.getenv("DRAIN_GRACE_SECONDS", "120"))
+# Seconds between two sweeps for expired locally delivered videos
+DELIVERY_EXPIRY_INTERVAL = 60
+# Seconds between two reads of a job's progress log by a progress stream
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.5"))
+
+# Parameters that make two requests identical when no key is given
+IDEMPOTENCY_FIELDS = (
+    "prompt",
+    "duration",
+    "style",
+    "aspect_ratio",
+    "voice_character",
+    "bgm_audio",
+)
+
+
+class ServerBusy(Exception):
+    """Raised for new jobs while the instance is draining or saturated."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after  # seconds, for the Retry-After header
+
+
+def make_idempotency_key(
+    kind: str, params: dict, user_id: str = "", key: Optional[str] = None
+) -> Optional[str]:
+    """
+    Key under which identical requests of one user are coalesced: the
+    client's Idempotency-Key, or else a hash of the request parameters.
+    Requests with uploaded voices have no derived key, nor have `fresh`
+    ones: they ask for a new variation, not an earlier video.
+    """
+    if key:
+        material = {"user_id": user_id, "key": key}
+    elif params.get("voice_files") or params.get("voice_id") or params.get("fresh"):
+        return None
+    else:
+        material = {
+            "user_id": user_id,
+            "kind": kind,
+            **{f: params.get(f) for f in IDEMPOTENCY_FIELDS},
+        }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+
+class Job:
+    """A queued or running video generation request and its outcome."""
+
+    def __init__(
+        self,
+        kind: str,
+        params: dict,
+        user_id: str = "",
+        job_id: Optional[str] = None,
+        store: Optional[JobStore] = None,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        create: bool = True,
+    ):
+        self.context = JobContext(job_id, store=store, create=create)
+        self.job_id = self.context.job_id
+        self.kind = kind
+        self.params = params
+        self.user_id = user_id
+        self.state = "queued"  # queued -> running -> succeeded | failed | cancelled
+        self.result_url: Optional[str] = None
+        self.error: Optional[str] = None
+        self.priority = priority
+        self.deadline = deadline  # absolute timestamp, if the caller has one
+        self.idempotency_key = idempotency_key
+        # Receive webhooks (see services/webhooks.py): the creating request's,
+        # then those of requests coalesced into the job
+        self.callback_urls: List[str] = [callback_url] if callback_url else []
+        self.cost = estimate_cost(params)
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Set once the job is over on this instance: finished, or handed off
+        self.done = asyncio.Event()
+        self.context.priority_key = self.priority_key
+        self.task: Optional[asyncio.Task] = None  # the running pipeline
+        self.waiters = 0  # clients blocked on the result (see JobManager.wait)
+        self.streams = 0  # progress streams reading the job (see JobManager.events)
+        # Set when someone may collect the result later (async API, campaign),
+        # so the job isn't cancelled when waiting clients disconnect
+        self.detached = False
+        # Set when this instance shut down and another one resumes the job
+        self.handed_off = False
+
+    @property
+    def priority_key(self) -> float:
+        return priority_key(self.created_at, self.priority, self.cost, self.deadline)
+
+    @property
+    def callback_url(self) -> Optional[str]:
+        """Callback of the request that created the job."""
+        return self.callback_urls[0] if self.callback_urls else None
+
+    @property
+    def stage(self) -> str:
+        return self.context.stage
+
+    @property
+    def critical_path(self) -> list:
+        return self.context.critical_path
+
+    @classmethod
+    def from_record(cls, record: dict, store: JobStore, create: bool = True) -> "Job":
+        """
+        Rebuild a job persisted by an earlier process, to resume it or (with
+        create=False, no workspace) to report a finished one.
+        """
+        job = cls(
+            record["kind"],
+            record["params"],
+            record["user_id"] or "",
+            job_id=record["job_id"],
+            store=store,
+            priority=record["priority"] or DEFAULT_PRIORITY,
+            deadline=record["deadline"],
+            idempotency_key=record["idempotency_key"],
+            create=create,
+        )
+        job.callback_urls = record["callback_urls"]
+        job.state = record["state"]
+        job.context.stage = record["stage"] or job.context.stage
+        job.result_url = record["result_url"]
+        job.error = record["error"]
+        job.created_at = record["created_at"]
+        job.started_at = record["started_at"]
+        job.finished_at = record["finished_at"]
+        job.context.critical_path = record["critical_path"]
+        job.context.priority_key = job.priority_key
+        if job.state in ("succeeded", "failed", "cancelled"):
+            job.done.set()
+        return job
+
+    def to_record(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "params": self.params,
+            "state": self.state,
+            "stage": self.stage,
+            "result_url": self.result_url,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "critical_path": self.critical_path,
+            "priority": self.priority,
+            "deadline": self.deadline,
+            "idempotency_key": self.idempotency_key,
+            "callback_urls": self.callback_urls,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "state": self.state,
+            "stage": self.stage,
+            "result_url": self.result_url,
+            "error": self.error,
+            "duration": self.params.get("duration"),
+            "priority": self.priority,
+            "deadline": self.deadline,
+            "estimated_cost": self.cost,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "critical_path": self.critical_path,
+            "callback_url": self.callback_url,
+        }
+
+
+class JobManager:
+    """
+    In-process worker pool for video generation.
+
+    Jobs are queued by `enqueue` and picked up by a fixed number of worker
+    tasks, so at most `workers` pipelines run at the same time no matter
+    how many requests arrive. Workers share the queue fairly between users
+    and cap the jobs each user runs at once (see services/fair_share.py);
+    a user's own jobs are taken by priority key (see services/priority.py).
+    Submissions beyond a user's hourly quota are refused with
+    QuotaExceeded, and new jobs while draining or saturated with
+    ServerBusy. Every job is persisted
+    to the job store and leased by this instance while unfinished; jobs
+    left unfinished by an instance that was drained or died are adopted
+    and resumed (see JobStore). Finished jobs stay in `jobs` only while
+    clients wait on them or stream their progress.
+
+    Jobs with callback URLs get webhooks when they start, move on to new
+    stages and finish (see services/webhooks.py); requests coalesced into a
+    job add theirs (`add_callback`).
+
+    `drain` (on SIGTERM, see main.py) stops taking new jobs, gives running
+    ones DRAIN_GRACE_SECONDS to finish and hands the rest off to other
+    instances, resuming from their last completed stage.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, store: JobStore = job_store):
+        self.workers = workers
+        self.store = store
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[FairQueue] = None
+        self._inflight: Dict[str, Job] = {}  # idempotency key -> unfinished job
+        self._worker_tasks = []
+        self.instance_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.draining = False
+        self._drain_task: Optional[asyncio.Task] = None
+        # Why the instance is saturated, if it is (see services/capacity.py)
+        self.saturation: Callable[[], List[str]] = lambda: []
+
+    async def start(self):
+        self._queue = FairQueue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(n)) for n in range(self.workers)
+        ]
+        self._worker_tasks.append(asyncio.create_task(self._maintain_leases()))
+        self._worker_tasks.append(asyncio.create_task(self._expire_deliveries()))
+        logger.info(
+            f"Job manager {self.instance_id} started with {self.workers} workers"
+        )
+        self._adopt_jobs()
+
+    def _adopt_jobs(self):
+        """Resume jobs released by drained instances or left by dead ones."""
+        lease_until = time.time() + JOB_LEASE_SECONDS
+        for record in self.store.load_adoptable_jobs(time.time()):
+            if record["job_id"] in self.jobs:
+                continue
+            claimed = self.store.claim_job(
+                record["job_id"], self.instance_id, lease_until
+            )
+            if not claimed:
+                continue
+            job = Job.from_record(record, self.store)
+            job.state = "queued"
+            self.jobs[job.job_id] = job
+            if job.idempotency_key:
+                self._inflight[job.idempotency_key] = job
+            self._put(job)
+            logger.info(f"Resuming job {job.job_id} after stage '{record['stage']}'")
+
+    async def _maintain_leases(self):
+        """Keep the leases of this instance's jobs, and adopt orphaned ones."""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            unfinished = [
+                job.job_id for job in self.jobs.values() if not job.done.is_set()
+            ]
+            self.store.renew_leases(
+                self.instance_id, unfinished, time.time() + JOB_LEASE_SECONDS
+            )
+            if not self.draining:
+                self._adopt_jobs()
+
+    async def _expire_deliveries(self):
+        """Remove locally delivered videos once they expire (see services/delivery.py)."""
+        while True:
+            await asyncio.to_thread(expire_deliveries)
+            await asyncio.sleep(DELIVERY_EXPIRY_INTERVAL)
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def drain(self, grace: float = DRAIN_GRACE_SECONDS):
+        """
+        Stop taking new jobs, wait up to `grace` seconds for running ones
+        and hand off whatever is unfinished, then stop the workers. Safe to
+        call more than once: later calls wait for the first drain.
+        """
+        if not self._drain_task:
+            self._drain_task = asyncio.create_task(self._drain(grace))
+        await asyncio.shield(self._drain_task)
+
+    async def _drain(self, grace: float):
+        self.draining = True
+        running = [job for job in self.jobs.values() if job.state == "running"]
+        logger.info(
+            f"Draining: waiting up to {grace}s for {len(running)} running jobs"
+        )
+        if running:
+            await asyncio.wait(
+                [asyncio.ensure_future(job.done.wait()) for job in running],
+                timeout=grace,
+            )
+
+        for job in list(self.jobs.values()):
+            if job.state in ("queued", "running"):
+                self._hand_off(job)
+        await self.stop()
+        await webhook_sender.close()
+        logger.info("Drained")
+
+    def _hand_off(self, job: Job):
+        """Give an unfinished job back to the store for another instance."""
+        was_running = job.state == "running"
+        job.state = "queued"
+        job.handed_off = True
+        job.error = (
+            f"Server shut down, job {job.job_id} continues on another instance"
+        )
+        # Completed stages are already checkpointed; stop the current ones
+        job.context.cancel_token.interrupt()
+        if job.task:
+            job.task.cancel()
+        self.store.release_job(job.job_id, self.instance_id)
+        job.context.on_stage = None
+        self._release_key(job)
+        # Nothing more happens to it here; waiters stop waiting for it
+        job.done.set()
+        logger.info(
+            f"Handed off {'running' if was_running else 'queued'} job {job.job_id} "
+            f"at stage '{job.stage}'"
+        )
+
+    def create_job(
+        self,
+        kind: str,
+        params: dict,
+        user_id: str = "",
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        admitted: bool = False,
+    ) -> Job:
+        """
+        Create a job (and its workspace) without queueing it yet. Callers
+        coalescing requests look the key up with `find_existing` first.
+        `admitted` skips the saturation check, for batches checked as a
+        whole.
+        """
+        if self.draining or not admitted:
+            self.admit()
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Invalid job kind: {kind}")
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Invalid priority: {priority}")
+        if callback_url:
+            validate_callback_url(callback_url)
+        self.check_quota(user_id)
+        job = Job(
+            kind,
+            params,
+            user_id,
+            store=self.store,
+            priority=priority,
+            deadline=deadline,
+            idempotency_key=idempotency_key,
+            callback_url=callback_url,
+        )
+        self.jobs[job.job_id] = job
+        if idempotency_key:
+            self._inflight[idempotency_key] = job
+        return job
+
+    def admit(self):
+        """
+        Raise ServerBusy while draining or saturated, so new work goes to
+        another instance. Requests coalesced into an existing job are
+        answered by that job and never get here.
+        """
+        if self.draining:
+            raise ServerBusy("Server is draining, retry on another instance", 5)
+        saturated = self.saturation()
+        if saturated:
+            raise ServerBusy(
+                f"Server is saturated ({', '.join(saturated)}), "
+                "retry later or on another instance",
+                30,
+            )
+
+    def check_quota(self, user_id: str, count: int = 1):
+        """
+        Raise QuotaExceeded if `user_id` can't submit `count` more jobs
+        without going over USER_JOBS_PER_HOUR. Requests coalesced into an
+        existing job don't count.
+        """
+        if not USER_JOBS_PER_HOUR:
+            return
+        now = time.time()
+        submitted = self.store.user_submissions(user_id, now - QUOTA_WINDOW_SECONDS)
+        excess = len(submitted) + count - USER_JOBS_PER_HOUR
+        if excess <= 0:
+            return
+        if count > USER_JOBS_PER_HOUR:
+            raise QuotaExceeded(
+                f"At most {USER_JOBS_PER_HOUR} jobs per hour can be submitted"
+            )
+        # Room frees up as the oldest submissions leave the window
+        retry_after = submitted[excess - 1] + QUOTA_WINDOW_SECONDS - now
+        raise QuotaExceeded(
+            f"Quota exceeded: {len(submitted)} of {USER_JOBS_PER_HOUR} jobs "
+            f"submitted in the last hour",
+            retry_after,
+        )
+
+    def find_existing(self, idempotency_key: Optional[str]) -> Optional[Job]:
+        """
+        The job an identical request should attach to: one still queued or
+        running, or one that succeeded within IDEMPOTENCY_TTL_SECONDS.
+        """
+        if not idempotency_key:
+            return None
+
+        job = self._inflight.get(idempotency_key)
+        if job:
+            return job
+
+        record = self.store.find_completed_job(
+            idempotency_key, time.time() - IDEMPOTENCY_TTL_SECONDS
+        )
+        if record:
+            return self.jobs.get(record["job_id"]) or Job.from_record(
+                record, self.store, create=False
+            )
+        return None
+
+    def enqueue(self, job: Job) -> Job:
+        self.store.save_job(
+            {
+                **job.to_record(),
+                "owner": self.instance_id,
+                "lease_until": time.time() + JOB_LEASE_SECONDS,
+            }
+        )
+        self._put(job)
+        logger.info(
+            f"Job {job.job_id} queued ({self._queue.qsize()} waiting, "
+            f"priority {job.priority}, estimated {job.cost:.0f}s)"
+        )
+        return job
+
+    def _put(self, job: Job):
+        # Callbacks may still be added while the job waits or runs
+        job.context.on_stage = lambda stage: (
+            self._notify(job, "job.stage") if stage != "done" else None
+        )
+        self._queue.put(job)
+
+    def _notify(self, job: Job, event: str):
+        for callback_url in job.callback_urls:
+            webhook_sender.send(callback_url, event, job.job_id, job.to_dict())
+
+    def add_callback(self, job: Job, callback_url: str):
+        """
+        Register the callback of a request coalesced into `job`, so it gets
+        the job's webhooks too; a finished job sends its final event at once.
+        """
+        validate_callback_url(callback_url)
+        if callback_url in job.callback_urls:
+            return
+        job.callback_urls.append(callback_url)
+        self.store.update_job(job.job_id, callback_urls=job.callback_urls)
+        if job.state in ("succeeded", "failed", "cancelled"):
+            webhook_sender.send(
+                callback_url, f"job.{job.state}", job.job_id, job.to_dict()
+            )
+
+    def discard(self, job: Job):
+        """Drop a job that was created but never queued."""
+        self.jobs.pop(job.job_id, None)
+        self._release_key(job)
+        job.context.cleanup()
+
+    def _forget(self, job: Job):
+        """
+        Drop a finished job once no client waits for it or streams its
+        progress; its status is then read back from the store.
+        """
+        if job.done.is_set() and not job.waiters and not job.streams:
+            if self.jobs.get(job.job_id) is job:
+                del self.jobs[job.job_id]
+
+    def _release_key(self, job: Job):
+        if job.idempotency_key and self._inflight.get(job.idempotency_key) is job:
+            del self._inflight[job.idempotency_key]
+
+    def submit(
+        self,
+        kind: str,
+        params: dict,
+        user_id: str = "",
+        idempotency_key: Optional[str] = None,
+        **options,
+    ) -> Job:
+        """
+        Queue a job, or return the running or recently finished job of an
+        identical request (same Idempotency-Key, or same parameters).
+        """
+        key = make_idempotency_key(kind, params, user_id, idempotency_key)
+        existing = self.find_existing(key)
+        if existing:
+            logger.info(f"Request coalesced into job {existing.job_id}")
+            if options.get("callback_url"):
+                self.add_callback(existing, options["callback_url"])
+            return existing
+        return self.enqueue(
+            self.create_job(kind, params, user_id, idempotency_key=key, **options)
+        )
+
+    def queue_stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": sum(1 for job in self.jobs.values() if job.state == "running"),
+            "users_queued": self._queue.users() if self._queue else 0,
+        }
+
+    def user_usage(self, user_id: str) -> dict:
+        """
+        A user's queued jobs with their (estimated) positions in this
+        instance's queue, running jobs, and quota and usage of the last hour.
+        """
+        order = self._queue.dispatch_order() if self._queue else []
+        queued = [
+            {"job_id": job.job_id, "position": position, "priority": job.priority}
+            for position, job in enumerate(order, start=1)
+            if job.user_id == user_id
+        ]
+        running = [
+            job.job_id
+            for job in self.jobs.values()
+            if job.user_id == user_id and job.state == "running"
+        ]
+        since = time.time() - QUOTA_WINDOW_SECONDS
+        submitted = len(self.store.user_submissions(user_id, since))
+        usage = self.store.user_usage(user_id, since)
+        return {
+            "user_id": user_id,
+            "queued": queued,
+            "running": running,
+            "max_running": self._queue.max_running if self._queue else None,
+            "last_hour": {
+                "submitted": submitted,
+                "quota": USER_JOBS_PER_HOUR or None,
+                "remaining": (
+                    max(USER_JOBS_PER_HOUR - submitted, 0)
+                    if USER_JOBS_PER_HOUR
+                    else None
+                ),
+                "jobs": {state: row["jobs"] for state, row in usage.items()},
+                "run_time": round(sum(row["run_time"] for row in usage.values()), 2),
+            },
+        }
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def get_status(self, job_id: str) -> Optional[dict]:
+        """Status of a live job, or of one recorded by an earlier process."""
+        job = self.jobs.get(job_id)
+        if job:
+            return job.to_dict()
+
+        record = self.store.get_job(job_id)
+        if record:
+            record["duration"] = record.pop("params").get("duration")
+        return record
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a queued or running job: its ffmpeg process groups are killed,
+        in-flight API calls and TTS loops stop, and a cloned voice is deleted.
+        """
+        job = self.jobs.get(job_id)
+        if not job or job.done.is_set():
+            return job
+
+        previous_state = job.state
+        job.state = "cancelled"
+        job.error = "Cancelled"
+        job.context.cancel()
+        if previous_state == "queued":
+            # Workers skip cancelled jobs when they reach them in the queue
+            self._finish(job)
+        elif job.task:
+            job.task.cancel()
+        return job
+
+    async def wait(self, job: Job, is_disconnected=None, poll_interval: float = 1.0):
+        """
+        Wait for a job on behalf of a client. `is_disconnected` (e.g.
+        `request.is_disconnected`) is polled, and a job that every waiting
+        client has abandoned is cancelled unless it is detached.
+        """
+        job.waiters += 1
+        disconnected = False
+        try:
+            while not job.done.is_set():
+                try:
+                    await asyncio.wait_for(job.done.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    if is_disconnected and await is_disconnected():
+                        disconnected = True
+                        logger.info(f"Client waiting on job {job.job_id} disconnected")
+                        return
+        finally:
+            job.waiters -= 1
+            if (
+                disconnected
+                and job.waiters == 0
+                and not job.detached
+                and not job.done.is_set()
+            ):
+                self.cancel(job.job_id)
+            self._forget(job)
+
+    async def events(
+        self, job: Job, poll_interval: float = PROGRESS_POLL_INTERVAL
+    ) -> AsyncIterator[dict]:
+        """
+        Yield the job's progress events (see helpers/progress.py) as they
+        are written, each with the seconds `elapsed` since the job was
+        submitted, until the job has finished (or was handed off to
+        another instance).
+        """
+        job.streams += 1
+        try:
+            try:
+                # Held open, so events written just before cleanup are still read
+                stream = open(job.context.progress.path, "rb")
+            except FileNotFoundError:
+                return  # finished before the stream started
+
+            with stream:
+                while True:
+                    finished = job.done.is_set()
+                    for event in read_events(stream):
+                        event["elapsed"] = round(event["time"] - job.created_at, 3)
+                        yield event
+                    if finished:
+                        return
+                    try:
+                        await asyncio.wait_for(job.done.wait(), poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            job.streams -= 1
+            self._forget(job)
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                # While draining, queued jobs are left to be handed off
+                if job.state == "queued" and not self.draining:
+                    await self._run(job)
+            finally:
+                self._queue.release(job)
+
+    async def _run(self, job: Job):
+        job.state = "running"
+        job.started_at = time.time()
+        self.store.update_job(job.job_id, state=job.state, started_at=job.started_at)
+        # Split into stage budgets as the pipeline runs
+        job.context.set_deadline(job_deadline(job.started_at, job.deadline))
+        job.context.progress.emit(
+            "job", "start", queued=round(job.started_at - job.created_at, 3)
+        )
+        self._notify(job, "job.started")
+        job.task = asyncio.create_task(self._execute(job))
+        try:
+            job.result_url = await job.task
+            job.state = "succeeded"
+            job.context.set_stage("done")
+
+        except asyncio.CancelledError:
+            if job.state != "cancelled":
+                # The worker is stopping or the job was handed off; leave
+                # the job to be resumed
+                raise
+            logger.info(f"Job {job.job_id} cancelled")
+        except Exception as e:
+            if job.state != "cancelled":
+                logger.error(f"Job {job.job_id} failed: {str(e)}", exc_info=True)
+                job.state = "failed"
+                job.error = str(e)
+
+        self._finish(job)
+
+    async def _execute(self, job: Job) -> str:
+        if job.kind == "audio":
+            video_file = await self._run_aud2vid(job)
+        else:
+            video_file = await generate_video(**job.params, job=job.context)
+        return await self._deliver(job, video_file)
+
+    def _finish(self, job: Job):
+        job.finished_at = time.time()
+        if job.started_at:
+            log_time_taken(f"Job {job.job_id}", job.started_at, job.finished_at)
+        job.context.progress.emit(
+            "job",
+            "end",
+            state=job.state,
+            error=job.error,
+            duration=round(job.finished_at - (job.started_at or job.created_at), 3),
+        )
+        self.store.update_job(
+            job.job_id,
+            state=job.state,
+            result_url=job.result_url,
+            error=job.error,
+            finished_at=job.finished_at,
+            critical_path=job.critical_path,
+        )
+        self._release_key(job)
+        job.context.cleanup()
+        job.done.set()
+        self._notify(job, f"job.{job.state}")
+        self._forget(job)
+
+    async def _run_aud2vid(self, job: Job) -> str:
+        # Extract text from the first uploaded audio file
+        job.context.set_stage("transcription")
+        voice_files = job.params.get("voice_files") or []
+        if not voice_files:
+            raise ValueError("An audio file is required for audio-to-video jobs")
+        with job.context.progress.timed("transcription"):
+            async with scheduler.slot("api", job.priority_key):
+                audio_text = await run_with_budget(
+                    job.context, "transcription", self._transcribe, voice_files[0]
+                )
+
+        return await generate_aud2vid(
+            audio_text=audio_text, **job.params, job=job.context
+        )
+
+    @staticmethod
+    async def _transcribe(context: JobContext, path: str) -> str:
+        return await asyncio.to_thread(
+            speech2text, path, context.cancel_token.timeout(OPENAI_TIMEOUT_SECONDS)
+        )
+
+    @staticmethod
+    async def _upload(context: JobContext, video_file: str, duration: int) -> str:
+        context.cancel_token.raise_if_cancelled()
+        return await asyncio.to_thread(deliver, video_file, duration, context.job_id)
+
+    async def _deliver(self, job: Job, video_file: str) -> str:
+        """Upload (or locally deliver) the final video and return its URL."""
+        job.context.set_stage("upload")
+        if not Path(video_file).exists():
+            raise Exception("Generated video file not found")
+
+        with job.context.progress.timed("upload"):
+            return await run_with_budget(
+                job.context,
+                "upload",
+                self._upload,
+                video_file,
+                int(job.params["duration"]),
+            )
+
+
+job_manager = JobManager()
@@ -0,0 +1,244 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Local SQLite database holding job state and per-stage checkpoints
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "video_creation/assets/jobs/jobs.db")
+
+JOB_COLUMNS = (
+    "job_id",
+    "kind",
+    "user_id",
+    "params",
+    "state",
+    "stage",
+    "result_url",
+    "error",
+    "created_at",
+    "started_at",
+    "finished_at",
+    "critical_path",
+    "priority",
+    "deadline",
+    "idempotency_key",
+    "owner",
+    "lease_until",
+    "callback_urls",
+)
+
+
+class JobStore:
+    """
+    Durable record of every job and the output manifest of each completed
+    stage, so an interrupted job can resume instead of starting over.
+
+    Unfinished jobs are leased by the instance (`owner`) running them. With
+    the database and job workspaces on a volume shared by several
+    instances, a job released on shutdown, or whose owner stopped renewing
+    its lease, is adopted and resumed by another instance.
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    user_id TEXT,
+                    params TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    stage TEXT,
+                    result_url TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    critical_path TEXT,
+                    priority TEXT,
+                    deadline REAL,
+                    idempotency_key TEXT,
+                    owner TEXT,
+                    lease_until REAL,
+                    callback_urls TEXT
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_idempotency_key "
+                "ON jobs (idempotency_key, finished_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    job_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    manifest TEXT NOT NULL,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, stage)
+                )
+                """
+            )
+
+    # Jobs
+    def save_job(self, job: dict):
+        """Insert or replace a job record (as returned by Job.to_record)."""
+        row = dict(job)
+        row["params"] = json.dumps(row["params"])
+        row["critical_path"] = json.dumps(row.get("critical_path") or [])
+        row["callback_urls"] = json.dumps(row.get("callback_urls") or [])
+        placeholders = ", ".join("?" for _ in JOB_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                [row.get(column) for column in JOB_COLUMNS],
+            )
+
+    def update_job(self, job_id: str, **fields):
+        if not fields:
+            return
+        for column in ("critical_path", "callback_urls"):
+            if column in fields:
+                fields[column] = json.dumps(fields[column])
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                [*fields.values(), job_id],
+            )
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def load_adoptable_jobs(self, now: float) -> List[dict]:
+        """Unfinished jobs without an owner, or whose owner's lease ran out."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE state IN ('queued', 'running') "
+                "AND (owner IS NULL OR lease_until IS NULL OR lease_until < ?) "
+                "ORDER BY created_at",
+                (now,),
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim_job(self, job_id: str, owner: str, lease_until: float) -> bool:
+        """Take over an adoptable job; False if another instance was faster."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET owner = ?, lease_until = ? "
+                "WHERE job_id = ? AND state IN ('queued', 'running') "
+                "AND (owner IS NULL OR lease_until IS NULL OR lease_until < ?)",
+                (owner, lease_until, job_id, time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def renew_leases(self, owner: str, job_ids: List[str], lease_until: float):
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET lease_until = ? "
+                f"WHERE owner = ? AND job_id IN ({placeholders})",
+                [lease_until, owner, *job_ids],
+            )
+
+    def release_job(self, job_id: str, owner: str):
+        """Hand an unfinished job back, to be resumed by any instance."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL, lease_until = NULL "
+                "WHERE job_id = ? AND owner = ?",
+                (job_id, owner),
+            )
+
+    def find_completed_job(self, idempotency_key: str, since: float) -> Optional[dict]:
+        """Latest successful job with this key that finished after `since`."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE idempotency_key = ? AND state = 'succeeded' "
+                "AND finished_at >= ? ORDER BY finished_at DESC LIMIT 1",
+                (idempotency_key, since),
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def user_submissions(self, user_id: str, since: float) -> List[float]:
+        """Creation times of the user's jobs created after `since`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT created_at FROM jobs WHERE user_id = ? AND created_at >= ? "
+                "ORDER BY created_at",
+                (user_id, since),
+            ).fetchall()
+        return [row["created_at"] for row in rows]
+
+    def user_usage(self, user_id: str, since: float) -> Dict[str, dict]:
+        """Per state: the user's jobs created after `since` and their run time."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) AS jobs, "
+                "SUM(COALESCE(finished_at, ?) - started_at) AS run_time "
+                "FROM jobs WHERE user_id = ? AND created_at >= ? GROUP BY state",
+                (time.time(), user_id, since),
+            ).fetchall()
+        return {
+            row["state"]: {"jobs": row["jobs"], "run_time": row["run_time"] or 0.0}
+            for row in rows
+        }
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["critical_path"] = json.loads(job["critical_path"] or "[]")
+        job["callback_urls"] = json.loads(job["callback_urls"] or "[]")
+        return job
+
+    # Checkpoints
+    def save_checkpoint(self, job_id: str, stage: str, manifest: dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, stage, manifest, completed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(manifest), time.time()),
+            )
+
+    def load_checkpoints(self, job_id: str) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, manifest FROM checkpoints WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {row["stage"]: json.loads(row["manifest"]) for row in rows}
+
+    def delete_checkpoints(self, job_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+
+
+job_store = JobStore()
@@ -0,0 +1,247 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Sequence
+
+from config.logger import get_logger, log_time_taken
+from services.artifact_cache import artifact_cache
+from services.budget import run_with_budget
+from services.scheduler import scheduler
+
+logger = get_logger(__name__)
+
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    `func` is an async callable invoked as `func(job, **inputs)` and must
+    return a dict holding every name listed in `outputs`. `files` names the
+    outputs that are file paths (or lists of paths); they are what a
+    checkpoint of this stage is validated against on resume. `resource`
+    names the scheduler class (e.g. "api") whose slot the stage holds while
+    it runs; stages that schedule their own work leave it empty.
+
+    With `cache` set, the stage's outputs are reused from the artifact
+    cache (services/artifact_cache.py) for inputs seen before. `cache` may
+    also be a function of the inputs returning extra key material, e.g.
+    files the stage reads that aren't inputs, or None to run the stage
+    uncached for these inputs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        inputs: Sequence[str] = (),
+        outputs: Sequence[str] = (),
+        files: Sequence[str] = (),
+        resource: Optional[str] = None,
+        cache=False,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.files = list(files)
+        self.resource = resource
+        self.cache = cache
+
+
+class Pipeline:
+    """
+    Dependency-graph executor: every stage starts as soon as all of its
+    inputs exist, so independent branches (e.g. narration + transcription
+    vs. images + clip rendering) run concurrently.
+
+    Completed stages are checkpointed on the job, and stages already
+    checkpointed by an earlier attempt are skipped; cacheable stages are
+    looked up in the artifact cache before they take a scheduler slot.
+    Every stage's start and end is reported to the job's progress log as
+    it happens, and after a run the timings of every stage and the critical
+    path are stored on the job.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        self.producers: Dict[str, str] = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"Output '{output}' produced twice")
+                self.producers[output] = stage.name
+
+    async def run(self, job, values: dict) -> dict:
+        """Run every stage and return all values (initial inputs + outputs)."""
+        values = dict(values)
+        pending = dict(self.stages)
+        running: Dict[asyncio.Task, Stage] = {}
+        timings: Dict[str, dict] = {}
+        run_start = time.time()
+
+        try:
+            while pending or running:
+                # Start every stage whose inputs are all available
+                for name, stage in list(pending.items()):
+                    if all(key in values for key in stage.inputs):
+                        del pending[name]
+                        task = asyncio.create_task(
+                            self._run_stage(job, stage, values, timings)
+                        )
+                        running[task] = stage
+                self._report_stage(job, running)
+
+                if not running:
+                    missing = {
+                        name: [key for key in stage.inputs if key not in values]
+                        for name, stage in pending.items()
+                    }
+                    raise Exception(f"Pipeline stalled, missing inputs: {missing}")
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    running.pop(task)
+                    values.update(task.result())  # re-raises stage errors
+
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        job.timings = timings
+        job.critical_path = self.critical_path(timings, run_start)
+        log_time_taken("Pipeline", run_start, time.time())
+        logger.info(
+            f"Job {job.job_id} critical path: "
+            + " -> ".join(
+                f"{step['stage']} ({step['duration']:.2f}s)"
+                for step in job.critical_path
+            )
+        )
+        return values
+
+    async def _run_stage(self, job, stage: Stage, values: dict, timings: dict) -> dict:
+        start_time = time.time()
+        checkpoint = job.completed(stage.name)
+        # A checkpoint from before the stage gained an output can't be reused
+        if checkpoint and not all(
+            key in checkpoint.get("outputs", {}) for key in stage.outputs
+        ):
+            checkpoint = None
+        with job.progress.timed(stage.name, resumed=bool(checkpoint)):
+            if checkpoint:
+                outputs = checkpoint["outputs"]
+            else:
+                inputs = {key: values[key] for key in stage.inputs}
+                cache_key = await self._cache_key(stage, inputs)
+                outputs = None
+                if cache_key:
+                    outputs = await asyncio.to_thread(
+                        artifact_cache.get, stage.name, cache_key, job.work_dir
+                    )
+                    job.progress.emit(stage.name, "cache", hit=outputs is not None)
+                if outputs is None:
+                    outputs = await self._compute(job, stage, inputs, cache_key)
+
+                files = []
+                for key in stage.files:
+                    value = outputs[key]
+                    files.extend(value if isinstance(value, list) else [value])
+                job.checkpoint(stage.name, files, outputs=outputs)
+
+        end_time = time.time()
+        log_time_taken(f"Stage {stage.name}", start_time, end_time)
+        timings[stage.name] = {
+            "start": start_time,
+            "end": end_time,
+            "resumed": bool(checkpoint),
+        }
+        return outputs
+
+    async def _compute(self, job, stage: Stage, inputs: dict, cache_key) -> dict:
+        slot = (
+            scheduler.slot(stage.resource, job.priority_key)
+            if stage.resource
+            else nullcontext()
+        )
+        async with slot:
+            compute_start = time.time()
+            # Fails with BudgetExceeded (freeing the slot) once the
+            # stage's share of the job deadline is used up
+            outputs = await run_with_budget(job, stage.name, stage.func, **inputs)
+            compute_time = time.time() - compute_start
+
+        missing = [key for key in stage.outputs if key not in outputs]
+        if missing:
+            raise Exception(f"Stage '{stage.name}' did not produce {missing}")
+        outputs = {key: outputs[key] for key in stage.outputs}
+        if cache_key:
+            await asyncio.to_thread(
+                artifact_cache.put,
+                stage.name,
+                cache_key,
+                outputs,
+                job.work_dir,
+                compute_time,
+            )
+        return outputs
+
+    @staticmethod
+    async def _cache_key(stage: Stage, inputs: dict) -> Optional[str]:
+        """Artifact cache key of the stage's inputs, or None if not cached."""
+        if not stage.cache or not artifact_cache.enabled:
+            return None
+        material = dict(inputs)
+        if callable(stage.cache):
+            material["extra"] = stage.cache(inputs)
+            if material["extra"] is None:
+                return None
+        try:
+            # Hashes input files, so off the event loop
+            return await asyncio.to_thread(
+                artifact_cache.key, stage.name, stage.func, material
+            )
+        except Exception as e:
+            logger.warning(f"No artifact cache key for stage '{stage.name}': {e}")
+            return None
+
+    def _report_stage(self, job, running: Dict[asyncio.Task, Stage]):
+        names = sorted(stage.name for stage in running.values())
+        if names:
+            job.set_stage(",".join(names))
+
+    def critical_path(self, timings: Dict[str, dict], run_start: float) -> List[dict]:
+        """
+        Walk back from the last stage to finish, each time following the
+        input that became available last: that chain bounds the latency.
+        """
+        if not timings:
+            return []
+
+        path = []
+        current: Optional[str] = max(timings, key=lambda name: timings[name]["end"])
+        while current:
+            timing = timings[current]
+            path.append(
+                {
+                    "stage": current,
+                    "start": round(timing["start"] - run_start, 3),
+                    "duration": round(timing["end"] - timing["start"], 3),
+                }
+            )
+            upstream = [
+                self.producers[key]
+                for key in self.stages[current].inputs
+                if key in self.producers and self.producers[key] in timings
+            ]
+            current = (
+                max(upstream, key=lambda name: timings[name]["end"])
+                if upstream
+                else None
+            )
+
+        path.reverse()
+        return path
@@ -0,0 +1,55 @@
+import os
+from typing import Optional
+
+from modules.gen_story import SENTENCES_PER_DURATION
+
+# Scheduling head start per priority class, in seconds: a job is ordered as
+# if it had been submitted this much later than it actually was
+PRIORITY_CLASSES = {
+    "interactive": 0,  # previews and drafts someone is waiting for
+    "standard": int(os.getenv("PRIORITY_STANDARD_DELAY", "60")),
+    "batch": int(os.getenv("PRIORITY_BATCH_DELAY", "600")),
+}
+DEFAULT_PRIORITY = "standard"
+
+# Rough cost model, in seconds of pipeline time
+COST_BASE_SECONDS = float(os.getenv("COST_BASE_SECONDS", "30"))
+COST_PER_SEGMENT_SECONDS = float(os.getenv("COST_PER_SEGMENT_SECONDS", "10"))
+
+
+def estimate_segments(duration: int) -> int:
+    """Story sentences (images, clips, subtitle segments) for a duration."""
+    if duration in SENTENCES_PER_DURATION:
+        return SENTENCES_PER_DURATION[duration]
+    # Durations outside the map (e.g. uploaded audio): use the closest one
+    closest = min(SENTENCES_PER_DURATION, key=lambda d: abs(d - duration))
+    return SENTENCES_PER_DURATION[closest]
+
+
+def estimate_cost(params: dict) -> float:
+    """Estimated seconds of work for a job, driven by its segment count."""
+    segments = estimate_segments(int(params.get("duration") or 45))
+    return COST_BASE_SECONDS + COST_PER_SEGMENT_SECONDS * segments
+
+
+def priority_key(
+    created_at: float,
+    priority: str = DEFAULT_PRIORITY,
+    cost: float = 0.0,
+    deadline: Optional[float] = None,
+) -> float:
+    """
+    Sort key for jobs and resource slots (lower runs first), a virtual
+    deadline: submission time + class head start + estimated cost. Cheap
+    and interactive jobs overtake long ones submitted around the same
+    time, and a job with a real deadline is ordered by its latest start
+    time if that is sooner.
+
+    Since the key is fixed at submission, every job also gets ahead of
+    everything submitted sufficiently later; long or batch jobs therefore
+    wait at most about their head start + cost and can't starve.
+    """
+    key = created_at + PRIORITY_CLASSES[priority] + cost
+    if deadline is not None:
+        key = min(key, deadline - cost)
+    return key
@@ -0,0 +1,128 @@
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from config.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Concurrent calls to OpenAI, ElevenLabs and Leonardo across all jobs
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "32"))
+# Concurrent ffmpeg/moviepy renders across all jobs
+CPU_SLOTS = int(os.getenv("CPU_SLOTS", str(multiprocessing.cpu_count())))
+
+# Number of recent waits kept per class for the percentiles
+WAIT_SAMPLES = 200
+
+
+class ResourceClass:
+    """
+    A pool of `limit` slots shared by every job. Work waits for a free slot
+    before it starts; the time spent waiting is recorded. When slots are
+    contended they go to the waiter with the lowest priority key (see
+    services/priority.py), not simply the first one.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits = deque(maxlen=WAIT_SAMPLES)
+        self._available = limit
+        self._waiters = []  # heap of (priority key, seq, future)
+        self._seq = itertools.count()
+
+    async def _acquire(self, priority: float):
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The slot was handed over just before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the best waiter still waiting
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._available += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[float] = None):
+        self.queued += 1
+        start_time = time.time()
+        try:
+            await self._acquire(start_time if priority is None else priority)
+        finally:
+            self.queued -= 1
+        wait = time.time() - start_time
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self._recent_waits.append(wait)
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._release()
+
+    def stats(self) -> dict:
+        waits = sorted(self._recent_waits)
+        started = self.completed + self.running
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": self.queued,
+            "completed": self.completed,
+            "avg_wait": round(self.total_wait / started, 3) if started else 0.0,
+            "p95_wait": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+            "max_wait": round(self.max_wait, 3),
+        }
+
+
+class Scheduler:
+    """
+    Resource classes shared by all jobs in this process:
+
+    - "api": network-bound calls (story, TTS, images, transcription), with a
+      large concurrency limit since they mostly wait on remote services.
+    - "cpu": clip rendering, merging, subtitle burning and bgm mixing,
+      limited to CPU_SLOTS so concurrent jobs don't oversubscribe the CPU.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        self.classes = {name: ResourceClass(name, limit) for name, limit in limits.items()}
+
+    def slot(self, name: str, priority: Optional[float] = None):
+        """
+        `async with scheduler.slot("cpu", job.priority_key):` runs the block
+        in a slot of `name`; without a priority waiters are served FIFO.
+        """
+        return self.classes[name].slot(priority)
+
+    def stats(self) -> dict:
+        return {name: resource.stats() for name, resource in self.classes.items()}
+
+
+scheduler = Scheduler({"api": API_CONCURRENCY, "cpu": CPU_SLOTS})
@@ -13,7 +13,7 @@ from modules.gen_audio import (
     DEFAULT_VOICES,
 )
 from modules.gen_image import read_prompts, generate_images_from_prompts
-from video_creation.create_video import create_video, log_time_taken
+from video_creation.create_video import create_video, log_time_taken, require_file
 from helpers.aws_uploader import upload_to_s3
 from helpers.clean_video_folder import clean_video_folder
 
@@ -22,13 +22,34 @@ from config.logger import get_logger,log_time_taken
 
 logger = get_logger(__name__)
 
-async def generate_story_content(prompt: str, duration: int):
+async def generate_story_content(prompt: str, duration: int, job):
     """Generate subtitles and image prompts concurrently"""
     start_time = time.time()
 
     # Run story generation tasks concurrently
-    subtitle_task = asyncio.create_task(subtitle_generator_story(prompt, duration))
-    image_prompt_task = asyncio.create_task(image_generator_story(prompt, duration))
+    subtitle_task = asyncio.create_task(subtitle_story_stage(job, prompt, duration))
+    image_prompt_task = asyncio.create_task(image_story_stage(job, prompt, duration))
     await asyncio.gather(subtitle_task, image_prompt_task)
 
     log_time_taken("Story content generation", start_time, time.time())
+
+
+# Pipeline stages: the story generators swallow their own errors, so check
+# that the file was actually written before handing it to the next stage.
+# With `fresh`, a new story is written instead of reusing a cached one.
+# Not in the artifact cache: stories are reused through the completion
+# cache (helpers/completion_cache.py), which expires them
+async def subtitle_story_stage(job, prompt: str, duration: int, fresh: bool = False):
+    await subtitle_generator_story(
+        prompt, duration, job.subtitle_prompts_path, job.cancel_token, fresh
+    )
+    require_file(job.subtitle_prompts_path, "Subtitle story generation failed")
+    return {"subtitle_prompts": job.subtitle_prompts_path}
+
+
+async def image_story_stage(job, prompt: str, duration: int, fresh: bool = False):
+    await image_generator_story(
+        prompt, duration, job.img_prompts_path, job.cancel_token, fresh
+    )
+    require_file(job.img_prompts_path, "Image story generation failed")
+    return {"img_prompts": job.img_prompts_path}
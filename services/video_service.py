@@ -16,6 +16,7 @@ from modules.gen_image import read_prompts, generate_images_from_prompts
 from video_creation.create_video import create_video, log_time_taken
 from helpers.aws_uploader import upload_to_s3
 from helpers.clean_video_folder import clean_video_folder
+from services.job_context import JobContext
 
 from config.logger import get_logger,log_time_taken
 
@@ -23,8 +24,85 @@ from config.logger import get_logger,log_time_taken
 logger = get_logger(__name__)
 
 
-from services.image_service import generate_images
-from services.story_service import generate_story_content
+from services.image_service import generate_images, images_stage
+from services.story_service import (
+    generate_story_content,
+    subtitle_story_stage,
+    image_story_stage,
+)
+from services.pipeline import Pipeline, Stage
+from video_creation.create_video import VIDEO_STAGES
+
+
+# Generate narration for the subtitle story; the cloned voice (if any) is
+# only needed for TTS, so it's deleted as soon as the audio exists
+async def audio_stage(
+    job, subtitle_prompts, voice_character, voice_files, voice_id=None
+):
+    cloned_voice_id = None
+    try:
+        audio_success, audio_path, cloned_voice_id = await process_voice(
+            voice_character, job, voice_files, voice_id
+        )
+        if not audio_success:
+            raise Exception(f"Audio generation failed: {audio_path}")
+        return {"audio": audio_path}
+    finally:
+        # Always clean up cloned voice if it exists
+        if cloned_voice_id:
+            logger.info(f"Cleaning up cloned voice: {cloned_voice_id}")
+            if await asyncio.to_thread(delete_cloned_voice, cloned_voice_id):
+                logger.info("Successfully deleted cloned voice")
+            else:
+                logger.error("Failed to delete cloned voice")
+
+
+# prompt -> story -> (narration -> transcript) + (images + clips) -> video
+VIDEO_PIPELINE = Pipeline(
+    [
+        Stage(
+            "subtitle_story",
+            subtitle_story_stage,
+            inputs=["prompt", "duration", "fresh"],
+            outputs=["subtitle_prompts"],
+            files=["subtitle_prompts"],
+            resource="api",
+        ),
+        Stage(
+            "image_story",
+            image_story_stage,
+            inputs=["prompt", "duration", "fresh"],
+            outputs=["img_prompts"],
+            files=["img_prompts"],
+            resource="api",
+        ),
+        Stage(
+            "audio",
+            audio_stage,
+            inputs=[
+                "subtitle_prompts",
+                "voice_character",
+                "voice_files",
+                "voice_id",
+            ],
+            outputs=["audio"],
+            files=["audio"],
+            resource="api",
+            cache=True,
+        ),
+        # No resource: images_stage holds an "api" slot only for Leonardo
+        Stage(
+            "images",
+            images_stage,
+            inputs=["img_prompts", "style", "aspect_ratio"],
+            outputs=["images", "clips"],
+            files=["images", "clips"],
+            cache=True,
+        ),
+        *VIDEO_STAGES,
+    ]
+)
+
 
 async def generate_video(
     prompt: str,
@@ -34,66 +112,75 @@ async def generate_video(
     bgm_audio: str,
     voice_character: str = "callum",
     voice_files: Optional[List[str]] = None,
-):
-    """Main function to handle video generation process"""
+    voice_id: Optional[str] = None,
+    job: Optional[JobContext] = None,
+    fresh: bool = False,
+) -> str:
+    """
+    Main function to handle video generation process.
+    Runs inside the job's own workspace and returns the final video path.
+    Every stage starts as soon as its inputs exist (see VIDEO_PIPELINE).
+    """
     total_start_time = time.time()
-    cloned_voice_id = None
+    job = job or JobContext()
 
     try:
-        # 1. Generate story content
-        await generate_story_content(prompt, duration)
-
-        # 2. Generate audio and images concurrently
-        audio_task = process_voice(voice_character, voice_files)
-        images_task = generate_images(style, aspect_ratio)
-
-        # Wait for both tasks to complete
-        (audio_success, audio_path, cloned_voice_id), _ = await asyncio.gather(
-            audio_task, images_task
+        values = await VIDEO_PIPELINE.run(
+            job,
+            {
+                "prompt": prompt,
+                "duration": duration,
+                "aspect_ratio": aspect_ratio,
+                "style": style,
+                "bgm_audio": bgm_audio,
+                "voice_character": voice_character,
+                "voice_files": voice_files,
+                "voice_id": voice_id,
+                "fresh": fresh,
+            },
         )
 
-        if not audio_success:
-            raise Exception(f"Audio generation failed: {audio_path}")
-
-        # 3. Create final video
-        start_time = time.time()
-        await create_video(
-            output_video_duration=duration,
-            bgm_audio=bgm_audio,
-            aspect_ratio=aspect_ratio,
-        )
-        log_time_taken("Video creation", start_time, time.time())
-
         # Log total time taken
         log_time_taken("Total video generation", total_start_time, time.time())
+        return values["final_video"]
 
     except Exception as e:
         logger.error(f"Error in video generation: {str(e)}", exc_info=True)
         raise
-    finally:
-        # Always clean up cloned voice if it exists
-        if cloned_voice_id:
-            logger.info(f"Cleaning up cloned voice: {cloned_voice_id}")
-            if delete_cloned_voice(cloned_voice_id):
-                logger.info("Successfully deleted cloned voice")
-            else:
-                logger.error("Failed to delete cloned voice")
 
 
 async def process_voice(
-    voice_character: str, voice_samples: Optional[List[str]] = None
+    voice_character: str,
+    job: JobContext,
+    voice_samples: Optional[List[str]] = None,
+    voice_id: Optional[str] = None,
 ) -> Tuple[bool, str, Optional[str]]:
     """
-    Generate audio using either default voice or cloned voice
+    Generate audio using either default voice or cloned voice.
+    `voice_id` is a voice already cloned by the caller (e.g. once for a
+    whole campaign), used as is and left for the caller to delete.
     Returns: (success, result_path, cloned_voice_id)
     """
     start_time = time.time()
     cloned_voice_id = None
 
     try:
-        if voice_samples:
-            cloned_voice_id = create_voice_clone(
-                voice_samples=voice_samples, voice_name="temp_voice_clone"
+        if voice_id:
+            # Use the caller's cloned voice
+            success, result = await asyncio.to_thread(
+                generate_audio,
+                character="clone",
+                voice_id=voice_id,
+                output_path=job.audio_path,
+                prompts_path=job.subtitle_prompts_path,
+                cancel=job.cancel_token,
+                on_paragraph=job.progress.step_callback("audio", "tts"),
+            )
+        elif voice_samples:
+            cloned_voice_id = await asyncio.to_thread(
+                create_voice_clone,
+                voice_samples=voice_samples,
+                voice_name="temp_voice_clone",
             )
 
             if not cloned_voice_id:
@@ -102,10 +189,14 @@ async def process_voice(
             logger.info(f"Voice clone created with ID: {cloned_voice_id}")
 
             # Use cloned voice for generation
-            success, result = generate_audio(
+            success, result = await asyncio.to_thread(
+                generate_audio,
                 character="clone",
-                voice_samples=voice_samples,
-                output_path="video_creation/assets/audio/combined_story_audio.wav",
+                voice_id=cloned_voice_id,
+                output_path=job.audio_path,
+                prompts_path=job.subtitle_prompts_path,
+                cancel=job.cancel_token,
+                on_paragraph=job.progress.step_callback("audio", "tts"),
             )
         else:
             # Validate default voice
@@ -113,9 +204,13 @@ async def process_voice(
                 raise Exception(f"Invalid voice character: {voice_character}")
 
             # Use default voice
-            success, result = generate_audio(
+            success, result = await asyncio.to_thread(
+                generate_audio,
                 character=voice_character,
-                output_path="video_creation/assets/audio/combined_story_audio.wav",
+                output_path=job.audio_path,
+                prompts_path=job.subtitle_prompts_path,
+                cancel=job.cancel_token,
+                on_paragraph=job.progress.step_callback("audio", "tts"),
             )
 
         log_time_taken("Audio generation", start_time, time.time())
@@ -125,9 +220,9 @@ async def process_voice(
 
         return success, result, cloned_voice_id
 
-    except Exception as e:
-        logger.error(f"Error in audio generation: {str(e)}")
-        # Clean up cloned voice if there was an error
+    except (Exception, asyncio.CancelledError) as e:
+        logger.error(f"Error in audio generation: {str(e) or type(e).__name__}")
+        # Clean up cloned voice if there was an error or the job was cancelled
         if cloned_voice_id:
-            delete_cloned_voice(cloned_voice_id)
+            await asyncio.to_thread(delete_cloned_voice, cloned_voice_id)
         raise
\ No newline at end of file
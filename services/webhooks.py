@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from config.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Shared secret for the X-Webhook-Signature header; unsigned without one
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Attempts per event, with exponential backoff (and jitter) between them
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6"))
+WEBHOOK_BACKOFF_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_SECONDS", "2"))
+WEBHOOK_MAX_BACKOFF_SECONDS = 300
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+# How long pending deliveries may keep retrying on shutdown
+WEBHOOK_SHUTDOWN_GRACE_SECONDS = 10
+
+# Answers worth retrying; any other client error is final
+RETRY_STATUSES = {408, 425, 429}
+
+
+def validate_callback_url(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise ValueError(f"Invalid callback URL: {url}")
+
+
+def sign(body: bytes, timestamp: str, secret: str = WEBHOOK_SECRET) -> str:
+    """
+    Signature of a webhook: HMAC-SHA256 of "{timestamp}.{body}". Receivers
+    recompute it with the shared secret and reject stale timestamps to
+    stop replays.
+    """
+    message = timestamp.encode() + b"." + body
+    return "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class WebhookSender:
+    """
+    POSTs job events to the callback URLs registered with the job, so
+    callers don't need to poll or hold a connection open for minutes.
+
+    Each event is a JSON body {"event", "delivery_id", "timestamp", "job"}
+    with the event name in X-Webhook-Event, a unique X-Webhook-Id (the same
+    on every retry, for deduplication) and, with WEBHOOK_SECRET set, an
+    X-Webhook-Signature (see `sign`) over X-Webhook-Timestamp and the body.
+
+    Failed deliveries (connection errors, timeouts, 5xx, 408/425/429) are
+    retried with exponential backoff. Events of one job are delivered to
+    each URL in order: an event waits until the previous one to that URL
+    was delivered or given up.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        # (job id, url) -> latest delivery
+        self._last: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._pending: Set[asyncio.Task] = set()
+
+    def send(self, url: str, event: str, job_id: str, payload: dict):
+        """Queue the delivery of `event`; returns at once."""
+        body = {
+            "event": event,
+            "delivery_id": uuid.uuid4().hex,
+            "timestamp": round(time.time(), 3),
+            "job": payload,
+        }
+        stream = (job_id, url)
+        task = asyncio.create_task(
+            self._deliver(self._last.get(stream), url, event, body)
+        )
+        self._last[stream] = task
+        self._pending.add(task)
+        task.add_done_callback(lambda _: self._done(stream, task))
+
+    def _done(self, stream: Tuple[str, str], task: asyncio.Task):
+        self._pending.discard(task)
+        if self._last.get(stream) is task:
+            del self._last[stream]
+
+    async def _deliver(
+        self, previous: Optional[asyncio.Task], url: str, event: str, body: dict
+    ):
+        if previous:
+            await asyncio.wait([previous])
+
+        data = json.dumps(body).encode()
+        for attempt in range(1, WEBHOOK_MAX_ATTEMPTS + 1):
+            timestamp = str(int(time.time()))
+            headers = {
+                "Content-Type": "application/json",
+                "X-Webhook-Event": event,
+                "X-Webhook-Id": body["delivery_id"],
+                "X-Webhook-Timestamp": timestamp,
+            }
+            if WEBHOOK_SECRET:
+                headers["X-Webhook-Signature"] = sign(data, timestamp, WEBHOOK_SECRET)
+            try:
+                async with self.session().post(url, data=data, headers=headers) as response:
+                    if response.status < 300:
+                        logger.info(f"Webhook {event} delivered to {url}")
+                        return
+                    error = f"HTTP {response.status}"
+                    if response.status < 500 and response.status not in RETRY_STATUSES:
+                        logger.error(f"Webhook {event} to {url} rejected: {error}")
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt == WEBHOOK_MAX_ATTEMPTS:
+                break
+            delay = min(
+                WEBHOOK_BACKOFF_SECONDS * 2 ** (attempt - 1), WEBHOOK_MAX_BACKOFF_SECONDS
+            )
+            delay *= random.uniform(0.5, 1.0)
+            logger.warning(
+                f"Webhook {event} to {url} failed ({error}), "
+                f"retry {attempt}/{WEBHOOK_MAX_ATTEMPTS - 1} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+        logger.error(
+            f"Webhook {event} to {url} failed after {WEBHOOK_MAX_ATTEMPTS} attempts"
+        )
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    async def close(self, grace: float = WEBHOOK_SHUTDOWN_GRACE_SECONDS):
+        """Give pending deliveries `grace` seconds, then drop them."""
+        if self._pending:
+            _, pending = await asyncio.wait(self._pending, timeout=grace)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Dropped {len(pending)} undelivered webhooks")
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+
+webhook_sender = WebhookSender()
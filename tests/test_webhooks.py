@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+from services import webhooks
+from services.webhooks import WebhookSender, sign
+
+
+class Receiver:
+    """
+    Local webhook endpoint. Answers each delivery with the statuses queued
+    for its event (`failures`) before answering 200, after `delays` seconds.
+    """
+
+    def __init__(self, failures=None, delays=None):
+        self.failures = {event: list(statuses) for event, statuses in (failures or {}).items()}
+        self.delays = delays or {}
+        self.requests = []  # (arrival, headers, body, status)
+
+    async def handle(self, request):
+        body = await request.read()
+        event = request.headers["X-Webhook-Event"]
+        arrival = time.monotonic()
+        await asyncio.sleep(self.delays.get(event, 0))
+        failures = self.failures.get(event)
+        status = failures.pop(0) if failures else 200
+        self.requests.append((arrival, dict(request.headers), body, status))
+        return web.Response(status=status)
+
+    @contextlib.asynccontextmanager
+    async def running(self):
+        app = web.Application()
+        app.router.add_post("/hook", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            yield f"http://127.0.0.1:{port}/hook"
+        finally:
+            await runner.cleanup()
+
+    def events(self, status=200):
+        return [
+            json.loads(body)["event"]
+            for _, _, body, answer in self.requests
+            if answer == status
+        ]
+
+
+def deliver(receiver, *events, job_id="job-1"):
+    """Send `events` for one job through a new sender and wait for them."""
+
+    async def run():
+        async with receiver.running() as url:
+            sender = WebhookSender()
+            for event in events:
+                sender.send(url, event, job_id, {"job_id": job_id})
+            await sender.close(grace=30)
+
+    asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_BACKOFF_SECONDS", 0.05)
+    monkeypatch.setattr(webhooks, "WEBHOOK_MAX_ATTEMPTS", 4)
+    monkeypatch.setattr(webhooks.random, "uniform", lambda low, high: high)
+
+
+def test_sign_is_hmac_of_timestamp_and_body():
+    body = b'{"event": "job.succeeded"}'
+    expected = hmac.new(
+        b"secret", b"1700000000." + body, hashlib.sha256
+    ).hexdigest()
+    assert sign(body, "1700000000", "secret") == f"sha256={expected}"
+    assert sign(body, "1700000001", "secret") != f"sha256={expected}"
+
+
+def test_deliveries_are_signed(monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_SECRET", "secret")
+    receiver = Receiver()
+    deliver(receiver, "job.succeeded")
+
+    [(_, headers, body, _)] = receiver.requests
+    assert headers["X-Webhook-Event"] == "job.succeeded"
+    assert headers["X-Webhook-Signature"] == sign(
+        body, headers["X-Webhook-Timestamp"], "secret"
+    )
+    assert json.loads(body)["job"] == {"job_id": "job-1"}
+
+
+def test_unsigned_without_secret(monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_SECRET", "")
+    receiver = Receiver()
+    deliver(receiver, "job.started")
+
+    [(_, headers, _, _)] = receiver.requests
+    assert "X-Webhook-Signature" not in headers
+
+
+def test_failures_are_retried_with_backoff():
+    receiver = Receiver(failures={"job.succeeded": [503, 429]})
+    deliver(receiver, "job.succeeded")
+
+    statuses = [status for _, _, _, status in receiver.requests]
+    assert statuses == [503, 429, 200]
+    # The same delivery id on every attempt, for deduplication
+    assert len({headers["X-Webhook-Id"] for _, headers, _, _ in receiver.requests}) == 1
+    arrivals = [arrival for arrival, _, _, _ in receiver.requests]
+    assert arrivals[1] - arrivals[0] >= 0.05
+    assert arrivals[2] - arrivals[1] >= 0.1  # doubled
+
+
+def test_client_errors_are_final():
+    receiver = Receiver(failures={"job.succeeded": [400]})
+    deliver(receiver, "job.succeeded")
+
+    assert [status for _, _, _, status in receiver.requests] == [400]
+
+
+def test_gives_up_after_max_attempts():
+    receiver = Receiver(failures={"job.succeeded": [500] * 10})
+    deliver(receiver, "job.succeeded")
+
+    assert len(receiver.requests) == webhooks.WEBHOOK_MAX_ATTEMPTS
+
+
+def test_events_of_a_job_arrive_in_order():
+    # The first event needs a retry and the second a slow answer; neither
+    # lets a later event of the job overtake it
+    receiver = Receiver(
+        failures={"job.started": [503]}, delays={"job.stage": 0.1}
+    )
+    deliver(receiver, "job.started", "job.stage", "job.succeeded")
+
+    assert receiver.events() == ["job.started", "job.stage", "job.succeeded"]
+    assert receiver.events(503) == ["job.started"]
+
+
+def test_jobs_are_not_ordered_behind_each_other():
+    receiver = Receiver(delays={"job.started": 0.3})
+
+    async def run():
+        async with receiver.running() as url:
+            sender = WebhookSender()
+            sender.send(url, "job.started", "job-1", {"job_id": "job-1"})
+            sender.send(url, "job.succeeded", "job-2", {"job_id": "job-2"})
+            await sender.close(grace=30)
+
+    asyncio.run(run())
+    assert receiver.events() == ["job.succeeded", "job.started"]
@@ -1,12 +1,15 @@
 import asyncio
+import functools
 import os
 import time
 from concurrent.futures import ProcessPoolExecutor
 import multiprocessing
 import logging
+from types import SimpleNamespace
 from dotenv import load_dotenv
 from openai import OpenAI  # Corrected OpenAI import
 from config.logger import get_logger,log_time_taken
+from config.timeouts import OPENAI_TIMEOUT_SECONDS
 
 logger = get_logger(__name__)
 
@@ -28,6 +31,10 @@ from video_creation.subtitle_processing import (
 # Video processing
 from video_creation.video_processing import add_subtitles_with_audio, add_bg_music
 
+from services.broker import get_broker
+from services.scheduler import scheduler, CPU_SLOTS
+from services.pipeline import Pipeline, Stage
+
 # ---- TESTING ---------#
 # Image processing
 # from image_processing import (
@@ -71,171 +78,391 @@ particle_system_dir = os.path.join(videos_dir, "particle_system")
 bg_music_dir = os.path.join(assets_dir, "bg_music")
 prompts_path = os.path.join(script_dir, "../", "prompts", "subtitle_gen_prompts.txt")
 
+# "local" renders in this process; "broker" hands clips, merging, subtitles
+# and bgm to render workers (python -m video_creation.render_worker)
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "local")
+
 # Load OpenAI Whisper client
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  # Using OpenAI client
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"), timeout=OPENAI_TIMEOUT_SECONDS
+)  # Using OpenAI client
 
 
 # Generate a video from a given image.
-def process_image_to_video(image_path, index, aspect_ratio):
+def process_image_to_video(
+    image_path, index, aspect_ratio, videos_dir=videos_dir, cancel=None, on_speed=None
+):
     start_time = time.time()  # Start time
     output_video = os.path.join(videos_dir, f"story_video_{index + 1}.mp4")
-    make_video_from_image(image_path, index, output_video, aspect_ratio)
+    make_video_from_image(
+        image_path, index, output_video, aspect_ratio, cancel, on_speed
+    )
     end_time = time.time()  # End time
     log_time_taken(f"process_image_to_video (Image {index + 1})", start_time, end_time)
     return output_video
 
 
 # Generate subtitles using Whisper from OpenAI.
-def generate_subtitles_from_audio():
+def generate_subtitles_from_audio(
+    audio_file_path=os.path.join(audio_dir, "combined_story_audio.wav"),
+    timeout=OPENAI_TIMEOUT_SECONDS,
+):
     start_time = time.time()  # Start time
-    audio_file_path = os.path.join(audio_dir, "combined_story_audio.wav")
     with open(audio_file_path, "rb") as audio_file:
         transcript = client.audio.transcriptions.create(
             file=audio_file,
             model="whisper-1",
             response_format="verbose_json",
             timestamp_granularities=["word"],
+            timeout=timeout,
         )
     end_time = time.time()  # End time
     log_time_taken("generate_subtitles_from_audio (Whisper)", start_time, end_time)
     return transcript
 
 
-# Main function to create the video from images, audio, and subtitles.
-async def create_video(output_video_duration: int,bgm_audio: str,aspect_ratio:str):
+# Whisper words -> plain dicts, so a transcript can be stored in a checkpoint
+def transcript_to_words(transcript):
+    return [
+        {"word": word.word, "start": word.start, "end": word.end}
+        for word in transcript.words
+    ]
+
+
+# Plain dicts -> objects with the same attributes as Whisper words
+def transcript_from_words(words):
+    return SimpleNamespace(words=[SimpleNamespace(**word) for word in words])
+
+
+def bgm_track_path(bgm_audio):
+    return os.path.join(bg_music_dir, f"{bgm_audio}.mp3")
+
+
+def require_file(path, error):
+    if not os.path.exists(path):
+        raise Exception(f"{error}: '{path}' was not created")
+
 
-# testing
-# def create_video(output_video_duration: int, bgm_audio: str, aspect_ratio: str):
-    # Ensure directories exist
-    os.makedirs(images_dir, exist_ok=True)
-    os.makedirs(audio_dir, exist_ok=True)
-    os.makedirs(videos_dir, exist_ok=True)
-    os.makedirs(subtitles_dir, exist_ok=True)
-    os.makedirs(particle_system_dir, exist_ok=True)
+# ---- Pipeline stages ----
+# Each stage takes the job plus its inputs and returns its outputs by name,
+# see services/pipeline.py.
+
+
+# Stage functions that render workers may run, by name
+RENDER_STAGES = {}
+
+# Process pool shared by all jobs; renders are admitted by the scheduler's
+# "cpu" slots, so the pool never runs more than CPU_SLOTS clips at once
+_render_pool = None
+
+
+def get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=CPU_SLOTS)
+    return _render_pool
+
+
+def render_task(stage_func):
+    """
+    Run a CPU-heavy stage on a render worker when RENDER_BACKEND is
+    "broker", or locally in one of the scheduler's "cpu" slots. Its inputs
+    and outputs must be JSON, and the job workspace must be on a volume
+    shared with the workers.
+    """
+    RENDER_STAGES[stage_func.__name__] = stage_func
+
+    @functools.wraps(stage_func)
+    async def run(job, **inputs):
+        if RENDER_BACKEND != "broker":
+            async with scheduler.slot("cpu", job.priority_key):
+                return await stage_func(job, **inputs)
+        return await get_broker().run(
+            "stage",
+            {
+                "stage": stage_func.__name__,
+                "job_id": job.job_id,
+                "root": os.path.dirname(job.work_dir),
+                "inputs": inputs,
+                # The worker obeys the same stage budget
+                "deadline": job.cancel_token.deadline,
+                "scope": job.cancel_token.scope,
+            },
+            job.priority_key,
+        )
+
+    return run
+
+
+class ClipRenderer:
+    """
+    Renders clips as soon as each image is available, instead of waiting
+    for the whole image set: in the shared process pool (one "cpu" slot
+    per clip), or as one broker task per clip when RENDER_BACKEND is
+    "broker". Use as a context manager; `render` is a valid `on_image`
+    callback for generate_images_from_prompts.
+
+    With a `progress` log, every finished clip (of `total`, if known) and
+    the encode speed of every render are reported under `stage`.
+    """
+
+    def __init__(
+        self,
+        aspect_ratio,
+        videos_dir=videos_dir,
+        priority=None,
+        cancel=None,
+        progress=None,
+        stage="clips",
+        total=None,
+    ):
+        self.aspect_ratio = aspect_ratio
+        self.videos_dir = videos_dir
+        self.priority = priority
+        self.cancel = cancel
+        self.progress = progress
+        self.stage = stage
+        self.total = total
+        self._futures = {}
+        self._rendered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # When the stage failed, drop clips that are still waiting
+        if exc_info[0] is not None:
+            for future in self._futures.values():
+                future.cancel()
+
+    def render(self, image_path, number):
+        """Queue the clip for image `number` (1-based, like story_img_{n}.png)."""
+        if number in self._futures:
+            return
+        render = (
+            self._render_remote if RENDER_BACKEND == "broker" else self._render_local
+        )
+        future = asyncio.ensure_future(render(image_path, number))
+        future.add_done_callback(functools.partial(self._report, number))
+        self._futures[number] = future
+
+    def _report(self, number, future):
+        if self.progress and not future.cancelled() and not future.exception():
+            self._rendered += 1
+            self.progress.step(
+                self.stage, "clip", self._rendered, self.total, clip=number
+            )
+
+    async def _render_local(self, image_path, number):
+        async with scheduler.slot("cpu", self.priority):
+            return await asyncio.get_running_loop().run_in_executor(
+                get_render_pool(),
+                process_image_to_video,
+                image_path,
+                number - 1,
+                self.aspect_ratio,
+                self.videos_dir,
+                self.cancel,
+                self.progress.speed_callback(self.stage, clip=number)
+                if self.progress
+                else None,
+            )
+
+    async def _render_remote(self, image_path, number):
+        result = await get_broker().run(
+            "clip",
+            {
+                "image_path": image_path,
+                "index": number - 1,
+                "aspect_ratio": self.aspect_ratio,
+                "videos_dir": self.videos_dir,
+                "work_dir": self.cancel.work_dir if self.cancel else None,
+                "deadline": self.cancel.deadline if self.cancel else None,
+                "scope": self.cancel.scope if self.cancel else None,
+                "progress_stage": self.stage if self.progress else None,
+            },
+            self.priority,
+        )
+        return result["clip"]
+
+    async def clips(self, images):
+        """Wait for the clip of every image (queueing any not seen yet)."""
+        self.total = len(images)
+        for number, image in enumerate(images, start=1):
+            self.render(image, number)
+        clips = await asyncio.gather(
+            *(self._futures[number] for number in range(1, len(images) + 1))
+        )
+        for clip in clips:
+            require_file(clip, "Clip rendering failed")
+        return list(clips)
+
+
+# Step 1: Generate videos from images
+async def render_clips_stage(job, images, aspect_ratio):
+    with ClipRenderer(
+        aspect_ratio,
+        job.videos_dir,
+        job.priority_key,
+        job.cancel_token,
+        job.progress,
+        total=len(images),
+    ) as renderer:
+        clips = await renderer.clips(images)
+    return {"clips": clips}
+
+
+# Step 2: Generate transcript (only needs the narration)
+async def transcribe_stage(job, audio):
+    transcript = await asyncio.to_thread(
+        generate_subtitles_from_audio,
+        audio,
+        job.cancel_token.timeout(OPENAI_TIMEOUT_SECONDS),
+    )
+    return {"transcript": transcript_to_words(transcript)}
+
+
+# Step 3: Merge all generated videos (doesn't wait for the transcript)
+@render_task
+async def merge_stage(job, clips):
+    merged_video = job.merged_video_path
+    await asyncio.to_thread(
+        merge_videos,
+        clips,
+        merged_video,
+        job.cancel_token,
+        job.progress.speed_callback("merge"),
+    )
+    require_file(merged_video, "Merging clips failed")
+    return {"merged_video": merged_video}
+
+
+# Step 4: Add subtitles with audio to the merged video
+@render_task
+async def subtitles_stage(job, merged_video, audio, transcript):
+    subtitled_video = job.subtitled_video_path
+    await asyncio.to_thread(
+        add_subtitle_with_audio,
+        merged_video,
+        audio,
+        transcript_from_words(transcript),
+        subtitled_video,
+        job.cancel_token,
+        job.progress.speed_callback("subtitles"),
+    )
+    require_file(subtitled_video, "Adding subtitles failed")
+    return {"subtitled_video": subtitled_video}
+
+
+# Step 5: Add background music to the final video
+# If there is no bgm_audio selected, the subtitled video is the final one.
+@render_task
+async def bgm_stage(job, subtitled_video, bgm_audio):
+    if bgm_audio == "":
+        return {"final_video": subtitled_video}
+
+    final_output_video = job.final_video_path(bgm_audio)
+    bg_music_path = bgm_track_path(bgm_audio)  # passing selected bgm audio
+    await asyncio.to_thread(
+        add_bg_music,
+        subtitled_video,
+        bg_music_path,
+        final_output_video,
+        job.cancel_token,
+        job.progress.speed_callback("bgm"),
+    )
+    require_file(final_output_video, "Adding background music failed")
+    return {"final_video": final_output_video}
+
+
+# Renders clips for images that already exist. The generation pipelines
+# render while downloading instead (see services/image_service.py).
+CLIPS_STAGE = Stage(
+    "clips",
+    render_clips_stage,
+    inputs=["images", "aspect_ratio"],
+    outputs=["clips"],
+    files=["clips"],
+    cache=True,
+)
+
+# Stages from clips + narration to the final video
+VIDEO_STAGES = [
+    Stage(
+        "transcript",
+        transcribe_stage,
+        inputs=["audio"],
+        outputs=["transcript"],
+        resource="api",
+        cache=True,
+    ),
+    Stage(
+        "merge",
+        merge_stage,
+        inputs=["clips"],
+        outputs=["merged_video"],
+        files=["merged_video"],
+        cache=True,
+    ),
+    Stage(
+        "subtitles",
+        subtitles_stage,
+        inputs=["merged_video", "audio", "transcript"],
+        outputs=["subtitled_video"],
+        files=["subtitled_video"],
+        cache=True,
+    ),
+    Stage(
+        "bgm",
+        bgm_stage,
+        inputs=["subtitled_video", "bgm_audio"],
+        outputs=["final_video"],
+        files=["final_video"],
+        # The track is read by name, so its content goes into the key
+        cache=lambda inputs: {"track": bgm_track_path(inputs["bgm_audio"])},
+    ),
+]
+
+
+# Main function to create the video from images, audio, and subtitles
+# already present in the job's workspace. Returns the final video path.
+async def create_video(
+    output_video_duration: int, bgm_audio: str, aspect_ratio: str, job
+):
     os.makedirs(bg_music_dir, exist_ok=True)
 
     # Read the prompts
-    with open(prompts_path, "r") as f:
+    with open(job.subtitle_prompts_path, "r") as f:
         captions = f.read().splitlines()
 
     # Count the no. of prompts
     segments = len(captions)
-    images = [
-        os.path.join(images_dir, f"story_img_{i + 1}.png") for i in range(segments)
-    ]
-    audios = [os.path.join(audio_dir, f"prompt_{i + 1}.mp3") for i in range(segments)]
-
-    # Step 1: Generate videos from images
-    start_time_parallel = time.time()
-    with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-        video_futures = [
-            executor.submit(process_image_to_video, img, i, aspect_ratio)
-            for i, img in enumerate(images)
-        ]
-        # audio_future = executor.submit(process_audio, audios)
-        processed_videos = [future.result() for future in video_futures]
-        # combined_audio = audio_future.result()  # Ensure the audio is created
-
-    end_time_parallel = time.time()
-    log_time_taken(
-        "Parallel tasks: img to videos:",
-        start_time_parallel,
-        end_time_parallel,
-    )
-
-    # # Step 2: Generate transcript synchronously
-    start_transcript_time = time.time()
-    combined_audio = os.path.join(audio_dir, "combined_story_audio.wav")
-    transcript = generate_subtitles_from_audio()
-    end_transcript_time = time.time()
-    log_time_taken("Transcript generation:", start_transcript_time, end_transcript_time)
-
-    # Step 3: Merge all generated videos (sequential)
-    start_time_merge = time.time()
-    merged_video = os.path.join(videos_dir, "merged_story_video.mp4")
-    merge_videos(processed_videos, merged_video)
-    end_time_merge = time.time()
-    log_time_taken("merge_videos", start_time_merge, end_time_merge)
-
-    #---------------------------
-    # Step 4: Add particle effect (sequential)
-    # start_time_particle = time.time()
-    # pstyle = "test-rising-embers"
-    # particle_video = os.path.join(particle_system_dir, f"{pstyle}.mp4")
-    # particle_final_output_file = os.path.join(videos_dir, "particle_final_output.mp4")
-    # add_particle_effect(
-    #     input_video=merged_video,
-    #     output_video_duration=output_video_duration,
-    #     particle_video=particle_video,
-    #     output_video=particle_final_output_file,
-    # )
-    # end_time_particle = time.time()
-    # log_time_taken("add_particle_effect", start_time_particle, end_time_particle)
-    #---------------------------
-
-    #-----
-    # # Step 5: Generate subtitle file using the Whisper transcription (sequential)
-    # start_time_subtitles = time.time()
-    # subtitle_file = os.path.join(subtitles_dir, "story_subtitles.srt")
-    # generate_subtitle_file(transcript.words, subtitle_file)
-    # end_time_subtitles = time.time()
-    # log_time_taken("generate_subtitle_file", start_time_subtitles, end_time_subtitles)
-
-    # # Step 6: Modify the subtitle style (sequential)
-    # start_time_modify_subtitle = time.time()
-    # modified_subtitle_file = os.path.join(subtitles_dir, "story_subtitles.ass")
-    # modify_subtitle_style(subtitle_file, modified_subtitle_file)
-    # end_time_modify_subtitle = time.time()
-    # log_time_taken(
-    #     "modify_subtitle_style", start_time_modify_subtitle, end_time_modify_subtitle
-    # )
-
-    # # Step 7: Add subtitles with audio to the video (sequential)
-    # start_time_final_video = time.time()
-    # final_video_with_subtitles = os.path.join(
-    #     videos_dir, "final_output_video_subtitles.mp4"
-    # )
-    # add_subtitles_with_audio(
-    #     merged_video,  # particle_final_output_file,
-    #     modified_subtitle_file,
-    #     combined_audio,
-    #     final_video_with_subtitles,
-    # )
-    # end_time_final_video = time.time()
-    # log_time_taken(
-    #     "add_subtitles_with_audio", start_time_final_video, end_time_final_video
-    # )
-    #-------------
-
-    ##
-    # Step:
-    final_video_with_subtitles = os.path.join(
-        videos_dir, "final_output_video_subtitles.mp4"
-    )
-    add_subtitle_with_audio(
-        merged_video,
-        combined_audio,
-        transcript,
-        final_video_with_subtitles
+    images = [job.image_path(i + 1) for i in range(segments)]
+
+    values = await Pipeline([CLIPS_STAGE, *VIDEO_STAGES]).run(
+        job,
+        {
+            "images": images,
+            "audio": job.audio_path,
+            "aspect_ratio": aspect_ratio,
+            "bgm_audio": bgm_audio,
+        },
     )
-    
-
-    # If there is no bgm_audio selected, don't do this step.
-    # Step 8: Add background music to the final video (sequential)
-    if bgm_audio != "":
-        start_time_bg_music = time.time()
-        final_output_video = os.path.join(videos_dir, "final_output_video_bgm.mp4")
-        bg_music_path = os.path.join(
-            bg_music_dir, f"{bgm_audio}.mp3"
-        )  # passing selected bgm audio
-        add_bg_music(final_video_with_subtitles, bg_music_path, final_output_video)
-        end_time_bg_music = time.time()
-        log_time_taken("add_bg_music", start_time_bg_music, end_time_bg_music)
 
     logger.info("Video processing completed successfully!")
+    return values["final_video"]
 
 
 # Entry point for running this script directly
 if __name__ == "__main__":
-    asyncio.run(create_video(output_video_duration=45, bgm_audio="dark", aspect_ratio="9:16"))
+    from services.job_context import JobContext
+
+    asyncio.run(
+        create_video(
+            output_video_duration=45,
+            bgm_audio="dark",
+            aspect_ratio="9:16",
+            job=JobContext("local-test"),
+        )
+    )
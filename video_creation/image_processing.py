@@ -3,6 +3,16 @@ import subprocess
 import random
 import shlex
 import logging
+from typing import Optional, Tuple
+
+from config.caches import CLIP_CACHE_MAX_BYTES
+from helpers.cancellation import (
+    BudgetExceeded,
+    JobCancelled,
+    atomic_output,
+    run_process,
+)
+from helpers.disk_cache import DiskCache, file_digest, link_or_copy
 
 VALID_VIDEO_ASPECT_RATIOS = {
     "9:16": {"width": 720, "height": 1280},  # Portrait
@@ -10,12 +20,60 @@ VALID_VIDEO_ASPECT_RATIOS = {
     "1:1": {"width": 720, "height": 720},  # Square
 }
 
+# Corner (or center) a clip zooms into: x, y of the zoompan window
+ZOOM_AREAS = {
+    "center": ("iw/2-(iw/zoom/2)", "ih/2-(ih/zoom/2)"),
+    "top-left": ("0", "0"),
+    "top-right": ("iw-(iw/zoom)", "0"),
+    "bottom-right": ("iw-(iw/zoom)", "ih-(ih/zoom)"),
+}
+# Picked at random for clips that don't ask for one
+RANDOM_ZOOM_AREAS = ["top-left", "top-right", "center"]
+
+CLIP_ENCODER = {
+    "codec": "libx264",
+    "preset": "medium",
+    "crf": 23,
+    "pix_fmt": "yuv420p",
+    "fps": 30,
+}
+
+# Rendered clips by image content and motion/encoder parameters, so the
+# same image (from the image cache or a re-render) is encoded only once
+clip_cache = DiskCache("clips", CLIP_CACHE_MAX_BYTES, suffix=".mp4")
+
 logger = logging.getLogger()
 
 
+def clip_cache_key(image_digest: str, params: dict) -> str:
+    return DiskCache.key(image_digest, params)
+
+
 # new
-def make_video_from_image(image: str, i: int, output_video: str, aspect_ratio):
-    """Generate a video from an image with optional shaky effect applied alternately."""
+def make_video_from_image(
+    image: str,
+    i: int,
+    output_video: str,
+    aspect_ratio,
+    cancel=None,
+    on_speed=None,
+    zoom_area: Optional[str] = None,
+    zoom_speed: float = 0.003,
+    max_zoom: float = 1.5,
+    size: Optional[Tuple[int, int]] = None,
+    video_duration: int = 7,
+    encoder: Optional[dict] = None,
+):
+    """
+    Generate a Ken Burns clip from an image: a slow zoom into `zoom_area`
+    (one of ZOOM_AREAS, random when not given) by `zoom_speed` per frame up
+    to `max_zoom`, at `size` (width, height; the aspect ratio's by default),
+    encoded with `encoder` settings over CLIP_ENCODER.
+    A clip rendered before from the same image content and parameters is
+    taken from the clip cache without running ffmpeg.
+    ffmpeg is killed if the `cancel` token (helpers/cancellation.py) is set,
+    and reports its encode speed to `on_speed`.
+    """
     # Validate input image exists
     if not os.path.exists(image):
         logger.error(f"Image file not found: {image}")
@@ -26,31 +84,41 @@ def make_video_from_image(image: str, i: int, output_video: str, aspect_ratio):
     os.makedirs(output_dir, exist_ok=True)
 
     # Use predefined aspect ratios
-    width = VALID_VIDEO_ASPECT_RATIOS[aspect_ratio]["width"]
-    height = VALID_VIDEO_ASPECT_RATIOS[aspect_ratio]["height"]
+    if size:
+        width, height = size
+    else:
+        width = VALID_VIDEO_ASPECT_RATIOS[aspect_ratio]["width"]
+        height = VALID_VIDEO_ASPECT_RATIOS[aspect_ratio]["height"]
+    encoder = {**CLIP_ENCODER, **(encoder or {})}
 
     try:
-        video_duration = 7  # 7 seconds each video
-        zoom_speed = 0.003  # Slow zoom speed
-        max_zoom = 1.5
-        zoom_area_list = ["top-left", "top-right", "center"]
-        zoom_area = random.choice(zoom_area_list)
+        if zoom_area is not None and zoom_area not in ZOOM_AREAS:
+            raise ValueError("Invalid zoom area specified")
+
+        params = {
+            "zoom_speed": zoom_speed,
+            "max_zoom": max_zoom,
+            "size": [width, height],
+            "duration": video_duration,
+            "encoder": encoder,
+        }
+        image_digest = file_digest(image) if clip_cache.enabled else None
+        if image_digest:
+            # Without a requested zoom area, a clip of any of the random
+            # ones will do
+            cached = clip_cache.get_any(
+                clip_cache_key(image_digest, {**params, "zoom_area": area})
+                for area in ([zoom_area] if zoom_area else RANDOM_ZOOM_AREAS)
+            )
+            if cached:
+                link_or_copy(cached, output_video)
+                logger.info(f"Video from image taken from the clip cache: '{output_video}'")
+                return True
+
+        zoom_area = zoom_area or random.choice(RANDOM_ZOOM_AREAS)
 
         # Determine the x, y coordinates for the zoom area
-        if zoom_area == "center":
-            x = "iw/2-(iw/zoom/2)"
-            y = "ih/2-(ih/zoom/2)"
-        elif zoom_area == "top-left":
-            x = "0"
-            y = "0"
-        elif zoom_area == "top-right":
-            x = "iw-(iw/zoom)"
-            y = "0"
-        elif zoom_area == "bottom-right":
-            x = "iw-(iw/zoom)"
-            y = "ih-(ih/zoom)"
-        else:
-            raise ValueError("Invalid zoom area specified")
+        x, y = ZOOM_AREAS[zoom_area]
 
         # # Apply alternate shaky effect
         # if i % 2 == 0:
@@ -66,37 +134,49 @@ def make_video_from_image(image: str, i: int, output_video: str, aspect_ratio):
                 f"scale={width}:{height}"
             )
 
-        # FFmpeg command
+        # FFmpeg command, less the output path
         ffmpeg_command = (
             f"ffmpeg -loglevel verbose -y -loop 1 -i {shlex.quote(image)} "
-            f'-vf "{filter_complex},format=yuv420p" '
+            f'-vf "{filter_complex},format={encoder["pix_fmt"]}" '
             f"-t {video_duration} "
             f"-color_range pc -color_primaries bt709 -color_trc bt709 -colorspace bt709 "
-            f"-c:v libx264 -preset medium -crf 23 -pix_fmt yuv420p -r 30 {shlex.quote(output_video)}"
+            f"-c:v {encoder['codec']} -preset {encoder['preset']} -crf {encoder['crf']} "
+            f"-pix_fmt {encoder['pix_fmt']} -r {encoder['fps']}"
         )
 
-        # Execute the FFmpeg command
-        result = subprocess.run(
-            ffmpeg_command,
-            shell=True,
-            check=False,
-            capture_output=True,
-            text=True,
-        )
-
-        # Check subprocess result
-        if result.returncode != 0:
+        # Execute the FFmpeg command; the clip only appears once complete
+        try:
+            with atomic_output(output_video) as partial:
+                run_process(
+                    f"{ffmpeg_command} {shlex.quote(partial)}",
+                    cancel=cancel,
+                    shell=True,
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                    on_speed=on_speed,
+                )
+        except subprocess.CalledProcessError as e:
             logger.error(f"FFmpeg error converting {image}:")
-            logger.error(result.stderr)
+            logger.error(e.stderr)
             return False
 
         if not os.path.exists(output_video):
             logger.error(f"Video was not created for {image}")
             return False
 
+        if image_digest:
+            clip_cache.put_file(
+                clip_cache_key(image_digest, {**params, "zoom_area": zoom_area}),
+                output_video,
+            )
+
         logger.info(f"Video from image saved as '{output_video}'")
         return True
 
+    except (JobCancelled, BudgetExceeded):
+        # ffmpeg was killed: the clip must not count as rendered
+        raise
     except Exception as e:
         logger.error(f"Error generating video from image '{image}': {e}")
         return False
@@ -391,7 +471,12 @@ def make_video_from_image(image: str, i: int, output_video: str, aspect_ratio):
 
 
 # currently using
-def merge_videos(videos, output_file):
+def merge_videos(videos, output_file, cancel=None, on_speed=None):
+    """
+    Concatenate the clips with random transitions. ffmpeg failures raise,
+    and `output_file` only appears once complete, so a re-run stage never
+    takes a partial file from an earlier attempt.
+    """
     try:
         # Prepare input files for ffmpeg command
         input_files = " ".join([f"-i {video}" for video in videos])
@@ -421,22 +506,24 @@ def merge_videos(videos, output_file):
         # Remove the trailing semicolon and space
         filter_complex = filter_complex.rstrip("; ")
 
-        # Construct the full ffmpeg command
-        ffmpeg_command = (
-            f"ffmpeg {input_files} "
-            f'-filter_complex "{filter_complex}" '
-            f'-map "[v0{len(videos)-1}]" -c:v libx264 -crf 22 {output_file}'
-        )
+        with atomic_output(output_file) as partial:
+            # Construct the full ffmpeg command
+            ffmpeg_command = (
+                f"ffmpeg -y {input_files} "
+                f'-filter_complex "{filter_complex}" '
+                f'-map "[v0{len(videos)-1}]" -c:v libx264 -crf 22 {partial}'
+            )
 
-        # Execute the ffmpeg command
-        subprocess.run(shlex.split(ffmpeg_command), check=True)
+            # Execute the ffmpeg command
+            run_process(
+                shlex.split(ffmpeg_command), cancel=cancel, check=True, on_speed=on_speed
+            )
         logger.info(f"Final video saved as '{output_file}'")
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Error concatenating videos: {e}")
         logger.error(f"FFmpeg output: {e.output}")
-    except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        raise
 
 def add_particle_effect(
     input_video,
@@ -0,0 +1,137 @@
+"""
+Render worker: pulls clip and render-stage tasks from the broker and runs
+them, so ffmpeg/moviepy work can be scaled separately from the API.
+
+Run any number of these on machines sharing the job volume with the API
+(started with RENDER_BACKEND=broker):
+
+    python -m video_creation.render_worker --processes 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from config.logger import get_logger, log_time_taken, setup_logging
+from helpers.cancellation import CancelToken
+from helpers.progress import ProgressLog
+from services.broker import Broker, get_broker
+from services.job_context import JobContext
+from video_creation.create_video import RENDER_STAGES, process_image_to_video
+
+logger = get_logger(__name__)
+
+# Seconds to sleep when the queue is empty
+RENDER_WORKER_IDLE_DELAY = float(os.getenv("RENDER_WORKER_IDLE_DELAY", "1"))
+
+
+def run_task(task: dict) -> dict:
+    """Execute one broker task and return its JSON result."""
+    payload = task["payload"]
+
+    if task["kind"] == "clip":
+        cancel = None
+        if payload.get("work_dir"):
+            cancel = CancelToken(
+                payload["work_dir"],
+                payload.get("deadline"),
+                payload.get("scope") or "Job",
+            )
+        if cancel:
+            cancel.raise_if_cancelled()
+        on_speed = None
+        if payload.get("work_dir") and payload.get("progress_stage"):
+            on_speed = ProgressLog(payload["work_dir"]).speed_callback(
+                payload["progress_stage"], clip=payload["index"] + 1
+            )
+        clip = process_image_to_video(
+            payload["image_path"],
+            payload["index"],
+            payload["aspect_ratio"],
+            payload["videos_dir"],
+            cancel,
+            on_speed,
+        )
+        return {"clip": clip}
+
+    if task["kind"] == "stage":
+        stage_func = RENDER_STAGES.get(payload["stage"])
+        if not stage_func:
+            raise ValueError(f"Unknown render stage: {payload['stage']}")
+        # The API process owns the workspace; never recreate a removed one
+        job = JobContext(payload["job_id"], root=payload["root"], create=False)
+        if payload.get("deadline"):
+            job = job.scoped(payload["deadline"], payload["scope"])
+        job.cancel_token.raise_if_cancelled()
+        return asyncio.run(stage_func(job, **payload["inputs"]))
+
+    raise ValueError(f"Unknown render task kind: {task['kind']}")
+
+
+def keep_alive(broker: Broker, task_id: str, worker_id: str, stop: threading.Event):
+    """Renew the task lease until `stop` is set."""
+    interval = max(getattr(broker, "lease_seconds", 60) / 3, 1)
+    while not stop.wait(interval):
+        broker.heartbeat(task_id, worker_id)
+
+
+def work(worker_id: str):
+    broker = get_broker()
+    logger.info(f"Render worker {worker_id} started")
+
+    while True:
+        task = broker.claim(worker_id)
+        if not task:
+            time.sleep(RENDER_WORKER_IDLE_DELAY)
+            continue
+
+        task_id = task["task_id"]
+        logger.info(f"Render worker {worker_id} running {task['kind']} task {task_id}")
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=keep_alive, args=(broker, task_id, worker_id, stop), daemon=True
+        )
+        heartbeat.start()
+        start_time = time.time()
+        try:
+            broker.complete(task_id, run_task(task))
+        except Exception as e:
+            logger.error(f"Render task {task_id} failed: {str(e)}", exc_info=True)
+            broker.fail(task_id, str(e))
+        finally:
+            stop.set()
+            heartbeat.join()
+            log_time_taken(f"Render task {task_id}", start_time, time.time())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run render workers")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.getenv("RENDER_WORKER_PROCESSES", "1")),
+        help="Number of worker processes on this machine",
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    if args.processes == 1:
+        work(prefix)
+        return
+
+    processes = [
+        multiprocessing.Process(target=work, args=(f"{prefix}-{n}",))
+        for n in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,14 @@ from moviepy.editor import (
 import subprocess
 import numpy as np
 
+from helpers.cancellation import (
+    BudgetExceeded,
+    JobCancelled,
+    atomic_output,
+    cancellable_logger,
+)
+from video_creation.word_sprites import word_clip, word_size
+
 # Global Configuration
 # FONT = "Helvetica"
 FONT = "helpers/fonts/Chewy-Regular.ttf"
@@ -109,18 +117,14 @@ def create_box_clip(word, frame_size, position, duration):
     """Create a box background for a word"""
     padding = 9  # Padding around the word
 
-    # Create temporary text clip to get dimensions
-    temp_clip = TextClip(
-        word.word,
-        font=FONT,
-        fontsize=int(frame_size[1] * FONT_SIZE_RATIO),
-        color=BASE_TEXT_COLOR,
-        method="label",
+    # Dimensions of the word without stroke, from the font metrics table
+    width, height = word_size(
+        word.word, FONT, int(frame_size[1] * FONT_SIZE_RATIO)
     )
 
     # Create box with padding
     box = ColorClip(
-        size=(int(temp_clip.w + 1.2 * padding), int(temp_clip.h + padding)),
+        size=(int(width + 1.2 * padding), int(height + padding)),
         color=BOX_COLOR,
         ismask=False,
     )
@@ -130,27 +134,25 @@ def create_box_clip(word, frame_size, position, duration):
     box = box.set_duration(duration)
     box = box.set_opacity(1)  # Make box semi-transparent
 
-    temp_clip.close()
     return box
 
 
 def create_sentence_clips(sentence_words, frame_size):
-    """Create clips for a sentence with configurable highlighting"""
+    """
+    Create clips for a sentence with configurable highlighting. Words come
+    from the sprite cache (video_creation/word_sprites.py), so ImageMagick
+    only runs for words not rendered in this font, size and colour before.
+    """
     clips = []
     base_y = frame_size[1] * 0.7  # height of subtitles
+    fontsize = int(frame_size[1] * FONT_SIZE_RATIO)
     total_width = 0
     word_clips = []
 
     # First pass: create all word clips to calculate total width
     for word in sentence_words:
-        clip = TextClip(
-            word.word,
-            font=FONT,
-            fontsize=int(frame_size[1] * FONT_SIZE_RATIO),
-            color=BASE_TEXT_COLOR,
-            stroke_color=STROKE_COLOR,
-            stroke_width=STROKE_WIDTH,
-            method="label",
+        clip = word_clip(
+            word.word, FONT, fontsize, BASE_TEXT_COLOR, STROKE_COLOR, STROKE_WIDTH
         )
         word_clips.append((word, clip))
         total_width += clip.w + WORD_SPACING
@@ -185,14 +187,13 @@ def create_sentence_clips(sentence_words, frame_size):
 
         if HIGHLIGHT_MODE == "per_word":
             # Create yellow highlighted word
-            highlight_clip = TextClip(
+            highlight_clip = word_clip(
                 word.word,
-                font=FONT,
-                fontsize=int(frame_size[1] * FONT_SIZE_RATIO),
-                color=HIGHLIGHT_COLOR,
-                stroke_color=STROKE_COLOR,
-                stroke_width=STROKE_WIDTH,
-                method="label",
+                FONT,
+                fontsize,
+                HIGHLIGHT_COLOR,
+                STROKE_COLOR,
+                STROKE_WIDTH,
             ).set_position((current_x, base_y))
 
             highlight_clip = highlight_clip.set_start(word.start)
@@ -209,8 +210,14 @@ def create_sentence_clips(sentence_words, frame_size):
 
 # --
 
-def add_subtitle_with_audio(video_path, audio_path, transcript, output_path):
-    """Create final video with TikTok-style subtitles and audio"""
+def add_subtitle_with_audio(
+    video_path, audio_path, transcript, output_path, cancel=None, on_speed=None
+):
+    """
+    Create final video with TikTok-style subtitles and audio.
+    Writing stops (raising) if the `cancel` token (helpers/cancellation.py)
+    is set; the encode speed is reported to `on_speed`.
+    """
     try:
         # Load video and audio
         video = VideoFileClip(video_path)
@@ -232,10 +239,19 @@ def add_subtitle_with_audio(video_path, audio_path, transcript, output_path):
         # Combine all clips
         final_video = CompositeVideoClip([video] + all_clips, size=frame_size)
 
-        # Write final video
-        final_video.write_videofile(
-            output_path, fps=24, codec="libx264", audio_codec="aac"
-        )
+        # Write final video; it only appears at output_path once complete
+        with atomic_output(output_path) as partial:
+            final_video.write_videofile(
+                partial,
+                fps=24,
+                codec="libx264",
+                audio_codec="aac",
+                logger=(
+                    cancellable_logger(cancel, on_speed, fps=24)
+                    if cancel or on_speed
+                    else "bar"
+                ),
+            )
 
         # Clean up
         video.close()
@@ -244,6 +260,8 @@ def add_subtitle_with_audio(video_path, audio_path, transcript, output_path):
 
         return output_path
 
+    except (JobCancelled, BudgetExceeded):
+        raise
     except Exception as e:
         print(f"Error creating final video: {e}")
         return None
@@ -1,12 +1,36 @@
+import math
 import os
 import subprocess
 import logging
 
+from config.caches import BGM_CACHE_MAX_BYTES
+from helpers.cancellation import (
+    BudgetExceeded,
+    JobCancelled,
+    atomic_output,
+    run_process,
+)
+from helpers.disk_cache import DiskCache, file_digest
 
 logger = logging.getLogger()
 
+# Level of the background music under the narration
+BGM_VOLUME = 0.04
+# Tracks are normalized to this loudness first, so every track sits at the
+# same level under the narration
+BGM_LOUDNESS_LUFS = -14
+# Prepared tracks cover the video in steps of this many seconds (45, 60,
+# 75, ...), so one per track serves every video of a duration
+BGM_LENGTH_STEP = 15
+
+# Tracks decoded, looped to length, normalized and attenuated once, keyed by
+# the track's content, so a replaced track file is prepared again
+bgm_cache = DiskCache("bgm", BGM_CACHE_MAX_BYTES, suffix=".wav")
+
 # Function to add subtitles with merged audio to the video
-def add_subtitles_with_audio(input_video, subtitle_file, audio_file, output_video):
+def add_subtitles_with_audio(
+    input_video, subtitle_file, audio_file, output_video, cancel=None, on_speed=None
+):
     ffmpeg_command = (
         f"ffmpeg -y "
         f"-i {input_video} "
@@ -24,22 +48,82 @@ def add_subtitles_with_audio(input_video, subtitle_file, audio_file, output_vide
     )
 
     try:
-        subprocess.run(ffmpeg_command, shell=True, check=True)
+        run_process(
+            ffmpeg_command, cancel=cancel, shell=True, check=True, on_speed=on_speed
+        )
         logger.info(f"Video with subtitles and audio saved as '{output_video}'")
     except subprocess.CalledProcessError as e:
         logger.error(f"Error adding subtitles to video '{input_video}': {e}")
 
-# Function to add background music
-def add_bg_music(final_video, bg_music_path, output_video):
+def media_duration(path) -> float:
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", path,
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return float(result.stdout.strip())
+
+
+def prepared_bgm(bg_music_path, duration, work_path, cancel=None) -> str:
+    """
+    The track as 16-bit PCM, looped to cover `duration` (rounded up to
+    BGM_LENGTH_STEP), loudness-normalized and attenuated to BGM_VOLUME,
+    ready to be mixed as is. Prepared in `work_path` on a cache miss; that
+    file is returned when the cache is disabled.
+    """
+    length = max(BGM_LENGTH_STEP, BGM_LENGTH_STEP * math.ceil(duration / BGM_LENGTH_STEP))
+    key = DiskCache.key(file_digest(bg_music_path), length, BGM_LOUDNESS_LUFS, BGM_VOLUME)
+    cached = bgm_cache.get(key)
+    if cached:
+        return cached
+
     ffmpeg_command = (
-        f"ffmpeg -i {final_video} -i {bg_music_path} "
-        f'-filter_complex "[1:a]aloop=loop=-1:size=2e+09,volume=0.04[a1];'
-        f'[0:a]volume=1.0[a0];[a0][a1]amix=inputs=2:duration=first" '
-        f"-c:v copy -c:a aac -b:a 192k {output_video}"
+        f"ffmpeg -y -stream_loop -1 -i {bg_music_path} -t {length} "
+        f'-af "loudnorm=I={BGM_LOUDNESS_LUFS}:TP=-1.5:LRA=11,volume={BGM_VOLUME}" '
+        f"-ar 44100 -ac 2 -c:a pcm_s16le {work_path}"
     )
-    
+    run_process(ffmpeg_command, cancel=cancel, shell=True, check=True)
+    logger.info(f"Prepared {length}s of background music from '{bg_music_path}'")
+    return bgm_cache.put_file(key, work_path) or work_path
+
+
+# Function to add background music; ffmpeg failures raise and the output
+# only appears once complete, so a re-run stage never takes a partial file
+# from an earlier attempt
+def add_bg_music(final_video, bg_music_path, output_video, cancel=None, on_speed=None):
+    work_path = f"{output_video}.bgm.wav"
     try:
-        subprocess.run(ffmpeg_command, shell=True, check=True)
-        logger.info(f"Video with background music saved as '{output_video}'")
+        bgm = prepared_bgm(bg_music_path, media_duration(final_video), work_path, cancel)
+        filter_complex = "[0:a]volume=1.0[a0];[a0][1:a]amix=inputs=2:duration=first"
+    except (JobCancelled, BudgetExceeded):
+        raise
     except Exception as e:
+        # Mix the raw track, looped and attenuated on the fly
+        logger.warning(f"Could not prepare background music, mixing the raw track: {e}")
+        bgm = bg_music_path
+        filter_complex = (
+            f"[1:a]aloop=loop=-1:size=2e+09,volume={BGM_VOLUME}[a1];"
+            f"[0:a]volume=1.0[a0];[a0][a1]amix=inputs=2:duration=first"
+        )
+
+    try:
+        with atomic_output(output_video) as partial:
+            ffmpeg_command = (
+                f"ffmpeg -y -i {final_video} -i {bgm} "
+                f'-filter_complex "{filter_complex}" '
+                f"-c:v copy -c:a aac -b:a 192k {partial}"
+            )
+            run_process(
+                ffmpeg_command, cancel=cancel, shell=True, check=True, on_speed=on_speed
+            )
+        logger.info(f"Video with background music saved as '{output_video}'")
+    except subprocess.CalledProcessError as e:
         logger.error(f"Error adding background music: {e}")
+        raise
+    finally:
+        if os.path.exists(work_path):
+            os.remove(work_path)
@@ -0,0 +1,193 @@
+import functools
+import io
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import imageio
+import numpy as np
+from moviepy.editor import ImageClip, TextClip
+
+from config.caches import CACHE_ROOT, SPRITE_CACHE_MAX_BYTES, SPRITE_MEMORY_MAX_BYTES
+from helpers.disk_cache import DiskCache, file_digest
+
+# Rasterized subtitle words (RGBA PNGs), shared by all jobs and render
+# workers, so ImageMagick runs once per distinct word and style
+sprite_cache = DiskCache("sprites", SPRITE_CACHE_MAX_BYTES, suffix=".png")
+
+# Word sizes by text, font, size and stroke; outside the sprite cache's
+# directory so eviction never touches it
+FONT_METRICS_PATH = os.path.join(CACHE_ROOT, "font_metrics.db")
+
+
+@functools.lru_cache(maxsize=32)
+def _font_id(font: str) -> str:
+    """Font name, plus the content hash of font files, so edited fonts re-render."""
+    if os.path.isfile(font):
+        return f"{os.path.basename(font)}:{file_digest(font)}"
+    return font
+
+
+class FontMetrics:
+    """
+    Rendered sizes of words, so layout (centering a sentence, sizing the
+    highlight box) never needs a render. Kept in SQLite, as several
+    processes render subtitles at once, with an in-process copy.
+    """
+
+    def __init__(self, path: str = FONT_METRICS_PATH):
+        self.path = path
+        self._sizes = {}
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        # Reopened in forked pool processes: connections can't be shared
+        if self._conn is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS metrics "
+                    "(key TEXT PRIMARY KEY, width INTEGER NOT NULL, height INTEGER NOT NULL)"
+                )
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[int, int]]:
+        if key not in self._sizes:
+            with self._lock:
+                row = self._db().execute(
+                    "SELECT width, height FROM metrics WHERE key = ?", (key,)
+                ).fetchone()
+            if not row:
+                return None
+            self._sizes[key] = tuple(row)
+        return self._sizes[key]
+
+    def set(self, key: str, size: Tuple[int, int]):
+        self._sizes[key] = size
+        with self._lock, self._db():
+            self._db().execute(
+                "INSERT OR REPLACE INTO metrics (key, width, height) VALUES (?, ?, ?)",
+                (key, *size),
+            )
+
+
+font_metrics = FontMetrics()
+
+
+def _size_key(text, font, fontsize, stroke_color, stroke_width) -> str:
+    return DiskCache.key(text, _font_id(font), fontsize, stroke_color, stroke_width)
+
+
+def _render(text, font, fontsize, color, stroke_color, stroke_width) -> np.ndarray:
+    """RGBA pixels of a word, rendered by ImageMagick (through TextClip)."""
+    options = {"stroke_color": stroke_color, "stroke_width": stroke_width} if stroke_color else {}
+    clip = TextClip(
+        text, font=font, fontsize=fontsize, color=color, method="label", **options
+    )
+    try:
+        alpha = np.round(clip.mask.get_frame(0) * 255).astype("uint8")
+        return np.dstack([clip.get_frame(0), alpha])
+    finally:
+        clip.close()
+
+
+class SpriteMemory:
+    """
+    Decoded sprites of this process, so a subtitle track reuses its words
+    without reading PNGs again. Bounded by the size of the pixels, as large
+    font sizes make single sprites weigh megabytes; the least recently used
+    are dropped beyond `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = SPRITE_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._sprites: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[np.ndarray]:
+        with self._lock:
+            pixels = self._sprites.get(key)
+            if pixels is not None:
+                self._sprites.move_to_end(key)
+            return pixels
+
+    def put(self, key: tuple, pixels: np.ndarray):
+        if pixels.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._sprites:
+                return
+            self._sprites[key] = pixels
+            self.bytes += pixels.nbytes
+            while self.bytes > self.max_bytes:
+                _, dropped = self._sprites.popitem(last=False)
+                self.bytes -= dropped.nbytes
+
+
+sprite_memory = SpriteMemory()
+
+
+def _sprite(*style) -> np.ndarray:
+    """Pixels of a word (see `_load_sprite`), from memory when recently used."""
+    pixels = sprite_memory.get(style)
+    if pixels is None:
+        pixels = _load_sprite(*style)
+        sprite_memory.put(style, pixels)
+    return pixels
+
+
+def _load_sprite(text, font, fontsize, color, stroke_color, stroke_width) -> np.ndarray:
+    key = DiskCache.key(
+        text, _font_id(font), fontsize, color, stroke_color, stroke_width
+    )
+    path = sprite_cache.get(key)
+    if path:
+        pixels = imageio.imread(path)
+    else:
+        pixels = _render(text, font, fontsize, color, stroke_color, stroke_width)
+        png = io.BytesIO()
+        imageio.imwrite(png, pixels, format="png")
+        sprite_cache.put_bytes(key, png.getvalue())
+    height, width = pixels.shape[:2]
+    font_metrics.set(
+        _size_key(text, font, fontsize, stroke_color, stroke_width), (width, height)
+    )
+    return pixels
+
+
+def word_clip(
+    text: str,
+    font: str,
+    fontsize: int,
+    color: str,
+    stroke_color: Optional[str] = None,
+    stroke_width: float = 0,
+) -> ImageClip:
+    """
+    The word as TextClip(method="label") would render it, from the sprite
+    cache: an ImageClip with the word's alpha channel as its mask.
+    """
+    return ImageClip(_sprite(text, font, fontsize, color, stroke_color, stroke_width))
+
+
+def word_size(
+    text: str,
+    font: str,
+    fontsize: int,
+    stroke_color: Optional[str] = None,
+    stroke_width: float = 0,
+) -> Tuple[int, int]:
+    """(width, height) of the rendered word; the colour doesn't change it."""
+    size = font_metrics.get(_size_key(text, font, fontsize, stroke_color, stroke_width))
+    if size:
+        return size
+    height, width = _sprite(text, font, fontsize, "white", stroke_color, stroke_width).shape[:2]
+    return width, height